@@ -0,0 +1,207 @@
+import os
+import math
+import shutil
+import tempfile
+import numpy as np
+import cv2
+from PIL import Image
+from rq import Worker
+from convert import plan_output
+
+# Admission control for the web API: every upload gets a cost (estimated secs of worker time) before it's queued.
+# The cost decides the queue it goes to, whether it has to be downgraded (or turned away) to fit JOB_BUDGET,
+# and the queue's backlog of costs decides whether it's accepted right now (QUEUE_SLO)
+
+# rough secs per unit of work, measured on a single core. Only ratios between jobs really matter
+DECODE_SECS_PER_PIXEL = 1e-8
+# drawing with the atlas costs by output pixel, PIL's draw.text() by char
+ATLAS_SECS_PER_PIXEL = 3e-8
+PIL_SECS_PER_CELL = 4e-5
+SAVE_SECS_PER_PIXEL = 6e-9
+# video frames also go through shared memory and get encoded
+VIDEO_CONVERT_SECS_PER_PIXEL = 7e-8
+VIDEO_ENCODE_SECS_PER_PIXEL = 6e-8
+# ascii videos only map frames to chars
+MAP_SECS_PER_PIXEL = 1e-9
+# every job pays this no matter how small (fetching the input, uploading the output...)
+JOB_OVERHEAD_SECS = 0.2
+
+# jobs too big for their own queue go here, so they don't hold up the small ones
+BULK_QUEUE = "bulk"
+
+# every queue's backlog (costs of its jobs that are queued or running) is kept in a counter,
+# so checking it is a single read no matter how many jobs there are (see add_backlog and queue_wait).
+# Every job's cost (and queue) is kept too, so it's taken off exactly once however the job ends
+BACKLOG_KEY = "admission:backlog:"
+JOB_COST_KEY = "admission:cost:"
+
+class UploadInfo:
+    """What admission control needs to know about an uploaded file (see probe_upload)
+
+    Properties
+    ----------
+    kind : string
+        - "image" or "video"
+    width : int
+        - width of the image (or video frames) in pixels
+    height : int
+        - height of the image (or video frames) in pixels
+    frames : int
+        - number of frames of a video, 1 for images
+    fps : float
+        - frame rate of a video, 0 for images
+    """
+    def __init__(self, kind, width, height, frames=1, fps=0):
+        self.kind = kind
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.fps = fps
+
+def probe_upload(stream, file_ext, video_exts, path=None):
+    """Returns the UploadInfo of an uploaded file, or None if it can't be read. Leaves stream at its start.
+    Images only have their header read (unless PIL doesn't know the format). OpenCV only opens videos from a file,
+    so they're read from path, where the upload was saved (see storage.local_path).
+    Without one, they're copied to a temporary file first"""
+    try:
+        if file_ext in video_exts:
+            if path is not None:
+                return _probe_video_file(path)
+            stream.seek(0)
+            return _probe_video(stream, file_ext)
+        return _probe_image(stream)
+    finally:
+        stream.seek(0)
+
+def _probe_image(stream):
+    try:
+        with Image.open(stream) as header:
+            width, height = header.size
+        return UploadInfo("image", width, height)
+    except Exception:
+        pass
+    # formats only OpenCV reads (.exr, .hdr...) have to be decoded
+    stream.seek(0)
+    img = cv2.imdecode(np.frombuffer(stream.read(), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    return UploadInfo("image", img.shape[1], img.shape[0])
+
+def _probe_video(stream, file_ext):
+    handle, path = tempfile.mkstemp(suffix=file_ext)
+    try:
+        with os.fdopen(handle, "wb") as video_file:
+            shutil.copyfileobj(stream, video_file, 1024 * 1024)
+        return _probe_video_file(path)
+    finally:
+        os.remove(path)
+
+def _probe_video_file(path):
+    capture = cv2.VideoCapture(path)
+    try:
+        frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+    if frames <= 0 or width <= 0 or height <= 0:
+        return None
+    return UploadInfo("video", width, height, frames, fps)
+
+def estimate_cost(info, params, renderer="pil", processes=1):
+    """Returns the estimated secs a worker spends on a job
+
+    Parameters
+    ---------
+    info : UploadInfo
+        - the uploaded file
+    params : dict
+        - conversion parameters, see cache.normalize_params
+    renderer : string
+        - renderer the workers draw with, see convert.RENDERERS
+    processes : int
+        - processes a video job converts frames on. Encoding runs alongside, so the slower of the two counts
+    """
+    plan = plan_output(info.height, info.width, params["image_reducer"], params["fontSize"], params["spacing"], params["maxsize"])
+    input_pixels = info.width * info.height
+    output_pixels = plan.size[0] * plan.size[1]
+    cells = plan.shape[0] * plan.shape[1]
+    if renderer == "atlas":
+        # outputs smaller than a char are drawn bigger and shrunk (see convert.plan_output)
+        draw = ATLAS_SECS_PER_PIXEL * plan.render_size[0] * plan.render_size[1]
+    else:
+        draw = PIL_SECS_PER_CELL * cells
+    if info.kind == "image":
+        return JOB_OVERHEAD_SECS + DECODE_SECS_PER_PIXEL * input_pixels + draw + SAVE_SECS_PER_PIXEL * output_pixels
+    # every frame gets decoded (kept or not), only every frame_frequency-th one converted
+    frames_included = max(1, info.frames // max(1, params["frame_frequency"] or 1))
+    decode = DECODE_SECS_PER_PIXEL * input_pixels * info.frames
+    if params.get("output_format") == "ascii":
+        return JOB_OVERHEAD_SECS + decode + MAP_SECS_PER_PIXEL * input_pixels * frames_included
+    convert = (draw + VIDEO_CONVERT_SECS_PER_PIXEL * output_pixels) * frames_included / max(1, processes)
+    encode = VIDEO_ENCODE_SECS_PER_PIXEL * output_pixels * frames_included
+    return JOB_OVERHEAD_SECS + decode + max(convert, encode)
+
+def fit_budget(info, params, budget, renderer="pil", processes=1, downgrade=True):
+    """Makes a job fit in budget (estimated secs, see estimate_cost)
+
+    Returns (params, cost). If the job is too costly, params is a downgraded copy: videos keep fewer frames
+    (higher frame_frequency) and everything gets fewer chars (lower image_reducer), a step at a time until it fits.
+    params is None if it can't fit (or downgrade is False)
+    """
+    cost = estimate_cost(info, params, renderer, processes)
+    if cost <= budget:
+        return params, cost
+    if not downgrade:
+        return None, cost
+    params = dict(params)
+    step = 0
+    while cost > budget:
+        # videos alternate between dropping frames and chars, so neither gets all the loss
+        frames_left = info.kind == "video" and info.frames // max(1, params["frame_frequency"] or 1) > 1
+        if frames_left and (step % 2 == 0 or params["image_reducer"] <= 1):
+            params["frame_frequency"] = (params["frame_frequency"] or 1) * 2
+        elif params["image_reducer"] > 1:
+            params["image_reducer"] = max(1, int(params["image_reducer"] * 0.7))
+        else:
+            return None, cost
+        cost = estimate_cost(info, params, renderer, processes)
+        step += 1
+    return params, cost
+
+def pick_queue(info, cost, bulk_cost):
+    """Returns the name of the queue a job goes to: "image" or "video", or BULK_QUEUE if it costs more than bulk_cost"""
+    if cost > bulk_cost:
+        return BULK_QUEUE
+    return info.kind
+
+def add_backlog(redis, queue_name, job_id, cost):
+    """Adds the cost of a job to the backlog of its queue. Has to happen before the job is queued,
+    so a worker can't finish it (and take it off, see release_backlog) first"""
+    pipe = redis.pipeline()
+    pipe.hset(JOB_COST_KEY + job_id, mapping={"queue": queue_name, "cost": cost})
+    pipe.incrbyfloat(BACKLOG_KEY + queue_name, cost)
+    pipe.execute()
+
+def release_backlog(redis, job_id):
+    """Takes the cost of a job off the backlog of its queue, once it's finished, failed or been canceled.
+    Only the first call for a job does anything, so every place a job can end may call it"""
+    key = JOB_COST_KEY + job_id
+    entry = redis.hgetall(key)
+    # whoever deletes the entry is the one who releases it
+    if len(entry) == 0 or redis.delete(key) == 0:
+        return
+    queue_name = entry[b"queue"].decode("utf-8")
+    redis.incrbyfloat(BACKLOG_KEY + queue_name, -float(entry[b"cost"]))
+
+def queue_wait(queue):
+    """Returns the estimated secs until a job added to queue now would start:
+    the backlog of the queue (see add_backlog), which includes jobs already running, over the workers listening to it"""
+    backlog = max(0, float(queue.connection.get(BACKLOG_KEY + queue.name) or 0))
+    workers = Worker.count(connection=queue.connection, queue=queue)
+    return backlog / max(1, workers)
+
+def retry_after(wait, slo):
+    """Returns the secs to wait before the backlog of a queue is back within its slo (see queue_wait), at least 1"""
+    return max(1, int(math.ceil(wait - slo)))
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory, Response, render_template, json
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, render_template, json
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
@@ -6,15 +6,20 @@ from werkzeug.exceptions import RequestEntityTooLarge
 from redis import Redis
 from rq import Queue
 from rq.job import Job
+from rq.exceptions import NoSuchJobError
 from rq.command import send_stop_job_command
 
-from firebase_admin import credentials, initialize_app, storage
-
 from uuid import uuid4
 import os
-import time
+from queue import Empty
 
 from jobs import *
+from cache import normalize_params, result_cache_key, DiskResultCache, RedisResultCache
+from admission import probe_upload, fit_budget, pick_queue, queue_wait, retry_after, add_backlog, release_backlog, BULK_QUEUE
+from progress import ProgressHub, progress_message
+from storage import get_storage
+from strip_writer import strip_output_path
+from ascii_video import ascii_video_path
 
 app = Flask(__name__)
 app.config.from_object("config.Config")
@@ -23,31 +28,40 @@ cors = CORS(app, origins=config["CORS"])
 
 if config["REDIS_URL"] != "unavailable":
     redis = Redis(config["REDIS_URL"])
+    # jobs go to the default queue without admission control, otherwise to the queue picked for them (see admission.py)
     queue = Queue(connection=redis)
+    queues = {name: Queue(name, connection=redis) for name in ["image", "video", BULK_QUEUE]}
+    progress_hub = ProgressHub(redis)
 
 TEMP = config["TEMP"]
 OUTPUT= config["OUTPUT"]
 IMG_EXT = config["IMG_EXT"]
 VID_EXT = config["VID_EXT"]
-PROGRESS_RATE = config["PROGRESS_RATE"]
+PROGRESS_HEARTBEAT = config["PROGRESS_HEARTBEAT"]
 CONVERT_PROCESSES = config["CONVERT_PROCESSES"]
 CONVERT_THREADS = config["CONVERT_THREADS"]
+RENDERER = config["RENDERER"]
+SAMPLING = config["SAMPLING"]
+FONT_PATH = config["FONT_PATH"]
+VIDEO_OUTPUTS = ["video", "ascii"]
+
+ADMISSION = config["ADMISSION"]
+JOB_BUDGET = config["JOB_BUDGET"]
+DOWNGRADE_JOBS = config["DOWNGRADE_JOBS"]
+BULK_COST = config["BULK_COST"]
+QUEUE_SLO = config["QUEUE_SLO"]
 
 FAILURE_TTL = config["FAILURE_TTL"]
 RESULT_TTL = config["RESULT_TTL"]
 JOB_TIMEOUT = config["JOB_TIMEOUT"]
 
-path_to_key = os.path.join(os.getcwd(), "key.json")
-if not os.path.exists(path_to_key):
-    key_json_file = open(path_to_key, "w")
-    json.dump(config["FIREBASE_KEY"], key_json_file)
-    key_json_file.close()
+storage = get_storage(config["STORAGE"], config["STORAGE_DIR"], config["FIREBASE_KEY"], config["FIREBASE_BUCKET"])
 
-cred = credentials.Certificate(path_to_key)
-default_app = initialize_app(cred, {
-    "storageBucket": config["FIREBASE_BUCKET"]
-})
-bucket = storage.bucket()
+result_cache = None
+if config["RESULT_CACHE"] == "disk":
+    result_cache = DiskResultCache(config["RESULT_CACHE_DIR"], config["RESULT_CACHE_MAX_BYTES"])
+elif config["RESULT_CACHE"] == "redis" and config["REDIS_URL"] != "unavailable":
+    result_cache = RedisResultCache(redis, storage, config["RESULT_CACHE_MAX_BYTES"])
 
 @app.route("/", methods=["GET"])
 def index():
@@ -65,78 +79,153 @@ def convert():
         data = request.form
         fileUpload = request.files["fileUpload"]
         filename, file_ext = os.path.splitext(fileUpload.filename)
-        
-        local_temp = os.path.join(os.getcwd(), TEMP)
-        local_output = os.path.join(os.getcwd(), TEMP)
-        if not os.path.isdir(local_temp) : os.mkdir(local_temp)
-        if not os.path.isdir(local_output) : os.mkdir(local_output)
 
         # filename will consist of random hex and file_ext
         filename = secure_filename(uuid4().hex + file_ext)
         temp_path = os.path.join(TEMP, filename)
-        local_temp_path = os.path.join(os.getcwd(), temp_path)
-        fileUpload.save(local_temp_path)
     except RequestEntityTooLarge as e:
         print ("- File too large!")
         return jsonify("large_file"), 413
 
-    if file_ext in IMG_EXT:
+    if file_ext not in IMG_EXT and file_ext not in VID_EXT:
+        return jsonify("bad_format"), 415
+
+    maxsize = None if data["maxWidth"] == "" or data["maxHeight"] == "" else (int(data["maxWidth"]), int(data["maxHeight"]))
+    # ascii videos are played by the browser itself (see static/main.js), so nothing gets drawn or encoded here.
+    # Their char indices are single bytes though
+    video_output = data.get("videoOutput", "video")
+    if video_output not in VIDEO_OUTPUTS or len(data["characters"]) > 256:
+        video_output = "video"
+    params = normalize_params(file_ext,
+        image_reducer = int(data["imageReduction"]),
+        fontSize = int(data["fontSize"]),
+        spacing = float(data["spacing"]),
+        maxsize = maxsize,
+        chars = data["characters"],
+        frame_frequency = int(data["frameFrequency"]) if file_ext in VID_EXT else None,
+        font_path = FONT_PATH,
+        output_format = video_output if file_ext in VID_EXT else None,
+        sampling = SAMPLING,
+        renderer = RENDERER
+    )
+    saved = False
+    def drop_upload(*response):
+        # for answers that don't queue a job, an upload saved early on has to go
+        if saved : storage.delete(temp_path)
+        return response
+
+    job_queue = queue
+    cost = None
+    if ADMISSION == "on":
+        probe_path = None
+        if file_ext in VID_EXT:
+            # OpenCV only reads videos from a file, so the upload is saved first and read where it was saved
+            # (if storage is local, otherwise probe_upload copies it to a temporary file)
+            try:
+                storage.save_stream(fileUpload.stream, temp_path)
+                saved = True
+            except Exception as e:
+                print (e)
+                return jsonify("firebase_error"), 503
+            probe_path = storage.local_path(temp_path)
+        info = probe_upload(fileUpload.stream, file_ext, VID_EXT, probe_path)
+        if info is None:
+            return drop_upload(jsonify("bad_format"), 415)
+        admitted, cost = fit_budget(info, params, JOB_BUDGET, RENDERER, CONVERT_PROCESSES, DOWNGRADE_JOBS == "on")
+        if admitted is None:
+            print ("- Too costly! Estimated %.2f secs" % cost)
+            return drop_upload(jsonify("too_costly"), 422)
+        if admitted != params:
+            print ("- Downgraded to image reduction", admitted["image_reducer"], "frame frequency", admitted["frame_frequency"])
+        params = admitted
+
+    # ascii videos are saved (and served) as .ascv, so their job is named after that (see jobs._video_job).
+    # The job id is what the browser asks for the output by, and what the output is cached by
+    job_id = ascii_video_path(filename) if params["output_format"] == "ascii" else filename
+
+    # keyed by the settings the job actually runs with, so a downgraded result never stands in for the real thing
+    cache_key = None
+    if result_cache is not None:
+        cache_key = result_cache_key(fileUpload.stream, params)
+        fileUpload.stream.seek(0)
+        # same file with the same settings has been converted before, so skip the queue entirely
+        local_output = os.path.join(os.getcwd(), OUTPUT)
+        if not os.path.isdir(local_output) : os.mkdir(local_output)
+        if result_cache.get(cache_key, os.path.join(local_output, job_id)):
+            print ("- Result cache hit", cache_key)
+            return drop_upload(jsonify(job_id), 200)
+
+    if ADMISSION == "on":
+        job_queue = queues[pick_queue(info, cost, BULK_COST)]
+        # turn it away now rather than let it (and everything behind it) wait longer than promised
+        wait = queue_wait(job_queue)
+        if wait > QUEUE_SLO:
+            print ("- Queue", job_queue.name, "is %.2f secs behind" % wait)
+            return drop_upload(jsonify("busy"), 429, {"Retry-After": str(retry_after(wait, QUEUE_SLO))})
+
+    if not saved:
         try:
-            blob = bucket.blob(temp_path)
-            blob.upload_from_filename(local_temp_path)
-        except:
-            os.remove(local_temp_path)
+            # straight from the request into storage, in chunks
+            storage.save_stream(fileUpload.stream, temp_path)
+        except Exception as e:
+            print (e)
             return jsonify("firebase_error"), 503
-        job = queue.enqueue(start_image_job,
-            job_id = filename, failure_ttl = 60, job_timeout = 300, result_ttl = 60,
+
+    if cost is not None:
+        # the worker takes it off again once the job ends (see worker.py)
+        add_backlog(redis, job_queue.name, job_id, cost)
+    if file_ext in IMG_EXT:
+        job_queue.enqueue(start_image_job,
+            job_id = job_id, failure_ttl = 60, job_timeout = 300, result_ttl = 60,
+            meta = {"cache_key": cache_key, "cost": cost},
             filename = filename,
-            image_reducer = int(data["imageReduction"]),
-            fontSize = int(data["fontSize"]),
-            spacing = float(data["spacing"]),
-            maxsize = None if data["maxWidth"] == "" or data["maxHeight"] == "" else (int(data["maxWidth"]), int(data["maxHeight"])),
-            chars = data["characters"],
+            image_reducer = params["image_reducer"],
+            fontSize = params["fontSize"],
+            spacing = params["spacing"],
+            maxsize = maxsize,
+            chars = params["chars"],
             logs = True,
-            threads = CONVERT_THREADS
+            threads = CONVERT_THREADS,
+            renderer = params["renderer"],
+            font_path = FONT_PATH,
+            sampling = params["sampling"]
         )
-        os.remove(local_temp_path)
-        return jsonify(filename), 200
-    elif file_ext in VID_EXT:
-        try:
-            blob = bucket.blob(temp_path)
-            blob.upload_from_filename(local_temp_path)
-        except:
-            return jsonify("firebase_error"), 503
-        job = queue.enqueue(start_video_job,
-            job_id = filename, failure_ttl = 60, job_timeout = 300, result_ttl = 60,
+    else:
+        job_queue.enqueue(start_video_job,
+            job_id = job_id, failure_ttl = 60, job_timeout = 300, result_ttl = 60,
+            meta = {"cache_key": cache_key, "cost": cost},
             filename = filename,
-            frame_frequency=int(data["frameFrequency"]),
-            image_reducer = int(data["imageReduction"]),
-            fontSize = int(data["fontSize"]),
-            spacing = float(data["spacing"]),
-            maxsize = None if data["maxWidth"] == "" or data["maxHeight"] == "" else (int(data["maxWidth"]), int(data["maxHeight"])),
-            chars = data["characters"],
+            frame_frequency = params["frame_frequency"],
+            image_reducer = params["image_reducer"],
+            fontSize = params["fontSize"],
+            spacing = params["spacing"],
+            maxsize = maxsize,
+            chars = params["chars"],
             logs = True,
-            processes = CONVERT_PROCESSES
+            processes = CONVERT_PROCESSES,
+            renderer = params["renderer"],
+            font_path = FONT_PATH,
+            output_format = params["output_format"],
+            sampling = params["sampling"]
         )
-        os.remove(local_temp_path)
-        return jsonify(filename), 200
-    else:
-        os.remove(local_temp_path)
-        return jsonify("bad_format"), 415
+    return jsonify(job_id), 200
 
 def cancel(job_id):
     job = Job.fetch(job_id, connection=redis)
-    temp_blob = bucket.blob(os.path.join(TEMP, job_id))
-    output_blob = bucket.blob(os.path.join(OUTPUT, job_id))
-    if temp_blob.exists() : temp_blob.delete()
-    if output_blob.exists() : output_blob.delete()
+    # the upload keeps its own extension, even if the output doesn't (ascii videos)
+    storage.delete(os.path.join(TEMP, job.kwargs.get("filename", job_id)))
+    storage.delete(os.path.join(OUTPUT, job_id))
+    # huge images get saved as .png (see jobs._image_job)
+    storage.delete(strip_output_path(os.path.join(OUTPUT, job_id)))
     try:
         if job.get_status() == "started":
             send_stop_job_command(redis, job_id)
             print ("- Stopped executing job", job_id)
             return True
         elif job.get_status() == "queued":
-            queue.remove(job_id)
+            Queue(job.origin, connection=redis).remove(job_id)
+            # never gets to a worker, so it's taken off the backlog here
+            release_backlog(redis, job_id)
             print ("- Removed job from queue", job_id)
             return True
         else:
@@ -150,22 +239,44 @@ def get_progress():
     print ("- Getting progress")
     # job_id and filename are the same thing
     job_id = secure_filename(request.get_json())
-    job = Job.fetch(job_id, connection=redis)
+    try:
+        job = Job.fetch(job_id, connection=redis)
+    except NoSuchJobError:
+        # results served from the cache never get a job
+        if os.path.exists(os.path.join(OUTPUT, job_id)):
+            message = json.dumps({"status": "finished", "progress": 100, "result": job_id})
+            return Response("data:" + message + "\n\n", mimetype="text/event-stream")
+        return jsonify("no_job"), 404
+    def job_message():
+        job.refresh()
+        return progress_message(job.meta.get("uploading", job.get_status()), job.meta.get("progress", 0), str(job.result))
+
     def progress_stream():
+        # jobs publish their progress, so we only send what they publish (see ProgressHub)
+        # listen before looking at the job, so no event can slip in between
+        listener = progress_hub.listen(job_id)
+        status = None
         try:
+            message = job_message()
+            last_message = None
             while True:
-                job.refresh()
-                message = json.dumps({
-                    "status": job.meta.get("uploading", job.get_status()),
-                    "progress": job.meta.get("progress", 0),
-                    "result": str(job.result)
-                })
-                yield "data:" + message + "\n\n"
-                time.sleep(PROGRESS_RATE)
+                if message != last_message:
+                    yield "data:" + message + "\n\n"
+                    last_message = message
+                    status = json.loads(message)["status"]
+                try:
+                    message = listener.get(timeout=PROGRESS_HEARTBEAT)
+                except Empty:
+                    # nothing published for a while. Check the job itself, in case it failed or an event got lost
+                    message = job_message()
+                    if message == last_message:
+                        yield ": heartbeat\n\n"
         except GeneratorExit:
-            if job.get_status() != "finished":
+            if status != "finished":
                 print ("- Client disconnected from progress stream")
                 cancel(job_id)
+        finally:
+            progress_hub.unlisten(job_id, listener)
                 
     return Response(progress_stream(), mimetype="text/event-stream")
 
@@ -186,11 +297,58 @@ def get_output():
     try:
         filename = secure_filename(request.get_json())
         file_path = os.path.join(OUTPUT, filename)
-        blob = bucket.blob(file_path)
-        blob.download_to_filename(file_path)
-        blob.delete()
+        # outputs from the result cache are already here
+        if os.path.exists(file_path):
+            print ("- Got output", file_path)
+            return send_from_directory(os.path.join(os.getcwd(), OUTPUT), filename, as_attachment=True), 200
+
+        cache_key = None
+        if result_cache is not None:
+            # outputs saved under a name of their own (huge images saved as .png, see jobs._image_job)
+            # have no job by that name, so they're never cached
+            try:
+                cache_key = Job.fetch(filename, connection=redis).meta.get("cache_key")
+            except NoSuchJobError:
+                pass
+
+        shared_path = storage.local_path(file_path)
+        if shared_path is not None:
+            # shared volume, so send the worker's file as is
+            if cache_key is not None : cache_output(cache_key, shared_path)
+            response = send_file(os.path.abspath(shared_path), as_attachment=True)
+            # send_file already opened it, so it can go
+            storage.delete(file_path)
+        elif cache_key is not None:
+            # the cache needs a local copy anyway
+            local_output = os.path.join(os.getcwd(), OUTPUT)
+            if not os.path.isdir(local_output) : os.mkdir(local_output)
+            storage.download(file_path, file_path)
+            storage.delete(file_path)
+            cache_output(cache_key, file_path)
+            response = send_from_directory(os.path.join(os.getcwd(), OUTPUT), filename, as_attachment=True)
+        else:
+            # stream from storage to the browser without keeping a copy here
+            def output_stream():
+                for chunk in storage.iter_chunks(file_path):
+                    yield chunk
+                storage.delete(file_path)
+            response = Response(output_stream(), mimetype="application/octet-stream", headers={
+                "Content-Disposition": "attachment; filename=" + filename
+            })
         print ("- Got output", file_path)
-        return send_from_directory(OUTPUT, filename, as_attachment=True), 200
+        return response, 200
     except Exception as e:
         print (e)
-        return jsonify("firebase_error"), 503
\ No newline at end of file
+        return jsonify("firebase_error"), 503
+
+def cache_output(cache_key, file_path):
+    try:
+        result_cache.put(cache_key, file_path)
+    except Exception as e:
+        print ("- Could not cache output", e)
+
+@app.route("/api/cachestats", methods=["GET"])
+def cache_stats():
+    if result_cache is None:
+        return jsonify("cache_disabled"), 404
+    return jsonify(result_cache.stats()), 200
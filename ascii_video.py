@@ -0,0 +1,109 @@
+import os
+import json
+import struct
+import zlib
+import numpy as np
+
+# ASCII videos (.ascv) store the char index matrix of every frame instead of drawn frames, for players that draw the chars themselves
+# (like the one in static/main.js). Layout:
+#   - MAGIC, then the header length as a little endian uint32, then the header (JSON, UTF-8):
+#     {"version", "chars", "fontSize", "spacing", "fps", "rows", "cols", "width", "height"}
+#     width and height are the size the video should be shown at, in pixels (what a .mp4 of it would have been)
+#   - then every frame, compressed as one zlib stream. A frame is rows * cols uint8 bytes (row by row),
+#     each one the difference (mod 256) between the cell's char index and its index in the previous frame.
+#     The frame before the first one is all 0s. Cells that didn't change are 0, which compresses to almost nothing
+ASCII_VIDEO_EXT = ".ascv"
+MAGIC = b"ASCV"
+VERSION = 1
+
+def ascii_video_path(path):
+    """Returns path with the ASCII video extension, which is what an ASCII video is saved as, whatever it was made from"""
+    return os.path.splitext(path)[0] + ASCII_VIDEO_EXT
+
+class AsciiVideoWriter:
+    """Writes char index matrices to an ASCII video (see the layout above). Works like an imageio writer,
+    so it can take the place of one (see convert.FrameEncoder)
+
+    Properties
+    ----------
+    frames : int
+        - number of frames written so far
+
+    Methods
+    --------
+    append_data
+        - writes the next frame (2D array of char indices)
+    close
+        - writes what's left of the compressed stream and closes the file
+    """
+    def __init__(self, path, chars=" .*:+%S0#@", fontSize=10, spacing=1.1, fps=24, size=None, level=6):
+        if len(chars) > 256:
+            raise ValueError("ASCII videos support up to 256 chars")
+        self.path = path
+        self.chars = chars
+        self.fontSize = fontSize
+        self.spacing = spacing
+        self.fps = fps
+        self.size = size
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._compressor = zlib.compressobj(level)
+        self._previous = None
+
+    def _write_header(self, shape):
+        rows, cols = shape
+        # without a size, show it at the size the chars were drawn at on the server
+        pitch = self.fontSize * 0.8 * self.spacing
+        width, height = self.size if self.size is not None else (int(cols * pitch), int(rows * pitch))
+        header = json.dumps({
+            "version": VERSION, "chars": self.chars, "fontSize": self.fontSize, "spacing": self.spacing,
+            "fps": self.fps, "rows": rows, "cols": cols, "width": width, "height": height
+        }).encode("utf-8")
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def append_data(self, indices):
+        indices = np.asarray(indices, dtype=np.uint8)
+        if self._previous is None:
+            self._write_header(indices.shape)
+            self._previous = np.zeros(indices.shape, dtype=np.uint8)
+        elif indices.shape != self._previous.shape:
+            raise ValueError("frame has shape %s, expected %s" % (indices.shape, self._previous.shape))
+        # uint8 arithmetic wraps around, which is exactly the mod 256 difference
+        self._file.write(self._compressor.compress((indices - self._previous).tobytes()))
+        self._previous = indices.copy()
+        self.frames += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._previous is None:
+            # no frames at all, but it should still be readable
+            self._write_header((0, 0))
+        self._file.write(self._compressor.flush())
+        self._file.close()
+
+def read_ascii_video(path):
+    """Returns the header of an ASCII video and a generator of its frames (2D uint8 arrays of char indices)"""
+    with open(path, "rb") as video_file:
+        data = video_file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not an ASCII video")
+    header_length = struct.unpack("<I", data[len(MAGIC):len(MAGIC) + 4])[0]
+    body_start = len(MAGIC) + 4 + header_length
+    header = json.loads(data[len(MAGIC) + 4:body_start].decode("utf-8"))
+
+    def frames():
+        frame_size = header["rows"] * header["cols"]
+        decompressor = zlib.decompressobj()
+        buffered = b""
+        indices = np.zeros((header["rows"], header["cols"]), dtype=np.uint8)
+        for start in range(body_start, len(data), 1024 * 1024):
+            buffered += decompressor.decompress(data[start:start + 1024 * 1024])
+            offset = 0
+            while frame_size > 0 and len(buffered) - offset >= frame_size:
+                delta = np.frombuffer(buffered, dtype=np.uint8, count=frame_size, offset=offset)
+                indices = indices + delta.reshape(indices.shape)
+                offset += frame_size
+                yield indices
+            buffered = buffered[offset:]
+    return header, frames()
@@ -0,0 +1,281 @@
+"""Benchmarks for the conversion engine
+
+Generates synthetic images and videos, times the image path over a grid of settings, huge images drawn in strips
+over a number of threads, and every video stage (decode, convert, encode) separately, and writes the results to JSON. compare checks a run against a baseline
+
+    python benchmarks/bench.py run [-o results.json] [--quick]
+    python benchmarks/bench.py compare baseline.json results.json [--threshold 0.1]
+"""
+import numpy as np
+import cv2
+import PIL
+import imageio
+import os
+import sys
+import time
+import json
+import platform
+import argparse
+import itertools
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import convert
+
+RESOLUTIONS = {
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080)
+}
+CHARSETS = {
+    "default": " .*:+%S0#@",
+    "long": " .'`^\",:;Il!i><~+_-?][}{1)(|\\/tfjrxnuvczXYUJCLQ0OZmwqpdbkhao*#MW&8%B@$"
+}
+IMAGE_REDUCERS = [5, 10, 25]
+FONT_SIZES = [10, 20]
+RENDERERS = convert.RENDERERS
+# images drawn in strips (see convert.render_strips) are the only ones threads still matter for
+TILED_THREADS = [1, 4]
+TILED_RESOLUTIONS = ["1080p"]
+# 1080p at these settings is a 10 megapixel output
+TILED_IMAGE_REDUCER = 25
+TILED_FONT_SIZE = 10
+
+# smaller grid for quick checks while developing
+QUICK = {
+    "resolutions": ["480p", "720p"],
+    "image_reducers": [10],
+    "font_sizes": [10],
+    "charsets": ["default"],
+    "video_resolutions": ["480p"],
+    "video_frames": 30
+}
+
+def synthetic_image(width, height, seed=0):
+    """Returns a grayscale image with gradients, shapes and noise, so every char of a charset gets used"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    img = 127 + 60 * np.sin(x * 12 + y * 5) + 50 * np.cos(y * 9 - x * 3)
+    for i in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(img, center, int(rng.integers(height // 20, height // 5)), float(rng.integers(0, 256)), -1)
+    img += rng.normal(0, 12, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def synthetic_video(path, width, height, frames, fps=30):
+    """Writes a video of a synthetic image that slowly pans, with a moving square on top"""
+    base = synthetic_image(width * 2, height, seed=1)
+    writer = imageio.get_writer(path, fps=fps, quality=None, bitrate=4000000, macro_block_size=1)
+    for i in range(frames):
+        offset = int(i * width / max(frames, 1))
+        frame = base[:, offset:offset + width].copy()
+        cv2.rectangle(frame, (i * 7 % width, height // 3), (i * 7 % width + height // 4, height // 3 + height // 4), 255, -1)
+        writer.append_data(cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB))
+    writer.close()
+
+def time_runs(function, repeat):
+    """Runs function repeat times, returns the wall time of every run"""
+    runs = []
+    for i in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start_time)
+    return runs
+
+def summarize(runs, **extra):
+    result = {"median": statistics.median(runs), "min": min(runs), "runs": runs}
+    result.update(extra)
+    return result
+
+def bench_images(grid, repeat, logs=True):
+    results = {}
+    cases = itertools.product(
+        grid["resolutions"], grid["image_reducers"], grid["font_sizes"], grid["charsets"], RENDERERS
+    )
+    for resolution, image_reducer, fontSize, charset, renderer in cases:
+        img = synthetic_image(*RESOLUTIONS[resolution])
+        chars = CHARSETS[charset]
+        name = "image/%s/i%d/z%d/%s/%s" % (resolution, image_reducer, fontSize, charset, renderer)
+        # first run loads fonts and atlases, which later runs get from the cache
+        convert.convert_image(img, image_reducer, fontSize, chars=chars, renderer=renderer)
+        runs = time_runs(lambda: convert.convert_image(
+            img, image_reducer, fontSize, chars=chars, renderer=renderer
+        ), repeat)
+        results[name] = summarize(runs, pixels=img.size)
+        if logs : print ("%-50s %.4f secs" % (name, results[name]["median"]))
+    return results
+
+def bench_tiled(grid, repeat, logs=True):
+    """Times images drawn and saved (as .png) a strip at a time, over the number of threads drawing strips"""
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for resolution in grid["tiled_resolutions"]:
+            image_path = os.path.join(folder, resolution + ".png")
+            cv2.imwrite(image_path, synthetic_image(*RESOLUTIONS[resolution]))
+            output_path = os.path.join(folder, "output.png")
+            for threads, renderer in itertools.product(grid["tiled_threads"], RENDERERS):
+                name = "tiled/%s/t%d/%s" % (resolution, threads, renderer)
+                def convert_tiled():
+                    return convert.convert_image_path_and_save(
+                        image_path, output_path, override=True, image_reducer=TILED_IMAGE_REDUCER,
+                        fontSize=TILED_FONT_SIZE, threads=threads, renderer=renderer, tiled=True
+                    )
+                convert_tiled()
+                runs = time_runs(convert_tiled, repeat)
+                results[name] = summarize(runs, output_bytes=os.path.getsize(output_path))
+                if logs : print ("%-50s %.4f secs" % (name, results[name]["median"]))
+    return results
+
+def bench_video(resolution, frames, renderer, repeat, image_reducer=10, fontSize=10, frame_frequency=1, logs=True):
+    """Times decode, convert and encode one after another on a single process, then the whole pipeline"""
+    results = {}
+    width, height = RESOLUTIONS[resolution]
+    with tempfile.TemporaryDirectory() as folder:
+        video_path = os.path.join(folder, "input.mp4")
+        output_path = os.path.join(folder, "output.mp4")
+        synthetic_video(video_path, width, height, frames)
+        prefix = "video/%s/%s/" % (resolution, renderer)
+
+        def decode():
+            capture = cv2.VideoCapture(video_path)
+            decoded = []
+            frame_number = 0
+            while True:
+                success, frame = capture.read()
+                if not success:
+                    break
+                if frame_number % frame_frequency == 0:
+                    decoded.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+                frame_number += 1
+            capture.release()
+            return decoded
+        decoded = decode()
+        runs = time_runs(decode, repeat)
+        results[prefix + "decode"] = summarize(runs, frames=len(decoded))
+
+        converted = []
+        def convert_frames():
+            converted.clear()
+            for frame in decoded:
+                converted.append(np.asarray(convert.convert_image(frame, image_reducer, fontSize, renderer=renderer)))
+        convert_frames()
+        runs = time_runs(convert_frames, repeat)
+        results[prefix + "convert"] = summarize(runs, frames=len(decoded))
+
+        def encode():
+            writer = imageio.get_writer(output_path, fps=30, quality=None, bitrate=4000000)
+            for frame in converted:
+                writer.append_data(frame)
+            writer.close()
+        runs = time_runs(encode, repeat)
+        results[prefix + "encode"] = summarize(runs, frames=len(converted))
+
+        def pipeline():
+            summary = convert.convert_video_path_and_save(
+                video_path, output_path, frame_frequency=frame_frequency, image_reducer=image_reducer,
+                fontSize=fontSize, renderer=renderer
+            )
+            os.remove(summary["output_path"])
+        runs = time_runs(pipeline, repeat)
+        results[prefix + "pipeline"] = summarize(runs, frames=len(decoded))
+
+    if logs:
+        for name in results:
+            print ("%-50s %.4f secs" % (name, results[name]["median"]))
+    return results
+
+def environment():
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "pillow": PIL.__version__,
+        "imageio": imageio.__version__
+    }
+
+def run(args):
+    grid = {
+        "resolutions": list(RESOLUTIONS),
+        "image_reducers": IMAGE_REDUCERS,
+        "font_sizes": FONT_SIZES,
+        "charsets": list(CHARSETS),
+        "tiled_resolutions": TILED_RESOLUTIONS,
+        "tiled_threads": TILED_THREADS,
+        "video_resolutions": list(RESOLUTIONS),
+        "video_frames": 60
+    }
+    if args.quick:
+        grid.update(QUICK)
+    results = {}
+    if not args.video_only:
+        results.update(bench_images(grid, args.repeat))
+        results.update(bench_tiled(grid, args.repeat))
+    if not args.image_only:
+        for resolution in grid["video_resolutions"]:
+            for renderer in RENDERERS:
+                results.update(bench_video(resolution, grid["video_frames"], renderer, args.repeat))
+    convert._close_frame_pool()
+
+    output_path = args.output
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    output_folder = os.path.dirname(output_path)
+    if output_folder != "" : os.makedirs(output_folder, exist_ok=True)
+    with open(output_path, "w") as output_file:
+        json.dump({"environment": environment(), "grid": grid, "results": results}, output_file, indent=2)
+    print ("Saved results to", output_path)
+
+def compare(args):
+    """Prints every benchmark in both files, and exits with 1 if any median got slower than threshold allows"""
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    with open(args.results) as results_file:
+        results = json.load(results_file)["results"]
+
+    regressions = []
+    print ("%-50s %10s %10s %8s" % ("benchmark", "baseline", "current", "change"))
+    for name in sorted(set(baseline) & set(results)):
+        before = baseline[name]["median"]
+        after = results[name]["median"]
+        change = (after - before) / before if before > 0 else 0
+        flag = ""
+        # tiny timings are mostly noise, so they need to be slower by min_delta too
+        if change > args.threshold and after - before > args.min_delta:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print ("%-50s %10.4f %10.4f %+7.1f%%%s" % (name, before, after, change * 100, flag))
+    for name in sorted(set(baseline) - set(results)):
+        print ("%-50s missing from results" % name)
+
+    if len(regressions) > 0:
+        print (len(regressions), "regression(s) over", "%.0f%%" % (args.threshold * 100))
+        exit(1)
+    print ("No regressions")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the ASCII art conversion engine")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and save the results as JSON")
+    run_parser.add_argument("-o", "--output", default=None, help="JSON file to save results to. Default is benchmarks/results/<time>.json")
+    run_parser.add_argument("-n", "--repeat", type=int, default=3, help="Times to run every benchmark. Median is compared. Default is 3")
+    run_parser.add_argument("--quick", action="store_true", help="Run a small grid only")
+    run_parser.add_argument("--image_only", action="store_true", help="Skip video benchmarks")
+    run_parser.add_argument("--video_only", action="store_true", help="Skip image benchmarks")
+
+    compare_parser = commands.add_parser("compare", help="Compare results against a baseline, exits with 1 on regressions")
+    compare_parser.add_argument("baseline", help="JSON results to compare against")
+    compare_parser.add_argument("results", help="JSON results to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown of a median, 0.1 is 10%%. Default is 0.1")
+    compare_parser.add_argument("--min_delta", type=float, default=0.005, help="Secs a benchmark must also slow down by to count. Default is 0.005")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
@@ -0,0 +1,224 @@
+import os
+import time
+import json
+import hashlib
+import shutil
+from uuid import uuid4
+
+def normalize_params(file_ext, image_reducer=10, fontSize=10, spacing=1.1, maxsize=None,
+                    chars=" .*:+%S0#@", frame_frequency=None, font_path=None, output_format=None, sampling="point",
+                    renderer="pil"):
+    """Returns the conversion parameters in a canonical form, so equal conversions always give equal cache keys
+
+    Parameters
+    ---------
+    file_ext : string
+        - extension of the uploaded file. Outputs are saved in the same format, so it's part of the key
+    frame_frequency : int
+        - VIDEO ONLY. None for images
+    font_path : string
+        - font the worker draws with. None means the bundled one
+    output_format : string
+        - VIDEO ONLY. "video" or "ascii" (see convert.convert_video_path_and_save). None for images
+    sampling : string
+        - how the worker samples cells, see convert.SAMPLINGS
+    renderer : string
+        - renderer the worker draws with, see convert.RENDERERS. They differ where glyphs overlap (low spacing)
+
+    all other parameters found in convert.convert_image
+    """
+    return {
+        "ext": file_ext.lower(),
+        "image_reducer": int(image_reducer),
+        "fontSize": int(fontSize),
+        "spacing": round(float(spacing), 6),
+        "maxsize": None if maxsize is None else [int(maxsize[0]), int(maxsize[1])],
+        "chars": chars,
+        "frame_frequency": None if frame_frequency is None else int(frame_frequency),
+        "font_path": font_path,
+        "output_format": output_format,
+        "sampling": sampling,
+        "renderer": renderer
+    }
+
+def result_cache_key(file, params):
+    """Returns a hex sha256 over the contents of a file and the normalized parameters (see normalize_params)
+    file can be a path, or a file object which is read from its current position to the end"""
+    digest = hashlib.sha256()
+    if isinstance(file, str):
+        with open(file, "rb") as input_file:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+class DiskResultCache:
+    """Represents a result cache stored in a local (or shared) folder, one file per key.
+    Least recently used entries are deleted once the folder grows past max_bytes.
+    Recency is tracked with file modification times, so every process sharing the folder sees the same order
+
+    Properties
+    ----------
+    folder : string
+        - folder the cached outputs are stored in
+    max_bytes : int
+        - max total size of the cached outputs
+    hits : int
+        - number of lookups that found a result (in this process)
+    misses : int
+        - number of lookups that didn't (in this process)
+
+    Methods
+    --------
+    get
+        - copies the cached output for a key to a path, returns whether it was found
+    put
+        - stores an output for a key
+    stats
+        - returns hits, misses, entries and total bytes
+    """
+    def __init__(self, folder, max_bytes=1024 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(folder) : os.makedirs(folder)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key, output_path):
+        try:
+            shutil.copyfile(self._path(key), output_path)
+            # mark as recently used
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, key, file_path):
+        # copy under a temporary name first, so no one ever reads a half written entry
+        temp_path = self._path(key + "." + uuid4().hex + ".tmp")
+        shutil.copyfile(file_path, temp_path)
+        os.replace(temp_path, self._path(key))
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for mtime, size, path in entries)
+        }
+
+class RedisResultCache:
+    """Represents a result cache with its index in Redis and the outputs in storage (see storage.get_storage),
+    so every web process (and machine) shares the same cache and counters.
+    Least recently used entries are deleted once the outputs grow past max_bytes
+
+    The index is a sorted set of keys scored by last use time, plus a hash of each entry's size
+    and a running total. Hits and misses are Redis counters
+
+    Properties
+    ----------
+    max_bytes : int
+        - max total size of the cached outputs
+
+    Methods
+    --------
+    get
+        - copies the cached output for a key to a path, returns whether it was found
+    put
+        - stores an output for a key
+    stats
+        - returns hits, misses, entries and total bytes
+    """
+    def __init__(self, redis, storage, max_bytes=1024 * 1024 * 1024, prefix="result_cache"):
+        self._redis = redis
+        self._storage = storage
+        self.max_bytes = max_bytes
+        self._prefix = prefix
+        self._index = prefix + ":index"
+        self._sizes = prefix + ":sizes"
+        self._bytes = prefix + ":bytes"
+        self._hits = prefix + ":hits"
+        self._misses = prefix + ":misses"
+
+    def _storage_key(self, key):
+        return self._prefix + "/" + key
+
+    def get(self, key, output_path):
+        if self._redis.zscore(self._index, key) is not None:
+            if self._storage.exists(self._storage_key(key)):
+                self._storage.download(self._storage_key(key), output_path)
+                # mark as recently used
+                self._redis.zadd(self._index, {key: time.time()})
+                self._redis.incr(self._hits)
+                return True
+            # the output is gone, so the index entry is stale
+            self._remove(key)
+        self._redis.incr(self._misses)
+        return False
+
+    def put(self, key, file_path):
+        self._storage.upload(file_path, self._storage_key(key))
+        size = os.path.getsize(file_path)
+        previous_size = self._redis.hget(self._sizes, key)
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._index, {key: time.time()})
+        pipe.hset(self._sizes, key, size)
+        pipe.incrby(self._bytes, size - int(previous_size or 0))
+        pipe.execute()
+        self._evict()
+
+    def _remove(self, key):
+        size = self._redis.hget(self._sizes, key)
+        pipe = self._redis.pipeline()
+        pipe.zrem(self._index, key)
+        pipe.hdel(self._sizes, key)
+        if size is not None:
+            pipe.decrby(self._bytes, int(size))
+        pipe.execute()
+
+    def _evict(self):
+        while int(self._redis.get(self._bytes) or 0) > self.max_bytes:
+            oldest = self._redis.zrange(self._index, 0, 0)
+            if len(oldest) == 0:
+                break
+            key = oldest[0].decode("utf-8") if isinstance(oldest[0], bytes) else oldest[0]
+            self._storage.delete(self._storage_key(key))
+            self._remove(key)
+
+    def stats(self):
+        return {
+            "hits": int(self._redis.get(self._hits) or 0),
+            "misses": int(self._redis.get(self._misses) or 0),
+            "entries": self._redis.zcard(self._index),
+            "bytes": int(self._redis.get(self._bytes) or 0)
+        }
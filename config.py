@@ -27,20 +27,66 @@ class Config(object):
     ]
 
     PROGRESS_RATE = float(os.environ.get("PROGRESS_RATE"))
+    # secs a progress stream may go quiet before the job is checked directly and a heartbeat is sent
+    PROGRESS_HEARTBEAT = float(os.environ.get("PROGRESS_HEARTBEAT", 15))
+    # jobs save their progress at most every PROGRESS_PUBLISH_RATE secs, and only if it moved PROGRESS_MIN_CHANGE percent
+    PROGRESS_PUBLISH_RATE = float(os.environ.get("PROGRESS_PUBLISH_RATE", 0.5))
+    PROGRESS_MIN_CHANGE = float(os.environ.get("PROGRESS_MIN_CHANGE", 0.5))
 
     CONVERT_PROCESSES = int(os.environ.get("CONVERT_PROCESSES"))
     CONVERT_THREADS = int(os.environ.get("CONVERT_THREADS"))
+    RENDERER = os.environ.get("RENDERER", "pil")
+    # "point" or "area", see convert.SAMPLINGS
+    SAMPLING = os.environ.get("SAMPLING", "point")
+    FONT_PATH = os.environ.get("FONT_PATH")
+
+    # if set, every job saves a profile here. "prof" is cProfile, "html" or "txt" is pyinstrument
+    PROFILE_DIR = os.environ.get("PROFILE_DIR")
+    PROFILE_FORMAT = os.environ.get("PROFILE_FORMAT", "prof")
+
+    # "off", "disk" or "redis"
+    RESULT_CACHE = os.environ.get("RESULT_CACHE", "off")
+    RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "result_cache")
+    RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+    # "fork" forks a work horse per job (RQ's default) from a worker that already loaded everything,
+    # "warm" runs jobs in the worker process itself. See worker.py
+    WORKER_MODE = os.environ.get("WORKER_MODE", "fork")
+    # "inline" converts images in the job's own process, "process" in a separate one for isolation
+    IMAGE_JOB_MODE = os.environ.get("IMAGE_JOB_MODE", "inline")
+    # "inline" converts videos in the job's own process, on a frame pool a warm worker keeps between jobs,
+    # "process" in a separate one (with a frame pool of its own) for isolation
+    VIDEO_JOB_MODE = os.environ.get("VIDEO_JOB_MODE", "inline")
+    # number of workers forked from one warm parent
+    WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 1))
+    # font sizes whose glyph atlases workers build at start up (comma separated), for the default chars
+    WARM_FONT_SIZES = [int(size) for size in os.environ.get("WARM_FONT_SIZES", "10").split(",") if size.strip() != ""]
+
+    # "on" estimates the cost (worker secs) of every job before queueing it (see admission.py),
+    # "off" puts every job on the default queue
+    ADMISSION = os.environ.get("ADMISSION", "on")
+    # estimated secs a single job may take. Costlier jobs are downgraded to fit (if DOWNGRADE_JOBS is "on") or rejected
+    JOB_BUDGET = float(os.environ.get("JOB_BUDGET", 240))
+    DOWNGRADE_JOBS = os.environ.get("DOWNGRADE_JOBS", "on")
+    # jobs estimated to take longer than this go to the bulk queue instead of the image or video queue
+    BULK_COST = float(os.environ.get("BULK_COST", 30))
+    # secs a new job may expect to wait in its queue. Beyond that, it's turned away with a 429 and a Retry-After
+    QUEUE_SLO = float(os.environ.get("QUEUE_SLO", 120))
 
     REDIS_URL = os.environ.get("REDIS_URL")
     FAILURE_TTL = int(os.environ.get("FAILURE_TTL"))
     RESULT_TTL = int(os.environ.get("RESULT_TTL"))
     JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT"))
 
+    # where uploads and outputs are kept: "firebase", "local" (STORAGE_DIR, a volume shared with the workers) or "memory"
+    STORAGE = os.environ.get("STORAGE", "firebase")
+    STORAGE_DIR = os.environ.get("STORAGE_DIR", "storage")
+
     FIREBASE_KEY = {
         "type": os.environ.get("TYPE"),
         "project_id": os.environ.get("PROJECT_ID"),
         "private_key_id": os.environ.get("PRIVATE_KEY_ID"),
-        "private_key": os.environ.get("PRIVATE_KEY").replace("\\n", "\n"),
+        "private_key": (os.environ.get("PRIVATE_KEY") or "").replace("\\n", "\n"),
         "client_email": os.environ.get("CLIENT_EMAIL"),
         "client_id": os.environ.get("CLIENT_ID"),
         "auth_uri": os.environ.get("AUTH_URI"),
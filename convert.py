@@ -6,10 +6,24 @@ import os
 import shutil
 import time
 import imageio
-from multiprocessing import Process, Pool, Value
+from multiprocessing import Process, Pool, Queue, shared_memory, resource_tracker
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import bisect
 import threading
+import signal
+import subprocess
+import html
+import math
+from functools import lru_cache
 import sys
 import argparse
+from timings import StageTimings, profile_to
+from progress import ProgressTracker, ProgressWriter, ConversionCanceled
+from video_index import load_video_index
+from ascii_video import AsciiVideoWriter, ASCII_VIDEO_EXT
+from strip_writer import open_strip_writer, strip_output_path
 
 IMG_EXT = [
     ".bmp", ".dib",
@@ -29,8 +43,762 @@ VID_EXT = [
     ".mp4"
 ]
 
+RENDERERS = ["pil", "atlas"]
+
+# how the pixels of a cell become its intensity. "point" takes the top left pixel of every cell,
+# "area" averages all of them (less aliasing, and lets JPEGs be decoded at a reduced scale, see read_image)
+SAMPLINGS = ["point", "area"]
+# formats OpenCV can decode at 1/2, 1/4 or 1/8 of their size for less than a full decode (libjpeg scales while decoding)
+REDUCED_DECODE_EXT = [".jpeg", ".jpg", ".jpe"]
+REDUCED_DECODE_FLAGS = {
+    False: {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+    True: {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+}
+
+# font that ships with the converter. Found next to this file, so conversions work from any working directory
+DEFAULT_FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NotoMono-Regular.ttf")
+
+# output formats that skip drawing entirely, and the file extensions that select them
+TEXT_FORMATS = {
+    "text": [".txt"],
+    "ansi": [".ans", ".ansi"],
+    "html": [".html", ".htm"]
+}
+OUTPUT_FORMATS = ["image"] + list(TEXT_FORMATS)
+
+# images bigger than this (in pixels) are drawn and saved a strip at a time (see render_strips),
+# so converting them never needs the whole output in memory at once
+TILED_MIN_PIXELS = 64 * 1024 * 1024
+# about how many pixels every strip has
+STRIP_PIXELS = 4 * 1024 * 1024
+
+class GlyphAtlas:
+    """Holds a pre-rasterized bitmap of every character in a char set, for one loaded font.
+    Glyphs are drawn once with PIL (once per sub-pixel offset actually used), so a whole canvas
+    can then be built with NumPy indexing instead of one draw.text() call per character
+
+    Properties
+    ----------
+    font : PIL.ImageFont.FreeTypeFont
+        - font the glyphs are rasterized with
+    chars : string
+        - characters in the atlas, in the same order as the character indices
+    origin : (int, int)
+        - (x, y) offset of a tile's top left corner relative to the position passed to draw.text()
+    tile_size : (int, int)
+        - (width, height) of a single glyph tile
+
+    Methods
+    --------
+    get_tiles
+        - returns the glyph tiles for the given sub-pixel offsets
+    """
+    # PIL/FreeType position glyphs in 1/64 pixel steps
+    SUBPIXEL_STEPS = 64
+
+    def __init__(self, font, chars):
+        self.font = font
+        self.chars = chars
+        self._pad = font.size + 1
+        self._scratch_size = 3 * font.size + 4
+        self._phases = {}
+
+        # find the box enclosing every glyph, plus one pixel right and down for sub-pixel offsets
+        scratch = self._rasterize(0, 0)
+        ys, xs = np.nonzero(scratch.max(axis=0))
+        if len(xs) == 0:
+            xs = ys = np.array([self._pad])
+        self._box = (xs.min(), ys.min(), xs.max() + 2, ys.max() + 2)
+        self.origin = (int(self._box[0] - self._pad), int(self._box[1] - self._pad))
+        self.tile_size = (int(self._box[2] - self._box[0]), int(self._box[3] - self._box[1]))
+
+    def _rasterize(self, phase_x, phase_y):
+        """Draws every char on its own scratch canvas, offset by phase / SUBPIXEL_STEPS pixels"""
+        scratch = np.zeros((len(self.chars), self._scratch_size, self._scratch_size), dtype=np.uint8)
+        position = (
+            self._pad + phase_x / self.SUBPIXEL_STEPS,
+            self._pad + phase_y / self.SUBPIXEL_STEPS
+        )
+        for i, char in enumerate(self.chars):
+            glyph = Image.new("L", (self._scratch_size, self._scratch_size), color=0)
+            ImageDraw.Draw(glyph).text(position, char, 255, font=self.font)
+            scratch[i] = np.asarray(glyph)
+        return scratch
+
+    def _tiles(self, phase_x, phase_y):
+        key = (int(phase_x), int(phase_y))
+        if key not in self._phases:
+            left, top, right, bottom = self._box
+            self._phases[key] = self._rasterize(*key)[:, top:bottom, left:right].copy()
+        return self._phases[key]
+
+    def get_tiles(self, phases_x, phases_y):
+        """Returns a uint8 array of shape (len(phases_y), len(phases_x), len(chars), tile height, tile width)
+
+        Parameters
+        ---------
+        phases_x : [int, ...]
+            - horizontal sub-pixel offsets, in 1/SUBPIXEL_STEPS of a pixel
+        phases_y : [int, ...]
+            - vertical sub-pixel offsets, in 1/SUBPIXEL_STEPS of a pixel
+        """
+        return np.stack([
+            np.stack([self._tiles(phase_x, phase_y) for phase_x in phases_x])
+            for phase_y in phases_y
+        ])
+
+def _resolve_font_path(font_path):
+    return os.path.abspath(DEFAULT_FONT_PATH if font_path is None else font_path)
+
+@lru_cache(maxsize=32)
+def _load_font(font_path, fontSize):
+    return ImageFont.truetype(font_path, fontSize, encoding="unic")
+
+@lru_cache(maxsize=32)
+def _load_glyph_atlas(font_path, fontSize, chars):
+    return GlyphAtlas(_load_font(font_path, fontSize), chars)
+
+def get_font(fontSize=10, font_path=None):
+    """Returns the font loaded from font_path (DEFAULT_FONT_PATH if None) at the given size
+    Fonts are loaded once per process and shared by every conversion, least recently used ones get dropped"""
+    return _load_font(_resolve_font_path(font_path), fontSize)
+
+def get_glyph_atlas(fontSize=10, chars=" .*:+%S0#@", font_path=None):
+    """Returns the GlyphAtlas for the given font, size and chars
+    Atlases are built once per process and shared by every conversion, least recently used ones get dropped"""
+    return _load_glyph_atlas(_resolve_font_path(font_path), fontSize, chars)
+
+def preload_font(font_path=None, font_sizes=(10,), chars=" .*:+%S0#@"):
+    """Loads a font and rasterizes its glyph atlas for every given size ahead of time,
+    so a worker process pays for it once at start up instead of on its first job
+
+    Parameters
+    ---------
+    font_path : string
+        - path to a monospace .ttf/.otf font. DEFAULT_FONT_PATH if None
+    font_sizes : [int, ...]
+        - font sizes to load
+    chars : string
+        - chars to rasterize
+    """
+    for fontSize in font_sizes:
+        get_glyph_atlas(fontSize, chars, font_path)
+
+class AtlasCanvas:
+    """Represents an image being drawn with a GlyphAtlas, for a fixed grid of character positions.
+    Keeps the canvas around, so single cells can be redrawn later without drawing everything again
+
+    Drawing matches draw.text((x, y), char, 255, font=font) for every character pixel for pixel,
+    except where the ink of neighbouring glyphs overlaps (very low spacing).
+    There PIL blends glyphs in drawing order and we blend them in tile pixel order,
+    so overlapping pixels may differ by a couple of intensity levels due to rounding
+
+    Properties
+    ----------
+    size : (int, int)
+        - (width, height) of the final image
+    overlap : bool
+        - whether glyph tiles of neighbouring cells overlap. If so, redrawing a cell also means redrawing its neighbours
+
+    Methods
+    --------
+    draw
+        - draws a matrix of char indices, either every cell or only some of them
+    image
+        - returns the canvas as a PIL image
+    """
+    def __init__(self, xs, ys, size, atlas):
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        self.size = size
+        width, height = size
+        origin_x, origin_y = atlas.origin
+        self._tile_width, self._tile_height = atlas.tile_size
+
+        # split positions into whole pixels and sub-pixel offsets, the same way PIL does
+        x_pixels = np.floor(xs).astype(np.int64)
+        y_pixels = np.floor(ys).astype(np.int64)
+        phases_x, self._x_phase_index = np.unique(
+            ((xs - x_pixels) * atlas.SUBPIXEL_STEPS).astype(np.int64), return_inverse=True)
+        phases_y, self._y_phase_index = np.unique(
+            ((ys - y_pixels) * atlas.SUBPIXEL_STEPS).astype(np.int64), return_inverse=True)
+        self._tiles = atlas.get_tiles(phases_x, phases_y)
+
+        # pad the canvas so every tile fits, then crop back to size at the end (PIL clips at the borders)
+        self._pad_left = max(0, -origin_x)
+        self._pad_top = max(0, -origin_y)
+        self._canvas_width = self._pad_left + width + max(0, origin_x) + self._tile_width
+        canvas_height = self._pad_top + height + max(0, origin_y) + self._tile_height
+        self._canvas = np.zeros((canvas_height, self._canvas_width), dtype=np.uint8)
+        self._tops = y_pixels + origin_y + self._pad_top
+        self._lefts = x_pixels + origin_x + self._pad_left
+
+        # if tiles can't overlap, every canvas pixel is written at most once and we can skip blending
+        x_step = max(np.diff(x_pixels).min(), 1) if len(x_pixels) > 1 else self._tile_width
+        y_step = max(np.diff(y_pixels).min(), 1) if len(y_pixels) > 1 else self._tile_height
+        self.overlap = bool(self._tile_width > x_step or self._tile_height > y_step)
+        # how many cells away a tile can reach into
+        self._reach = (int(np.ceil(self._tile_height / y_step)), int(np.ceil(self._tile_width / x_step)))
+
+    def draw(self, indices, cells=None):
+        """Draws a matrix of char indices onto the canvas
+
+        Parameters
+        ---------
+        indices : numpy.ndarray
+            - 2D array (rows, cols) of indices into atlas.chars
+        cells : numpy.ndarray
+            - 2D boolean array (rows, cols) of the cells to redraw, replacing whatever they had before
+            - if None, the canvas is cleared and every cell is drawn
+        """
+        indices = np.asarray(indices)
+        flat_canvas = self._canvas.reshape(-1)
+        dirty = None
+        if cells is None:
+            self._canvas[:] = 0
+            starts = (self._tops.reshape(-1, 1) * self._canvas_width + self._lefts.reshape(1, -1)).reshape(-1)
+            glyph_index = (self._y_phase_index.reshape(-1, 1), self._x_phase_index.reshape(1, -1), indices)
+        else:
+            cells = np.asarray(cells, dtype=bool)
+            if not cells.any():
+                return
+            if self.overlap:
+                # every pixel a redrawn tile covers is rebuilt from scratch, from all the tiles covering it,
+                # in the same order a full draw would use. So the result is exactly the same as a full draw
+                dirty = np.zeros(flat_canvas.size, dtype=bool)
+                starts = self._cell_starts(cells)
+                for dy in range(self._tile_height):
+                    for dx in range(self._tile_width):
+                        dirty[starts + (dy * self._canvas_width + dx)] = True
+                flat_canvas[dirty] = 0
+                reach_y, reach_x = self._reach
+                cells = cv2.dilate(cells.astype(np.uint8), np.ones((2 * reach_y + 1, 2 * reach_x + 1), np.uint8)) > 0
+            rows, cols = np.nonzero(cells)
+            starts = self._cell_starts(cells)
+            glyph_index = (self._y_phase_index[rows], self._x_phase_index[cols], indices[rows, cols])
+        if starts.size == 0:
+            return
+
+        for dy in range(self._tile_height):
+            for dx in range(self._tile_width):
+                layer = self._tiles[:, :, :, dy, dx]
+                # nothing is ever drawn at this spot of a tile, so there is nothing to draw or clear either
+                if not layer.any():
+                    continue
+                values = layer[glyph_index].reshape(-1)
+                targets = starts + (dy * self._canvas_width + dx)
+                if dirty is not None:
+                    keep = dirty[targets]
+                    values = values[keep]
+                    targets = targets[keep]
+                if self.overlap:
+                    # same integer blend as PIL: DIV255(out * (255 - mask) + ink * mask)
+                    out = flat_canvas[targets].astype(np.uint32)
+                    values = values.astype(np.uint32)
+                    blended = out * (255 - values) + 255 * values + 128
+                    flat_canvas[targets] = ((blended >> 8) + blended) >> 8
+                else:
+                    flat_canvas[targets] = values
+
+    def _cell_starts(self, cells):
+        """Returns the flat canvas position of the top left corner of every selected cell's tile"""
+        rows, cols = np.nonzero(cells)
+        return self._tops[rows] * self._canvas_width + self._lefts[cols]
+
+    def image(self):
+        width, height = self.size
+        canvas = self._canvas[self._pad_top:self._pad_top + height, self._pad_left:self._pad_left + width]
+        return Image.fromarray(np.ascontiguousarray(canvas))
+
+def render_atlas(indices, xs, ys, size, atlas):
+    """Draws a matrix of character indices onto a new black image using a GlyphAtlas
+    Looks the same as drawing every character with PIL, see AtlasCanvas for details
+
+    Parameters
+    ---------
+    indices : numpy.ndarray
+        - 2D array (rows, cols) of indices into atlas.chars
+    xs : [float, ...]
+        - x position of every column
+    ys : [float, ...]
+        - y position of every row
+    size : (int, int)
+        - (width, height) of the output image
+    atlas : GlyphAtlas
+        - pre-rasterized glyphs to draw with
+    """
+    canvas = AtlasCanvas(xs, ys, size, atlas)
+    canvas.draw(indices)
+    return canvas.image()
+
+def _render_strip(indices, xs, ys, width, top, bottom, atlas, renderer, font, chars):
+    """Draws the rows of pixels from top to bottom (exclusive) of an image, as a 2D uint8 array.
+    Every row of chars whose glyphs reach into them gets drawn, in the same order as when drawing everything,
+    so the strip is exactly what those rows of the whole image would have been"""
+    origin_y = atlas.origin[1]
+    tile_height = atlas.tile_size[1]
+    tile_tops = np.floor(ys).astype(np.int64) + origin_y
+    first = int(np.searchsorted(tile_tops + tile_height, top, side="right"))
+    last = int(np.searchsorted(tile_tops, bottom, side="left"))
+    if first >= last:
+        return np.zeros((bottom - top, width), dtype=np.uint8)
+    # glyphs of rows above the strip can reach into it, so draw from wherever the first one starts.
+    # Moving everything by whole pixels keeps their sub-pixel positions (and so their pixels) the same
+    start = min(top, int(np.floor(ys[first])))
+    strip_ys = np.asarray(ys[first:last], dtype=np.float64) - start
+    if renderer == "atlas":
+        img = render_atlas(indices[first:last], xs, strip_ys, (width, bottom - start), atlas)
+    else:
+        img = render_pil(indices[first:last], xs, strip_ys, (width, bottom - start), font, chars)
+    return np.asarray(img)[top - start:]
+
+def render_strips(indices, xs, ys, size, atlas, renderer="atlas", font=None, chars=None, strip_height=None, threads=4):
+    """Draws a matrix of character indices a horizontal strip at a time, from top to bottom.
+    Yields every strip (2D uint8 array, strip_height rows of pixels, except maybe the last one) in order,
+    so they can be saved as they come (see strip_writer.py) and only a few strips are ever in memory
+
+    Parameters
+    ---------
+    indices : numpy.ndarray
+        - 2D array (rows, cols) of indices into chars
+    xs : [float, ...]
+        - x position of every column
+    ys : [float, ...]
+        - y position of every row
+    size : (int, int)
+        - (width, height) of the whole image
+    atlas : GlyphAtlas
+        - glyphs of the font, used to find out which rows of chars reach into a strip (and to draw them with the atlas renderer)
+    renderer : string
+        - "atlas" or "pil", same as convert_image
+    font : PIL.ImageFont.FreeTypeFont
+        - font to draw with, only needed by the pil renderer
+    chars : string
+        - chars the indices refer to, only needed by the pil renderer
+    strip_height : int
+        - height of a strip in pixels. Default is about STRIP_PIXELS pixels per strip
+    threads : int
+        - number of strips drawn at once
+    """
+    width, height = size
+    if strip_height is None:
+        strip_height = max(1, STRIP_PIXELS // max(width, 1))
+    # no point in strips smaller than a glyph
+    strip_height = max(strip_height, atlas.tile_size[1])
+    ys = np.asarray(ys, dtype=np.float64)
+    bounds = [(top, min(top + strip_height, height)) for top in range(0, height, strip_height)]
+    threads = max(1, threads)
+    if threads == 1:
+        for top, bottom in bounds:
+            yield _render_strip(indices, xs, ys, width, top, bottom, atlas, renderer, font, chars)
+        return
+    # strips finish in any order but are handed out in order. Only a couple strips per thread are drawn ahead
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        for top, bottom in bounds:
+            pending.append(executor.submit(_render_strip, indices, xs, ys, width, top, bottom, atlas, renderer, font, chars))
+            if len(pending) >= threads * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _to_grayscale(img):
+    img = np.asarray(img)
+    if img.ndim == 3 and img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+    if img.ndim == 3 and img.shape[2] == 3:
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if img.ndim == 3:
+        return img[:, :, 0]
+    return img
+
+def _block_mean(img, reducer):
+    """Returns the average of every reducer x reducer block of an image (grayscale or color), same dtype.
+    Blocks at the right and bottom edges may be smaller, they average whatever pixels they have"""
+    img = np.asarray(img)
+    rows, cols = img.shape[:2]
+    full_rows, full_cols = rows // reducer, cols // reducer
+    cells = np.empty((-(-rows // reducer), -(-cols // reducer)) + img.shape[2:], dtype=img.dtype)
+    if cells.size == 0:
+        return cells
+    round_mean = (lambda block, axis: np.round(block.mean(axis=axis))) if np.issubdtype(img.dtype, np.integer) else (
+        lambda block, axis: block.mean(axis=axis))
+    if full_rows > 0 and full_cols > 0:
+        # whole blocks are what INTER_AREA does for integer factors, without converting the whole image to floats
+        cells[:full_rows, :full_cols] = cv2.resize(
+            img[:full_rows * reducer, :full_cols * reducer], (full_cols, full_rows), interpolation=cv2.INTER_AREA
+        ).reshape(cells[:full_rows, :full_cols].shape)
+    if cols % reducer and full_rows > 0:
+        right = img[:full_rows * reducer, full_cols * reducer:]
+        cells[:full_rows, full_cols] = round_mean(right.reshape((full_rows, reducer) + right.shape[1:]), (1, 2))
+    if rows % reducer and full_cols > 0:
+        bottom = img[full_rows * reducer:, :full_cols * reducer]
+        cells[full_rows, :full_cols] = round_mean(bottom.reshape((bottom.shape[0], full_cols, reducer) + bottom.shape[2:]), (0, 2))
+    if rows % reducer and cols % reducer:
+        cells[full_rows, full_cols] = round_mean(img[full_rows * reducer:, full_cols * reducer:], (0, 1))
+    return cells
+
+def _sample_cells(img, reducer, sampling="point"):
+    """Returns one value per cell of reducer x reducer pixels, see SAMPLINGS"""
+    if sampling == "area" and reducer > 1:
+        return _block_mean(img, reducer)
+    return np.asarray(img)[::reducer, ::reducer]
+
+def _sample_colors(img, reducer, sampling="point"):
+    """Returns the RGB color (uint8) of every cell when mapping with the given reducer"""
+    sampled = _sample_cells(img, reducer, sampling)
+    if sampled.ndim == 2:
+        sampled = np.stack([sampled] * 3, axis=2)
+    elif sampled.shape[2] >= 3:
+        # cv2 stores BGR(A)
+        sampled = sampled[:, :, 2::-1]
+    else:
+        sampled = np.concatenate([sampled[:, :, :1]] * 3, axis=2)
+    if sampled.dtype != np.uint8:
+        max_intensity = np.amax(sampled) if sampled.size > 0 else 0
+        if max_intensity > 0:
+            sampled = sampled * (255 / max_intensity)
+        sampled = np.clip(sampled, 0, 255).astype(np.uint8)
+    return sampled
+
+def indices_to_text(indices, chars):
+    """Returns a matrix of char indices as plain text, one line per row"""
+    char_array = np.array(list(chars))[indices]
+    return "\n".join("".join(row) for row in char_array) + "\n"
+
+def indices_to_ansi(indices, chars, colors=None):
+    """Returns a matrix of char indices as text colored with 24 bit ANSI escape codes, one line per row
+
+    Parameters
+    ---------
+    indices : numpy.ndarray
+        - 2D array (rows, cols) of indices into chars
+    chars : string
+        - chars the indices refer to
+    colors : numpy.ndarray
+        - (rows, cols, 3) uint8 RGB color of every char
+        - if not given, every char is colored by its own intensity level (gray)
+    """
+    if colors is None:
+        levels = max(len(chars) - 1, 1)
+        gray = (np.asarray(indices, dtype=np.uint32) * 255 // levels).astype(np.uint8)
+        colors = np.stack([gray] * 3, axis=2)
+    lines = []
+    for row, row_colors in zip(indices, colors):
+        line = []
+        previous = None
+        for val, color in zip(row, row_colors.tolist()):
+            # only emit a new escape code when the color actually changes
+            if color != previous:
+                line.append("\x1b[38;2;%d;%d;%dm" % tuple(color))
+                previous = color
+            line.append(chars[val])
+        line.append("\x1b[0m")
+        lines.append("".join(line))
+    return "\n".join(lines) + "\n"
+
+def indices_to_html(indices, chars, fontSize=10, spacing=1.1):
+    """Returns a matrix of char indices as a standalone HTML document, white text on black inside a <pre>
+    fontSize and spacing are turned into CSS so it looks roughly like the rendered image"""
+    escaped = np.array([html.escape(char) for char in chars], dtype=object)[indices]
+    body = "\n".join("".join(row) for row in escaped)
+    # the rendered image places chars every fontSize * 0.8 * spacing px. Monospace chars are about 0.6em wide
+    pitch = 0.8 * spacing
+    style = "background:#000;color:#fff;margin:0;font-family:monospace;font-size:%dpx;line-height:%.3f;letter-spacing:%.3fem" % (
+        fontSize, pitch, pitch - 0.6
+    )
+    return (
+        "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>ASCII Art</title></head>\n"
+        "<body style=\"margin:0;background:#000\"><pre style=\"%s\">%s</pre></body></html>\n" % (style, body)
+    )
+
+def _output_format_from_path(output_path):
+    """Figures out the output format from a file extension. Anything unknown is saved as an image"""
+    ext = os.path.splitext(output_path)[1].lower()
+    for output_format, extensions in TEXT_FORMATS.items():
+        if ext in extensions:
+            return output_format
+    return "image"
+
+def _index_dtype(levels):
+    return np.uint8 if levels <= 256 else np.uint16
+
+@lru_cache(maxsize=64)
+def _intensity_lut(max_intensity, levels):
+    """Returns a lookup table mapping every pixel intensity from 0 to max_intensity to a char index"""
+    if max_intensity <= 0:
+        lut = np.zeros(1, dtype=_index_dtype(levels))
+    else:
+        # defines the subsets of pixel intensities
+        # Can vary depending on max pixel intensity or length of char set
+        div = max_intensity / (levels - 1)
+        lut = np.minimum((np.arange(max_intensity + 1) / div).astype(np.int64), levels - 1).astype(_index_dtype(levels))
+    # the table is shared between calls, so make sure nobody modifies it
+    lut.setflags(write=False)
+    return lut
+
+# when maxsize shrinks an output, chars are drawn at least this big. If they'd be any smaller,
+# fewer cells are sampled instead (see plan_output)
+MIN_FONT_SIZE = 4
+# cell positions of a shrunk output are rounded to this fraction of a pixel,
+# so a GlyphAtlas only has to rasterize a few sub-pixel offsets
+PLAN_SUBPIXEL_STEPS = 4
+
+def _thumbnail_size(size, maxsize):
+    """Returns the size PIL's Image.thumbnail(maxsize) would shrink an image of the given size to"""
+    width, height = size
+    max_width, max_height = int(maxsize[0]), int(maxsize[1])
+    if max_width >= width and max_height >= height:
+        return size
+    # same rounding as PIL: pick whichever of floor/ceil keeps the aspect ratio closest
+    aspect = width / height
+    if max_width / max_height >= aspect:
+        new_width = max(min(math.floor(max_height * aspect), math.ceil(max_height * aspect),
+                            key=lambda n: abs(aspect - n / max_height)), 1)
+        return (new_width, max_height)
+    new_height = max(min(math.floor(max_width / aspect), math.ceil(max_width / aspect),
+                         key=lambda n: 0 if n == 0 else abs(aspect - max_width / n)), 1)
+    return (max_width, new_height)
+
+class OutputPlan:
+    """Geometry of a converted image: which pixels get sampled, how big chars are drawn and where they go
+
+    Properties
+    ----------
+    reducer : int
+        - every reducer-th pixel of every reducer-th row is sampled
+    fontSize : int
+        - font size the chars are drawn with
+    size : (int, int)
+        - (width, height) of the output image
+    xs : numpy.ndarray
+        - x position of every column of chars
+    ys : numpy.ndarray
+        - y position of every row of chars
+    shape : (int, int)
+        - (rows, cols) of chars
+    render_size : (int, int)
+        - (width, height) the chars are drawn at, xs and ys are positions on it. Same as size,
+        unless the output is smaller than a char: then it's drawn whole and shrunk to size afterwards (see shrink)
+
+    Methods
+    --------
+    shrink
+        - returns an image drawn at render_size at the size of the output
+    """
+    def __init__(self, reducer, fontSize, size, xs, ys, render_size=None, maxsize=None):
+        self.reducer = reducer
+        self.fontSize = fontSize
+        self.size = size
+        self.xs = xs
+        self.ys = ys
+        self.shape = (len(ys), len(xs))
+        self.render_size = size if render_size is None else render_size
+        self._maxsize = maxsize
+
+    def shrink(self, img):
+        if self.render_size != self.size:
+            img.thumbnail(self._maxsize)
+        return img
+
+def plan_output(rows, cols, image_reducer=10, fontSize=10, spacing=1.1, maxsize=None):
+    """Returns the OutputPlan for converting an image of rows x cols pixels
+
+    Without maxsize (or if the output already fits) that's a cell for every reducer-th pixel,
+    drawn fontSize * 0.8 * spacing pixels apart. Otherwise everything is planned at the size
+    Image.thumbnail(maxsize) would have shrunk it to, so nothing is drawn only to be thrown away:
+    chars get drawn with a smaller font at a smaller pitch, and if that font would be smaller than
+    MIN_FONT_SIZE, fewer pixels are sampled (and each char gets bigger) instead.
+    Outputs smaller than a single char can't be planned like that, they're drawn whole and shrunk like before
+
+    There's always at least one cell, and the output is at least 1 x 1
+    """
+    reducer = int(100 / image_reducer)
+    scale = fontSize * 0.8 / reducer * spacing
+    size = (max(int(cols * scale), 1), max(int(rows * scale), 1))
+    xs = np.arange(0, max(cols, 1), reducer) * scale
+    ys = np.arange(0, max(rows, 1), reducer) * scale
+    if maxsize is None or _thumbnail_size(size, maxsize) == size:
+        return OutputPlan(reducer, fontSize, size, xs, ys)
+    new_size = _thumbnail_size(size, maxsize)
+    if min(new_size) < fontSize:
+        # a shrunk char wouldn't even cover a pixel of it, so nothing would show up
+        return OutputPlan(reducer, fontSize, new_size, xs, ys, size, maxsize)
+    ratio = min(new_size[0] / size[0], new_size[1] / size[1])
+    # the font a thumbnail would have shrunk chars to, and how many cells to merge so chars stay big enough
+    shrunk_font = fontSize * ratio
+    merge = max(1, math.ceil(min(fontSize, MIN_FONT_SIZE) / shrunk_font - 1e-9))
+    reducer *= merge
+    xs = np.arange(0, cols, reducer) * (scale * new_size[0] / size[0])
+    ys = np.arange(0, rows, reducer) * (scale * new_size[1] / size[1])
+    return OutputPlan(
+        reducer, max(int(round(shrunk_font * merge)), 1), new_size,
+        np.round(xs * PLAN_SUBPIXEL_STEPS) / PLAN_SUBPIXEL_STEPS, np.round(ys * PLAN_SUBPIXEL_STEPS) / PLAN_SUBPIXEL_STEPS
+    )
+
+def image_to_indices(img, image_reducer=10, chars=" .*:+%S0#@", reducer=None, sampling="point"):
+    """Maps a cv2 image to a matrix of char indices, one for every n x n pixels
+    Index 0 is chars[0] (lowest intensity), index len(chars) - 1 is chars[-1] (highest intensity)
+
+    Parameters
+    ---------
+    img : cv2 image
+        - cv2 image object (NumPy array) to map. Color (BGR/BGRA) images are converted to grayscale first
+    image_reducer : float
+        - percentage of pixels to keep
+    chars : string
+        - chars the indices refer to
+        - lowest pixel intensity to highest, from left to right
+    reducer : int
+        - if given, every reducer-th pixel is kept instead, whatever image_reducer says (see OutputPlan)
+    sampling : string
+        - "point" keeps the top left pixel of every cell, and intensities are relative to the brightest pixel
+        - "area" averages every cell, and intensities are relative to the brightest cell
+
+    Returns
+    ---------
+    numpy.ndarray
+        - 2D uint8 array (uint16 if there are more than 256 chars) of shape (ceil(rows / reducer), ceil(cols / reducer))
+    """
+    # reducer takes image_reducer percentage, and will skip nth pixels when converting
+    if reducer is None:
+        reducer = int(100 / image_reducer)
+    img = _to_grayscale(img)
+    sampled = _sample_cells(img, reducer, sampling)
+    if sampled.size == 0:
+        return np.zeros(sampled.shape, dtype=_index_dtype(len(chars)))
+    return _cells_to_indices(sampled, np.amax(sampled if sampling == "area" else img), len(chars))
+
+def _cells_to_indices(sampled, max_intensity, levels):
+    """Maps the intensity of every cell to a char index, max_intensity being the last one"""
+    if np.issubdtype(sampled.dtype, np.integer):
+        # integer images (8 or 16 bit) go through a precomputed lookup table
+        return _intensity_lut(int(max_intensity), levels)[sampled]
+    # floating point images (.exr, .hdr) can't be looked up, so compute the division directly
+    if max_intensity <= 0:
+        return np.zeros(sampled.shape, dtype=_index_dtype(levels))
+    div = max_intensity / (levels - 1)
+    return np.clip(sampled / div, 0, levels - 1).astype(_index_dtype(levels))
+
+def render_pil(indices, xs, ys, size, font, chars, progress=None, progress_step=0):
+    """Draws a matrix of character indices onto a new black image, one draw.text() call per character
+
+    Parameters
+    ---------
+    indices : numpy.ndarray
+        - 2D array (rows, cols) of indices into chars
+    xs : [float, ...]
+        - x position of every column
+    ys : [float, ...]
+        - y position of every row
+    size : (int, int)
+        - (width, height) of the output image
+    font : PIL.ImageFont.FreeTypeFont
+        - font to draw with
+    chars : string
+        - chars the indices refer to
+    progress : progress.ProgressWriter
+        - if given, progress_step is added to it after every drawn row
+    progress_step : float
+        - amount to progress step
+    """
+    # create new image with black bacground (because white text on black looks cooler)
+    output_img = Image.new("L", size, color=0)
+    draw = ImageDraw.Draw(output_img)
+    xs = [float(x) for x in xs]
+    for row, currentRow in enumerate(ys):
+        currentRow = float(currentRow)
+        for currentCol, val in zip(xs, indices[row]):
+            draw.text((currentCol, currentRow), chars[val], 255, font=font)
+        if progress is not None:
+            progress.add(progress_step)
+    return output_img
+
+def _convert_image(img, image_reducer=10, fontSize=10, spacing=1.1, maxsize=None,
+                    chars=" .*:+%S0#@", logs=False, progress_tracker=None, renderer="pil", output_format="image",
+                    font_path=None, timings=None, progress_callback=None, cancel_check=None, sampling="point",
+                    source_shape=None, decode_scale=1):
+    """Does the actual work of convert_image, but lets exceptions through so callers like worker processes can handle them"""
+    if timings is None:
+        timings = StageTimings()
+    if logs:
+        print ("Converting image...")
+        start_time = time.time()
+    # an image decoded at a reduced scale (see read_image) is planned as if it wasn't
+    rows, cols = (len(img), len(img[0])) if source_shape is None else source_shape
+    pixels = len(img) * len(img[0])
+
+    # reducer takes image_reducer percentage, and will skip nth pixels when converting
+    reducer = int(100 / image_reducer)
+
+    # will be used to track our overall conversion progress
+    if progress_tracker is None:
+        progress = ProgressWriter(logs=logs, callback=progress_callback, cancel_check=cancel_check)
+    else:
+        progress = progress_tracker.writer(logs=logs, callback=progress_callback, cancel_check=cancel_check)
+
+    if output_format in TEXT_FORMATS:
+        # text output only needs the chars, no fonts or drawing involved
+        with timings.stage("map", pixels=pixels) as counts:
+            indices = image_to_indices(img, image_reducer, chars, reducer // decode_scale, sampling)
+            counts["cells"] = indices.size
+        with timings.stage("format", cells=indices.size):
+            if output_format == "ansi":
+                output = indices_to_ansi(indices, chars, _sample_colors(img, reducer // decode_scale, sampling))
+            elif output_format == "html":
+                output = indices_to_html(indices, chars, fontSize, spacing)
+            else:
+                output = indices_to_text(indices, chars)
+        progress.finish()
+        if logs:
+            print ("Progress: %.4f%%" % progress.total())
+            print ("Time took: %.4f secs" % (time.time() - start_time))
+        return output
+
+    # with maxsize, everything is planned (and drawn) at the final size right away, instead of drawing it all
+    # at full size and shrinking it afterwards. So drawing takes as long as the output is big, whatever the input is
+    plan = plan_output(rows, cols, image_reducer, fontSize, spacing, maxsize)
+    output_size = plan.render_size
+
+    # load ttf font
+    with timings.stage("font"):
+        font = get_font(plan.fontSize, font_path)
+
+    # figure out which chars go where. This is fast, so it counts as the first half of our progress
+    with timings.stage("map", pixels=pixels) as counts:
+        indices = image_to_indices(img, image_reducer, chars, plan.reducer // decode_scale, sampling)
+        counts["cells"] = indices.size
+    progress_step = 100 / (len(indices) * 2) if len(indices) > 0 else 0
+    progress.add(progress_step * len(indices))
+
+    # position of every row and column of chars on the new image
+    xs = plan.xs
+    ys = plan.ys
+
+    if renderer == "atlas":
+        with timings.stage("font"):
+            atlas = get_glyph_atlas(plan.fontSize, chars, font_path)
+        progress.check_canceled()
+        with timings.stage("render", cells=indices.size, pixels=output_size[0] * output_size[1]):
+            output_img = render_atlas(indices, xs, ys, output_size, atlas)
+        progress.add(progress_step * len(indices))
+    else:
+        with timings.stage("render", cells=indices.size, pixels=output_size[0] * output_size[1]):
+            output_img = render_pil(indices, xs, ys, output_size, font, chars, progress, progress_step)
+    output_img = plan.shrink(output_img)
+
+    progress.finish()
+
+    if logs:
+        print ("Progress: %.4f%%" % progress.total())
+        print ("Time took: %.4f secs" % (time.time() - start_time))
+
+    return output_img
+
 def convert_image(img=None, image_reducer=10, fontSize=10, spacing=1.1, maxsize=None,
-                    chars=" .*:+%S0#@", logs=False, threads=4, progress_tracker=None):
+                    chars=" .*:+%S0#@", logs=False, threads=4, progress_tracker=None, renderer="pil",
+                    output_format="image", font_path=None, timings=None, progress_callback=None, cancel_check=None,
+                    sampling="point"):
     """Converts a cv2 image object into ASCII art
 
     Parameters
@@ -45,133 +813,49 @@ def convert_image(img=None, image_reducer=10, fontSize=10, spacing=1.1, maxsize=
         - how much font spacing between characters
     maxsize : (int, int)
         - tuple (width, height) representing max image size
+        - the output is drawn at that size right away, with a smaller font (and fewer chars if needed), see plan_output
     chars : string
         - determines the chars to use when converting pixels
         - lowest pixel intensity to highest, from left to right
     logs : bool
         - determines whether or not to print progress logs
     threads : int
-        - determines how many threads to run on (multithreading)
-    progress_tracker : multiprocessing.Value
+        - no longer used, mapping pixels to chars is a single NumPy operation (see image_to_indices)
+        - kept so existing callers don't break
+    progress_tracker : progress.ProgressTracker
         - used to track overall conversion progress between all processes/threads
-        - Value("f", 0, lock=True)
+        - written through slot 0 of the tracker
+    renderer : string
+        - determines how characters are drawn onto the final image
+        - "pil" draws every character with PIL's draw.text()
+        - "atlas" rasterizes each char once and builds the image with NumPy (see render_atlas)
+    output_format : string
+        - "image" returns a PIL image
+        - "text", "ansi" or "html" return a string instead, without loading fonts or drawing anything
+        - maxsize and renderer only apply to "image"
+    font_path : string
+        - path to a monospace .ttf/.otf font to draw with. Default is the bundled Noto Mono (DEFAULT_FONT_PATH)
+    timings : timings.StageTimings
+        - if given, wall/CPU time and pixel/cell counts of every stage (map, render...) are added to it
+    progress_callback : function
+        - if given, called with the overall progress (0 - 100) every time it changes
+    cancel_check : function
+        - if given, called while converting. Once it returns True the conversion stops with progress.ConversionCanceled
+    sampling : string
+        - how the pixels of every cell become one intensity
+        - "point" (default) takes one pixel per cell
+        - "area" averages every pixel of the cell. Smoother, with less aliasing, see image_to_indices
     """
     
     try:
-        if logs:
-            print ("Converting image...")
-            start_time = time.time()
-        rows = len(img)
-        cols = len(img[0])
-
-        # reducer takes image_reducer percentage, and will skip nth pixels when converting
-        reducer = int(100 / image_reducer)
-        # set up image scaling based on font size and line spacing
-        scale = fontSize * 0.8 / reducer * spacing
-        # create new image with black bacground (because white text on black looks cooler)
-        output_img = Image.new("L", (int(cols * scale), int(rows * scale)), color=0)
-        draw = ImageDraw.Draw(output_img)
-        # load ttf font
-        font = ImageFont.truetype("./NotoMono-Regular.ttf", fontSize, encoding="unic")
-
-        # defines the subsets of pixel intensities
-        # Can vary depending on max pixel intensity or length of char set
-        div = np.amax(img) / (len(chars) - 1)
-
-        # will be used to track our overall conversion progress
-        if progress_tracker is None:
-            progress_tracker = Value("f", 0, lock=True)
-        progress_step = 100 / (rows / reducer * 2)
-
-        final_results = []
-        def convert_rows(start, end, progress_tracker):
-            """Small function that converts a subset of rows into characters. Used in multithreading
-            Does not draw to image yet. Just calculates which rows/cols have which chars
-
-            Creates the final array of characters like so
-            - col = (colNumber, char)
-            - col_results = [col, ...]
-            - row = (rowNumber, col_results)
-            - results = [row, ....]
-            - final_results = [results, ...] (length = number of threads)
-            - final_results = [
-                [
-                    (rowNumber, [
-                        (colNumber, char),
-                        (colNumber, char),
-                        (colNumber, char),
-                        ...
-                    ]),
-                    (rowNumber, [
-                        (colNumber, char),
-                        (colNumber, char),
-                        (colNumber, char),
-                        ...
-                    ]),
-                    ...
-                ],
-                ...
-            ]
-            """
-            rows = end - start
-            results = []
-            process_start = time.process_time()
-            for row in range(start, end, reducer):
-                col_results = []
-                currentRow = row * scale
-                for col in range(0, cols, reducer):
-                    val = int(img[row, col] / div)
-                    col_results.append((col * scale, chars[val]))
-                results.append((currentRow, col_results))
-                with progress_tracker.get_lock():
-                    progress_tracker.value += progress_step
-                    if logs : print ("Progress: %.4f%%" % progress_tracker.value, end="\r")
-            final_results.append(results)
-
-        # split up jobs with multithreading
-        batches = threads
-        rows_per_batch = int(rows / batches)
-        threads = []
-        for batch in range(batches):
-            starting = rows_per_batch * batch
-            convert_thread = threading.Thread(target=convert_rows, args=(
-                starting,
-                starting + rows_per_batch,
-                progress_tracker
-            ))
-            convert_thread.start()
-            threads.append(convert_thread)
-        for t in threads:
-            t.join()
-        
-        # after we converted, draw onto image (single thread)
-        for r in range(1, len(final_results) + 1):
-            result = final_results[r - 1]
-            for row in range(len(result)):
-                currentRow = result[row][0]
-                cols = result[row][1]
-                for col in cols:
-                    currentCol = col[0]
-                    val = col[1]
-                    draw.text((currentCol, currentRow), val, 255, font=font)
-                with progress_tracker.get_lock():
-                    progress_tracker.value += progress_step
-                    if logs : print ("Progress: %.4f%%" % progress_tracker.value, end="\r")
-
-        # set max image
-        if (maxsize is not None):
-            output_img.thumbnail(maxsize)
-
-        # when we are done, there might be some rounding errors when converting some stuff to integers, thus it doesn't appear to be done
-        # So we just simply set it to 100
-        with progress_tracker.get_lock():
-            progress_tracker.value = 100
-        
-        if logs:
-            print ("Progress: %.4f%%" % progress_tracker.value)
-            print ("Time took: %.4f secs" % (time.time() - start_time))
-
-        return output_img
+        return _convert_image(
+            img, image_reducer, fontSize, spacing, maxsize, chars,
+            logs, progress_tracker, renderer, output_format, font_path, timings,
+            progress_callback, cancel_check, sampling
+        )
+    except ConversionCanceled:
+        # not an error, whoever asked for it handles it
+        raise
     except Exception as e:
         # don't know what exceptions may pop up
         print ("")
@@ -179,9 +863,137 @@ def convert_image(img=None, image_reducer=10, fontSize=10, spacing=1.1, maxsize=
         print (e)
         exit(0)
 
+def _image_shape(image_path):
+    """Returns (rows, cols) of an image from its header alone, as OpenCV would load it (EXIF orientation applied).
+    None if PIL can't tell"""
+    try:
+        with Image.open(image_path) as header:
+            cols, rows = header.size
+            # orientations 5 to 8 are rotated by 90 degrees
+            if header.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                rows, cols = cols, rows
+        return rows, cols
+    except Exception:
+        return None
+
+def read_image(image_path, output_format="image", image_reducer=10, fontSize=10, spacing=1.1, maxsize=None, sampling="point"):
+    """Loads an image for converting it with the given parameters (see convert_image)
+
+    With "area" sampling, cells are averaged anyway, so JPEGs whose cells are at least 2 x 2 pixels are decoded
+    at 1/2, 1/4 or 1/8 of their size right away (libjpeg scales while decoding, for a fraction of the time and memory)
+
+    Returns
+    ---------
+    (numpy.ndarray, (int, int), int)
+        - the image (None if it couldn't be read), (rows, cols) of the full size image, and how many times smaller
+        the image was decoded (1 if it wasn't)
+    """
+    color = output_format == "ansi"
+    # ansi output keeps the original colors, everything else only needs intensities
+    flags = cv2.IMREAD_COLOR if color else 2
+    if sampling == "area" and os.path.splitext(image_path)[1].lower() in REDUCED_DECODE_EXT:
+        shape = _image_shape(image_path)
+        if shape is not None:
+            if output_format in TEXT_FORMATS:
+                reducer = int(100 / image_reducer)
+            else:
+                reducer = plan_output(shape[0], shape[1], image_reducer, fontSize, spacing, maxsize).reducer
+            scale = max([scale for scale in REDUCED_DECODE_FLAGS[color] if reducer % scale == 0], default=1)
+            if scale > 1:
+                img = cv2.imread(image_path, REDUCED_DECODE_FLAGS[color][scale])
+                # every cell has to line up with whole reduced pixels, otherwise read it like any other image
+                if img is not None and img.shape[:2] == (-(-shape[0] // scale), -(-shape[1] // scale)):
+                    return img, shape, scale
+    img = cv2.imread(image_path, flags)
+    return img, (img.shape[:2] if img is not None else None), 1
+
+def _convert_image_tiled(img, output_path, image_reducer=10, fontSize=10, spacing=1.1, maxsize=None,
+                        chars=" .*:+%S0#@", logs=False, progress_tracker=None, renderer="pil", font_path=None,
+                        timings=None, progress_callback=None, cancel_check=None, threads=4, sampling="point",
+                        source_shape=None, decode_scale=1):
+    """Same as _convert_image followed by saving the image to output_path, except the image is drawn and saved
+    a strip at a time (see render_strips and strip_writer.py), so it never has to be in memory as a whole.
+    output_path has to be a format the strip writers know (see strip_output_path)"""
+    if timings is None:
+        timings = StageTimings()
+    if logs:
+        print ("Converting image in strips...")
+        start_time = time.time()
+    rows, cols = (len(img), len(img[0])) if source_shape is None else source_shape
+
+    if progress_tracker is None:
+        progress = ProgressWriter(logs=logs, callback=progress_callback, cancel_check=cancel_check)
+    else:
+        progress = progress_tracker.writer(logs=logs, callback=progress_callback, cancel_check=cancel_check)
+
+    plan = plan_output(rows, cols, image_reducer, fontSize, spacing, maxsize)
+    width, height = plan.size
+
+    # the atlas tells which rows of chars reach into a strip, whatever renderer draws them
+    with timings.stage("font"):
+        font = get_font(plan.fontSize, font_path)
+        atlas = get_glyph_atlas(plan.fontSize, chars, font_path)
+
+    with timings.stage("map", pixels=len(img) * len(img[0])) as counts:
+        indices = image_to_indices(img, image_reducer, chars, plan.reducer // decode_scale, sampling)
+        counts["cells"] = indices.size
+    # mapping is the first half of our progress, every row of pixels drawn and saved is part of the second half
+    progress_step = 100 / (height * 2) if height > 0 else 0
+    progress.add(progress_step * height)
+
+    writer = open_strip_writer(output_path, plan.size)
+    strips = render_strips(indices, plan.xs, plan.ys, plan.size, atlas, renderer, font, chars, threads=threads)
+    try:
+        while True:
+            with timings.stage("render") as counts:
+                strip = next(strips, None)
+                counts["pixels"] = strip.size if strip is not None else 0
+            if strip is None:
+                break
+            with timings.stage("save", pixels=strip.size):
+                writer.write(strip)
+            progress.add(progress_step * len(strip))
+        with timings.stage("save") as counts:
+            writer.close()
+            counts["bytes"] = os.path.getsize(output_path)
+    except BaseException:
+        strips.close()
+        writer.discard()
+        raise
+
+    progress.finish()
+
+    if logs:
+        print ("Progress: %.4f%%" % progress.total())
+        print ("Time took: %.4f secs" % (time.time() - start_time))
+
+    return output_path
+
+def _should_tile(shape, image_reducer, fontSize, spacing, maxsize, output_format, tiled):
+    """Whether an image of shape (rows, cols) should be converted a strip at a time (see _convert_image_tiled).
+    tiled forces it either way, None leaves it to the size of the output (TILED_MIN_PIXELS)"""
+    if output_format != "image" or tiled is False:
+        return False
+    plan = plan_output(shape[0], shape[1], image_reducer, fontSize, spacing, maxsize)
+    # outputs smaller than a char are drawn whole (see plan_output), and they're tiny anyway
+    if plan.render_size != plan.size:
+        return False
+    width, height = plan.size
+    return bool(tiled) or width * height >= TILED_MIN_PIXELS
+
+def _save_output(output, output_format, output_path):
+    """Writes a converted image (or text, for TEXT_FORMATS) to output_path"""
+    if output_format in TEXT_FORMATS:
+        with open(output_path, "w", encoding="utf-8", newline="\n") as output_file:
+            output_file.write(output)
+    else:
+        output.save(output_path)
+
 def convert_image_path_and_save(image_path, output_path="output.jpg", override=False,
                                 image_reducer=10, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@",
-                                logs=False, threads=4, progress_tracker=None):
+                                logs=False, threads=4, progress_tracker=None, renderer="pil", output_format=None,
+                                font_path=None, timings=None, progress_callback=None, cancel_check=None, tiled=None,
+                                sampling="point"):
     """Converts an image from a given path into ASCII art and saves it to disk
 
     Parameters
@@ -190,33 +1002,299 @@ def convert_image_path_and_save(image_path, output_path="output.jpg", override=F
         - path to image to convert
     output_file : string
         - filename/path to output the final result
-        - if extension is not specified, will automatically save as .jpg
+        - if extension is not specified, will automatically save as .jpg (or the extension of output_format)
+        - "-" writes text formats to stdout instead
+    output_format : string
+        - one of OUTPUT_FORMATS. If None, it is picked from the output_path extension
+        - .txt is "text", .ans/.ansi is "ansi", .html/.htm is "html", anything else is "image"
+    threads : int
+        - number of strips drawn at once when the image is drawn in strips
+    tiled : bool
+        - True draws and saves the image a strip at a time (see render_strips), so the whole output is never in memory at once.
+        Only .png and .tif/.tiff can be saved that way, any other extension is swapped for .png (see strip_output_path)
+        - False always draws the whole image at once
+        - None (default) draws in strips if the output has more than TILED_MIN_PIXELS pixels
+    sampling : string
+        - same as convert_image. With "area", JPEGs are decoded at a reduced scale when the cells allow it (see read_image)
     all other parameters found in convert_image
+
+    Returns the path the output was saved to, which differs from output_path if it already existed (see override)
+    or the image was drawn in strips
     """
 
     # check if the file actually exists first
-    if os.path.isfile(image_path):
-        if logs : print ("Loading image...")
-        img = cv2.imread(image_path, 2)
-        output = convert_image(
-            img, image_reducer=image_reducer, fontSize=fontSize, spacing=spacing, maxsize=maxsize, chars=chars,
-            logs=logs, threads=threads, progress_tracker=progress_tracker
+    if not os.path.isfile(image_path):
+        print ("File", image_path, "does not exist!")
+        exit(0)
+    try:
+        return _convert_image_path_and_save(
+            image_path, output_path, override, image_reducer, fontSize, spacing, maxsize, chars,
+            logs, progress_tracker, renderer, output_format, font_path, timings, progress_callback, cancel_check,
+            threads, tiled, sampling
+        )
+    except ConversionCanceled:
+        raise
+    except Exception as e:
+        print ("")
+        print ("Uh oh image converting went wrong!")
+        print (e)
+        exit(0)
+
+def _convert_image_path_and_save(image_path, output_path="output.jpg", override=False,
+                                image_reducer=10, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@",
+                                logs=False, progress_tracker=None, renderer="pil", output_format=None,
+                                font_path=None, timings=None, progress_callback=None, cancel_check=None,
+                                threads=4, tiled=None, sampling="point"):
+    """Does the actual work of convert_image_path_and_save, but raises instead of exiting,
+    so it can run inside a long lived process (like a warm worker, see jobs.py). Returns the path the output was saved to"""
+    if not os.path.isfile(image_path):
+        raise FileNotFoundError(image_path)
+    if timings is None:
+        timings = StageTimings()
+    if output_format is None:
+        output_format = _output_format_from_path(output_path)
+    if logs : print ("Loading image...")
+    with timings.stage("read", bytes=os.path.getsize(image_path)) as counts:
+        img, source_shape, decode_scale = read_image(
+            image_path, output_format, image_reducer, fontSize, spacing, maxsize, sampling
+        )
+        counts["pixels"] = img.shape[0] * img.shape[1] if img is not None else 0
+    if img is None:
+        raise ValueError("could not read image " + image_path)
+    if _should_tile(source_shape, image_reducer, fontSize, spacing, maxsize, output_format, tiled):
+        # strips are saved as soon as they're drawn, so the output path is needed up front
+        strip_path = strip_output_path(output_path)
+        if strip_path != output_path and logs:
+            print ("Can't save", os.path.splitext(output_path)[1] or ".jpg", "a strip at a time, saving as .png instead")
+        final_output_path = _final_output_path(strip_path, output_format, override, logs)
+        _convert_image_tiled(
+            img, final_output_path, image_reducer, fontSize, spacing, maxsize, chars,
+            logs, progress_tracker, renderer, font_path, timings,
+            progress_callback, cancel_check, threads, sampling, source_shape, decode_scale
         )
-        if logs : print ("Saving image...")
-        # if extension was not specified, automatically assign .jpg
-        output_name, output_ext = os.path.splitext(output_path)
-        if output_ext == "":
-            output_ext = ".jpg"
-        # if final output path was specified, then modify it (append _Copy to it)
-        final_output_path = output_name + output_ext
-        while not override and os.path.isfile(final_output_path):
-            if logs : print (final_output_path, "already exists!")
-            final_output_path = os.path.splitext(final_output_path)[0] + "_Copy" + output_ext
-        output.save(final_output_path)
         if logs : print ("Saved to", final_output_path)
+        return final_output_path
+    output = _convert_image(
+        img, image_reducer, fontSize, spacing, maxsize, chars,
+        logs, progress_tracker, renderer, output_format, font_path, timings,
+        progress_callback, cancel_check, sampling, source_shape, decode_scale
+    )
+    if output_format in TEXT_FORMATS and output_path == "-":
+        sys.stdout.write(output)
+        sys.stdout.flush()
+        return output_path
+    if logs : print ("Saving image...")
+    final_output_path = _final_output_path(output_path, output_format, override, logs)
+    with timings.stage("save") as counts:
+        _save_output(output, output_format, final_output_path)
+        counts["bytes"] = os.path.getsize(final_output_path)
+    if logs : print ("Saved to", final_output_path)
+    return final_output_path
+
+def _final_output_path(output_path, output_format, override=False, logs=False):
+    # if extension was not specified, automatically assign .jpg
+    output_name, output_ext = os.path.splitext(output_path)
+    if output_ext == "":
+        output_ext = TEXT_FORMATS[output_format][0] if output_format in TEXT_FORMATS else ".jpg"
+    # if final output path was specified, then modify it (append _Copy to it)
+    final_output_path = output_name + output_ext
+    while not override and os.path.isfile(final_output_path):
+        if logs : print (final_output_path, "already exists!")
+        final_output_path = os.path.splitext(final_output_path)[0] + "_Copy" + output_ext
+    return final_output_path
+
+def _is_inside(path, folder):
+    path = os.path.abspath(path)
+    folder = os.path.abspath(folder)
+    return path != folder and os.path.commonpath([path, folder]) == folder
+
+def find_images(inputs, exclude=None):
+    """Expands files, directories and glob patterns into a sorted list of image paths
+
+    Parameters
+    ---------
+    inputs : list of strings
+        - files are kept as is
+        - directories are searched recursively for files with an IMG_EXT extension
+        - anything else is treated as a glob pattern (** matches any number of folders)
+    exclude : string
+        - folder whose files are left out, even if an input matches them.
+          convert_images passes its output folder, so converting a folder that holds it doesn't convert old outputs again
+    """
+    found = set()
+    for path in inputs:
+        if os.path.isfile(path):
+            found.add(path)
+            continue
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(glob.escape(path), "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(path, recursive=True)
+        for match in matches:
+            if os.path.isfile(match) and os.path.splitext(match)[1].lower() in IMG_EXT:
+                found.add(match)
+    if exclude is not None:
+        found = [path for path in found if not _is_inside(path, exclude)]
+    return sorted(found)
+
+def _batch_output_paths(image_paths, output_folder, output_ext):
+    """Maps every input to a path inside output_folder, keeping the folder structure below their common parent
+    so same named images from different folders don't overwrite each other"""
+    if len(image_paths) == 0:
+        return []
+    parents = [os.path.dirname(os.path.abspath(path)) for path in image_paths]
+    root = os.path.commonpath(parents)
+    return [
+        os.path.join(output_folder, os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0] + output_ext)
+        for path in image_paths
+    ]
+
+def _is_up_to_date(image_path, output_path):
+    return os.path.isfile(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(image_path)
+
+def _batch_worker_init(fontSize, chars, font_path, renderer):
+    # load the font (and atlas) once per worker instead of once per image
+    if renderer == "atlas":
+        preload_font(font_path, (fontSize,), chars)
     else:
-        print ("File", image_path, "does not exist!")
-        exit(0)
+        get_font(fontSize, font_path)
+
+def _batch_convert(task):
+    """Converts one image for convert_images. Runs in a pool worker, so errors are returned instead of raised"""
+    image_path, output_path, convert_args, output_format = task
+    timings = StageTimings()
+    try:
+        (image_reducer, fontSize, spacing, maxsize, chars, logs, progress_tracker, renderer, output_format, font_path,
+            sampling) = convert_args
+        with timings.stage("read", bytes=os.path.getsize(image_path)) as counts:
+            img, source_shape, decode_scale = read_image(
+                image_path, output_format, image_reducer, fontSize, spacing, maxsize, sampling
+            )
+            if img is None:
+                raise ValueError("could not read image")
+            counts["pixels"] = img.shape[0] * img.shape[1]
+        output_folder = os.path.dirname(output_path)
+        if output_folder != "" : os.makedirs(output_folder, exist_ok=True)
+        tiled = _should_tile(source_shape, image_reducer, fontSize, spacing, maxsize, output_format, None)
+        if tiled:
+            output_path = strip_output_path(output_path)
+        # write under a temporary name first, so a half written output never looks up to date
+        output_name, output_ext = os.path.splitext(output_path)
+        partial_path = output_name + ".part" + output_ext
+        if tiled:
+            # every pool worker is busy with an image of its own already, so strips are drawn one at a time
+            _convert_image_tiled(
+                img, partial_path, image_reducer, fontSize, spacing, maxsize, chars,
+                logs, progress_tracker, renderer, font_path, timings, threads=1,
+                sampling=sampling, source_shape=source_shape, decode_scale=decode_scale
+            )
+            os.replace(partial_path, output_path)
+        else:
+            output = _convert_image(
+                img, image_reducer, fontSize, spacing, maxsize, chars,
+                logs, progress_tracker, renderer, output_format, font_path, timings,
+                sampling=sampling, source_shape=source_shape, decode_scale=decode_scale
+            )
+            with timings.stage("save"):
+                _save_output(output, output_format, partial_path)
+                os.replace(partial_path, output_path)
+        return image_path, output_path, os.path.getsize(image_path), timings.as_dict(), None
+    except Exception as e:
+        return image_path, output_path, 0, timings.as_dict(), str(e)
+
+def convert_images(image_paths, output_folder="output", force=False, processes=4,
+                    image_reducer=10, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@",
+                    logs=False, renderer="pil", output_format=None, font_path=None, timings=None, sampling="point"):
+    """Converts many images into ASCII art on a pool of worker processes, saving each result as soon as it's done
+
+    Parameters
+    ---------
+    image_paths : list of strings
+        - images, directories or glob patterns to convert (see find_images)
+    output_folder : string
+        - folder to save the results in. Folder structure below the inputs' common parent folder is kept
+    force : bool
+        - convert every image, even when its output already exists and is newer than the image
+    processes : int
+        - number of worker processes
+    output_format : string
+        - one of OUTPUT_FORMATS. None is "image", saved as .jpg (.png for images drawn in strips, see strip_output_path)
+    timings : timings.StageTimings
+        - if given, the stages of every image are added to it (CPU time is summed over all workers)
+    all other parameters found in convert_image
+
+    Returns a dict with the number of images converted, skipped and failed, and the throughput
+    """
+    if output_format is None:
+        output_format = "image"
+    output_ext = TEXT_FORMATS[output_format][0] if output_format in TEXT_FORMATS else ".jpg"
+    image_paths = find_images(image_paths, exclude=output_folder)
+    output_paths = _batch_output_paths(image_paths, output_folder, output_ext)
+
+    tasks = []
+    skipped = 0
+    convert_args = (image_reducer, fontSize, spacing, maxsize, chars, False, None, renderer, output_format, font_path, sampling)
+    for image_path, output_path in zip(image_paths, output_paths):
+        # huge images were saved as .png (see _batch_convert)
+        if not force and (_is_up_to_date(image_path, output_path) or _is_up_to_date(image_path, strip_output_path(output_path))):
+            skipped += 1
+        else:
+            tasks.append((image_path, output_path, convert_args, output_format))
+    if logs : print ("Found", len(image_paths), "images,", skipped, "already up to date")
+
+    converted = 0
+    failed = 0
+    total_bytes = 0
+    start_time = time.time()
+    if len(tasks) > 0:
+        processes = max(1, min(processes, len(tasks)))
+        # hand out tasks in small chunks, so thousands of tiny images don't pay one round trip each
+        chunksize = max(1, min(16, len(tasks) // (processes * 4)))
+        with Pool(processes, initializer=_batch_worker_init, initargs=(fontSize, chars, font_path, renderer)) as pool:
+            for image_path, output_path, input_bytes, image_timings, error in pool.imap_unordered(_batch_convert, tasks, chunksize):
+                if timings is not None : timings.merge(image_timings)
+                if error is None:
+                    converted += 1
+                    total_bytes += input_bytes
+                    if logs : print ("[%d/%d]" % (converted + failed, len(tasks)), image_path, "->", output_path)
+                else:
+                    failed += 1
+                    print ("[%d/%d]" % (converted + failed, len(tasks)), "Could not convert", image_path + ":", error)
+    elapsed = time.time() - start_time
+
+    summary = {
+        "converted": converted,
+        "skipped": skipped,
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_sec": converted / elapsed if elapsed > 0 else 0,
+        "mb_per_sec": total_bytes / 1e6 / elapsed if elapsed > 0 else 0
+    }
+    if logs:
+        print ("Converted %d images (%d skipped, %d failed) in %.4f secs" % (converted, skipped, failed, elapsed))
+        print ("Throughput: %.2f images/sec, %.2f MB/sec" % (summary["images_per_sec"], summary["mb_per_sec"]))
+    return summary
+
+def _run_timed(function, args, results_queue, profile_path=None, kwargs=None):
+    """Target of ConvertImageProcess and ConvertVideoProcess. Runs function with a fresh StageTimings
+    (and a profiler, if profile_path is given) and sends the timings and what function returned back through results_queue.
+    kwargs are for parameters that come after timings"""
+    timings = StageTimings()
+    with profile_to(profile_path):
+        result = function(*args, timings=timings, **(kwargs or {}))
+    results_queue.put((timings.as_dict(), result))
+
+def _get_process_results(process, results_queue):
+    """Waits for the (timings, result) of a process started with _run_timed. Returns ({}, None) if it ended without any"""
+    while True:
+        try:
+            return results_queue.get(timeout=0.1)
+        except queue.Empty:
+            if not process.is_alive():
+                try:
+                    return results_queue.get(timeout=0.1)
+                except queue.Empty:
+                    return {}, None
 
 class ConvertImageProcess:
     """Represents an independent process for an image conversion process.
@@ -224,7 +1302,7 @@ class ConvertImageProcess:
 
     Properties
     ----------
-    progress : multiprocessing.Value
+    progress : progress.ProgressTracker
         - stores the progress of the image conversion
     image_path : string
         - stores image_path 
@@ -235,17 +1313,24 @@ class ConvertImageProcess:
         - terminates the conversion process and closes it
     get_progress
         - returns the current progress of the conversion
+    get_timings
+        - waits for the conversion to end and returns its StageTimings as a dict
+    get_output_path
+        - waits for the conversion to end and returns the path the output was saved to (see convert_image_path_and_save)
     """
     def __init__(self, image_path, output_path="output.jpg", override=False,
-                image_reducer=10, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@", logs=False, threads=4):
-        self.progress = Value("f", 0, lock=True)
+                image_reducer=10, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@", logs=False, threads=4,
+                renderer="pil", font_path=None, profile_path=None, sampling="point"):
+        self.progress = ProgressTracker(1)
         self.image_path = image_path
         self.output_path = output_path
-        self._process = Process(target=convert_image_path_and_save, args=(
+        self._results_queue = Queue()
+        self._results = None
+        self._process = Process(target=_run_timed, args=(convert_image_path_and_save, (
             image_path, output_path, override,
             image_reducer, fontSize, spacing, maxsize, chars,
-            logs, threads, self.progress
-        ))
+            logs, threads, self.progress, renderer, None, font_path
+        ), self._results_queue, profile_path, {"sampling": sampling}))
     
     def get_process(self):
         return self._process
@@ -262,99 +1347,765 @@ class ConvertImageProcess:
         self._process.close()
     
     def get_progress(self):
-        with self.progress.get_lock():
-            return self.progress.value
+        return self.progress.get()
 
-def _save_frames(start, end, video, output_folder,
-                frame_frequency, logs=False, progress_tracker=None, progress_step=None):
-    """Takes a portion of a video and saves the frames as .jpg on disk
+    def _get_results(self):
+        if self._results is None:
+            self._results = _get_process_results(self._process, self._results_queue)
+        return self._results
 
-    Parameters
-    ---------
-    start : int
-        - starting frame to convert video (inclusive)
-    end : int
-        - ending frame to convert video (exclusive)
-    video : string
-        - path to video to get frames from
-    output_folder : string
-        - path to save frames to
+    def get_timings(self):
+        return self._get_results()[0]
+
+    def get_output_path(self):
+        return self._get_results()[1]
+
+class FrameSampler:
+    """Picks which frames of a video get converted. Frames are given to it in order, with their timestamps,
+    and each one gets a number of samples: 0 skips it, more than 1 repeats it
+
+    By default every frame_frequency-th frame is kept. With target_fps, the output gets one frame every 1 / target_fps secs
+    of the video, each the first frame shown at or after that time. This follows the timestamps, so variable frame rate
+    videos keep their timing, and frames are repeated if the video has gaps longer than 1 / target_fps
+
+    Properties
+    ----------
     frame_frequency : int
-        - determines how often to save frames
-        - to retain all frames, keep 1
-    logs : bool
-        - determines whether or not to print progress logs
-    progress_tracker : multiprocessing.Value("f")
-        - used to track overall conversion progress between all processes/threads
-        - Value("f", 0, lock=True)
-    progress_step : float
-        - amount to progress step
+        - keep every frame_frequency-th frame
+    target_fps : float
+        - if given, frame rate of the output instead. frame_frequency is ignored
+
+    Methods
+    --------
+    take
+        - returns how many samples the next frame is
+    select
+        - returns the frame number of every sample of a whole video
+    output_fps
+        - returns the frame rate the samples should be played at
+    """
+    def __init__(self, frame_frequency=1, target_fps=None):
+        self.frame_frequency = max(int(frame_frequency), 1)
+        self.target_fps = target_fps
+        self.reset()
+
+    def reset(self):
+        self._frames = 0
+        self._ticks = 0
+        self._start = None
+
+    def take(self, timestamp=0.0):
+        """timestamp is in secs"""
+        self._frames += 1
+        if self.target_fps is None:
+            return 1 if self._frames % self.frame_frequency == 0 else 0
+        if self._start is None:
+            self._start = timestamp
+        # every output frame time (tick) up to this frame's time that isn't covered yet belongs to this frame.
+        # A bit of leeway, so timestamps that are rounded down don't skip their tick
+        elapsed = timestamp - self._start + 1e-6
+        samples = 0
+        while self._ticks / self.target_fps <= elapsed:
+            samples += 1
+            self._ticks += 1
+        return samples
+
+    def select(self, timestamps):
+        self.reset()
+        samples = []
+        for frame_number, timestamp in enumerate(timestamps):
+            samples.extend([frame_number] * self.take(timestamp))
+        self.reset()
+        return samples
+
+    def output_fps(self, samples, duration, fps):
+        """samples is the number of samples, duration the length of the video in secs and fps its (average) frame rate"""
+        if self.target_fps is not None:
+            return self.target_fps
+        # samples spread over the whole video, so it lasts exactly as long as the original
+        if samples > 0 and duration > 0:
+            return samples / duration
+        return fps / self.frame_frequency
+
+class TemporalMapper:
+    """Maps consecutive video frames to char indices. Frames have to be given in order
+
+    With hysteresis, a cell keeps its previous char until its intensity moves more than hysteresis levels
+    away from the intensity that last picked it. This stops cells from flickering between two chars
+    when the intensity hovers around the border between them
+
+    Properties
+    ----------
+    image_reducer : float
+        - percentage of pixels to keep
+    chars : string
+        - chars the indices refer to
+    hysteresis : int
+        - how many intensity levels (0 - 255) a cell can change before it gets a new char. 0 turns it off
+    reducer : int
+        - if given, every reducer-th pixel is kept instead, whatever image_reducer says (see OutputPlan)
+    sampling : string
+        - one of SAMPLINGS, see image_to_indices
+
+    Methods
+    --------
+    map
+        - returns the char indices of the next frame
     """
-    # we open a separate and independent video capture for each process
-    capture = cv2.VideoCapture(video)
-    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
-    total_frames = end - start
-    frames_count = 0
-    frames_included = 0
-    # we utitlize multithreading for writing to disk
-    threads = []
-    for i in range(total_frames):
-        ret, frame = capture.read()
-        if ret is False:
+    def __init__(self, image_reducer=10, chars=" .*:+%S0#@", hysteresis=0, reducer=None, sampling="point"):
+        self.image_reducer = image_reducer
+        self.chars = chars
+        self.hysteresis = hysteresis
+        self.reducer = int(100 / image_reducer) if reducer is None else reducer
+        self.sampling = sampling
+        self._indices = None
+        self._reference = None
+
+    def map(self, frame):
+        indices = image_to_indices(frame, self.image_reducer, self.chars, self.reducer, self.sampling)
+        if self.hysteresis <= 0:
+            return indices
+        intensities = _sample_cells(_to_grayscale(frame), self.reducer, self.sampling).astype(np.int32)
+        if self._indices is None or self._indices.shape != indices.shape:
+            self._indices = indices
+            self._reference = intensities
+            return indices
+        changed = np.abs(intensities - self._reference) > self.hysteresis
+        self._indices = np.where(changed, indices, self._indices)
+        self._reference = np.where(changed, intensities, self._reference)
+        return self._indices
+
+class IncrementalRenderer:
+    """Renders consecutive char index matrices of one video, only redrawing the cells whose char changed
+    since the last matrix it rendered (plus neighbours whose glyphs reach into them). Always draws with a GlyphAtlas
+
+    Methods
+    --------
+    render
+        - returns the image for the given char indices, and how many cells had to be drawn
+    """
+    def __init__(self, frame_shape, image_reducer=10, fontSize=10, spacing=1.1, chars=" .*:+%S0#@", font_path=None,
+                maxsize=None):
+        # drawn at the final size right away (see plan_output)
+        self._plan = plan_output(frame_shape[0], frame_shape[1], image_reducer, fontSize, spacing, maxsize)
+        self._canvas = AtlasCanvas(self._plan.xs, self._plan.ys, self._plan.render_size,
+                                   get_glyph_atlas(self._plan.fontSize, chars, font_path))
+        self._indices = None
+
+    def render(self, indices):
+        if self._indices is None or self._indices.shape != indices.shape:
+            self._canvas.draw(indices)
+            cells_drawn = indices.size
+        else:
+            cells = indices != self._indices
+            self._canvas.draw(indices, cells)
+            cells_drawn = int(np.count_nonzero(cells))
+        # indices may live in shared memory that gets reused, so keep our own copy
+        self._indices = np.array(indices)
+        return self._plan.shrink(self._canvas.image()), cells_drawn
+
+def _frame_worker(task_queue, result_queue, parent_pid):
+    """Loop run by every FramePool worker process. Converts frames found in shared memory until it gets None,
+    or until the process that started it is gone"""
+    # workers can be forked from a process with its own SIGTERM handler (like a warm RQ worker, see worker.py),
+    # which would keep them alive when their parent exits and terminates them
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    attached = {}
+    # incremental jobs keep the last canvas this worker drew
+    renderers = {}
+    while True:
+        try:
+            task = task_queue.get(timeout=1)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                break
             continue
-        frames_count += 1
-        if frames_count % frame_frequency == 0:
-            frames_included += 1
-            filename = output_folder + str(frames_included) + ".jpg"
-            write_thread = threading.Thread(target=cv2.imwrite, args=(filename, frame))
-            write_thread.start()
-            threads.append(write_thread)
-            with progress_tracker.get_lock():
-                progress_tracker.value += progress_step
-                if logs : print ("Progress: %.4f%%" % progress_tracker.value, end="\r")
-    for t in threads:
-        t.join()
-    capture.release()
+        if task is None:
+            break
+        job_id, shm_name, slot, frame_number = task[:4]
+        try:
+            if shm_name not in attached:
+                # a worker only ever works on one ring buffer at a time, so let go of older ones
+                for name in list(attached):
+                    attached.pop(name).close()
+                renderers.clear()
+                attached[shm_name] = _attach_shared_memory(shm_name)
+            start_wall = time.perf_counter()
+            start_cpu = time.thread_time()
+            output_shape, cells_drawn = _convert_slot(attached[shm_name].buf, *task[4:], renderers=renderers, job_id=job_id)
+            convert_time = (time.perf_counter() - start_wall, time.thread_time() - start_cpu)
+            result_queue.put((job_id, slot, frame_number, output_shape, cells_drawn, convert_time, None))
+        except Exception as e:
+            result_queue.put((job_id, slot, frame_number, None, None, None, repr(e)))
+    for shm in attached.values():
+        shm.close()
+
+def _attach_shared_memory(name):
+    try:
+        # the process that created the memory is in charge of cleaning it up, not us
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks it. Workers are forked after the resource tracker is started,
+        # so they share it with the creator and the extra registration is harmless
+        return shared_memory.SharedMemory(name=name)
+
+def _convert_slot(buffer, input_shape, input_offset, output_offset, output_capacity, convert_args, incremental,
+                renderers=None, job_id=None):
+    """Converts the frame stored in one ring buffer slot and writes the result back into the same slot
+    For incremental jobs the slot holds char indices instead of a frame, which are drawn with an IncrementalRenderer
+    Returns the shape of the converted frame, and how many cells were drawn"""
+    frame = np.ndarray(input_shape, dtype=np.uint8, buffer=buffer, offset=input_offset)
+    if incremental:
+        frame_shape, image_reducer, fontSize, spacing, maxsize, chars, font_path = convert_args
+        if job_id not in renderers:
+            renderers[job_id] = IncrementalRenderer(frame_shape, image_reducer, fontSize, spacing, chars, font_path, maxsize)
+        output, cells_drawn = renderers[job_id].render(frame)
+        output = np.asarray(output)
+    else:
+        output = np.asarray(_convert_image(frame, *convert_args))
+        cells_drawn = None
+    if output.size > output_capacity:
+        raise ValueError("converted frame is larger than its ring buffer slot")
+    np.ndarray(output.shape, dtype=np.uint8, buffer=buffer, offset=output_offset)[:] = output
+    return output.shape, cells_drawn
+
+class FramePool:
+    """Represents a set of long lived processes that convert video frames to ASCII art.
+    Frames go to the workers and come back through shared memory ring buffers (see FrameJob),
+    so only a few small numbers are pickled per frame. Every worker takes the next frame as soon as it's free,
+    so the work stays balanced even when some frames take longer than others
+
+    Properties
+    ----------
+    processes : int
+        - number of worker processes
+
+    Methods
+    --------
+    start_job
+        - sets up a ring buffer for one video and returns a FrameJob to submit frames to
+    is_alive
+        - returns whether every worker process is still running
+    close
+        - stops all worker processes
+    """
+    def __init__(self, processes=4):
+        self.processes = processes
+        self._task_queue = Queue()
+        self._result_queue = Queue()
+        self._job_count = 0
+        # make sure workers share our resource tracker instead of starting their own (see _attach_shared_memory)
+        resource_tracker.ensure_running()
+        self._workers = []
+        for i in range(processes):
+            p = Process(target=_frame_worker, args=(self._task_queue, self._result_queue, os.getpid()))
+            p.daemon = True
+            p.start()
+            self._workers.append(p)
+
+    def start_job(self, input_shape, output_capacity, convert_args, slots=None, incremental=False):
+        """Returns a FrameJob with its own ring buffer
+
+        Parameters
+        ---------
+        input_shape : (int, int)
+            - (height, width) of the grayscale frames (or char index matrices) that will be submitted
+        output_capacity : int
+            - max number of pixels in a converted frame
+        convert_args : tuple
+            - arguments for _convert_image after the image, see convert_image
+            - if incremental, (frame shape, image_reducer, fontSize, spacing, maxsize, chars, font_path) instead
+        slots : int
+            - number of frames that can be in the pipeline at once. Default is 4 per process
+        incremental : bool
+            - if True, char index matrices are submitted instead of frames (see TemporalMapper),
+            and every worker only redraws the cells that changed since the last frame it drew
+        """
+        self._job_count += 1
+        if slots is None:
+            slots = self.processes * 4
+        return FrameJob(self, self._job_count, input_shape, output_capacity, convert_args, slots, incremental)
+
+    def is_alive(self):
+        return all(p.is_alive() for p in self._workers)
+
+    def close(self):
+        for p in self._workers:
+            if p.is_alive():
+                self._task_queue.put(None)
+        for p in self._workers:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.kill()
+                p.join()
+        self._task_queue.cancel_join_thread()
+
+class FrameJob:
+    """Represents one video being converted on a FramePool. Holds a ring buffer in shared memory,
+    where every slot has room for one input frame and its converted output
+
+    Methods
+    --------
+    submit
+        - copies a frame into a free slot and hands it to the workers. Waits if every slot is in use
+    get_result
+        - returns the next converted frame from the workers
+    release
+        - marks a slot as free again, once its converted frame is no longer needed
+    close
+        - frees the shared memory
+
+    Properties
+    ----------
+    timings : timings.StageTimings
+        - "convert" stage adds up the time workers spent on every frame of this job
+        - counts input pixels, or drawn cells for incremental jobs
+    """
+    def __init__(self, pool, job_id, input_shape, output_capacity, convert_args, slots, incremental=False):
+        self._pool = pool
+        self.timings = StageTimings()
+        self.id = job_id
+        self.incremental = incremental
+        self.input_shape = tuple(input_shape)
+        self.convert_args = tuple(convert_args)
+        self._input_bytes = int(np.prod(self.input_shape))
+        self._output_capacity = int(output_capacity)
+        self._slot_bytes = self._input_bytes + self._output_capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=max(slots * self._slot_bytes, 1))
+        self._free_slots = queue.Queue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+
+    def submit(self, frame_number, frame, stop=None):
+        """Returns False without submitting if stop (threading.Event) gets set while waiting for a free slot"""
+        frame = np.asarray(frame, dtype=np.uint8)
+        if frame.shape != self.input_shape:
+            raise ValueError("frame has shape %s, expected %s" % (frame.shape, self.input_shape))
+        while True:
+            try:
+                slot = self._free_slots.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop is not None and stop.is_set():
+                    return False
+        input_offset = slot * self._slot_bytes
+        np.ndarray(self.input_shape, dtype=np.uint8, buffer=self._shm.buf, offset=input_offset)[:] = frame
+        self._pool._task_queue.put((
+            self.id, self._shm.name, slot, frame_number,
+            self.input_shape, input_offset, input_offset + self._input_bytes, self._output_capacity,
+            self.convert_args, self.incremental
+        ))
+        return True
+
+    def get_result(self, timeout=None):
+        """Returns (frame number, slot, converted frame, cells drawn) or None if nothing arrived within timeout
+        The converted frame is a view into shared memory, only valid until its slot is released.
+        Cells drawn is only counted for incremental jobs, otherwise it's None"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                remaining = None if deadline is None else max(deadline - time.time(), 0)
+                job_id, slot, frame_number, output_shape, cells_drawn, convert_time, error = self._pool._result_queue.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            # results of earlier jobs that were cancelled are simply dropped
+            if job_id != self.id:
+                continue
+            if error is not None:
+                raise RuntimeError("converting frame %d failed: %s" % (frame_number, error))
+            output_offset = slot * self._slot_bytes + self._input_bytes
+            output = np.ndarray(output_shape, dtype=np.uint8, buffer=self._shm.buf, offset=output_offset)
+            if cells_drawn is None:
+                self.timings.add("convert", *convert_time, frames=1, pixels=self._input_bytes)
+            else:
+                self.timings.add("convert", *convert_time, frames=1, cells=cells_drawn)
+            return frame_number, slot, output, cells_drawn
+
+    def release(self, slot):
+        self._free_slots.put(slot)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+class IndexJob:
+    """Stands in for a FrameJob when frames don't need converting, like for ASCII videos (see ascii_video.py),
+    where the char indices the decoders map frames to are the output. Submitted frames come straight back as results.
+    Has the same fixed number of slots as a FrameJob, so memory stays just as bounded
+
+    Methods
+    --------
+    submit
+        - keeps a copy of a frame in a free slot. Waits if every slot is in use
+    get_result
+        - returns the next submitted frame
+    release
+        - marks a slot as free again
+    close
+        - does nothing, there's no shared memory to free
+    """
+    def __init__(self, input_shape, slots):
+        self.timings = StageTimings()
+        self.incremental = False
+        self.input_shape = tuple(input_shape)
+        self._frames = {}
+        self._results = queue.Queue()
+        self._free_slots = queue.Queue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+
+    def submit(self, frame_number, frame, stop=None):
+        """Returns False without submitting if stop (threading.Event) gets set while waiting for a free slot"""
+        frame = np.asarray(frame, dtype=np.uint8)
+        if frame.shape != self.input_shape:
+            raise ValueError("frame has shape %s, expected %s" % (frame.shape, self.input_shape))
+        while True:
+            try:
+                slot = self._free_slots.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop is not None and stop.is_set():
+                    return False
+        self._frames[slot] = np.array(frame)
+        self._results.put((frame_number, slot))
+        return True
+
+    def get_result(self, timeout=None):
+        """Returns (frame number, slot, frame, None) or None if nothing arrived within timeout"""
+        try:
+            frame_number, slot = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return frame_number, slot, self._frames[slot], None
+
+    def release(self, slot):
+        self._frames.pop(slot, None)
+        self._free_slots.put(slot)
+
+    def close(self):
+        pass
+
+_frame_pool = None
+
+def get_frame_pool(processes=4):
+    """Returns the FramePool shared by every video conversion in this process, starting it if needed"""
+    global _frame_pool
+    if _frame_pool is None or _frame_pool.processes != processes or not _frame_pool.is_alive():
+        if _frame_pool is not None:
+            _frame_pool.close()
+        _frame_pool = FramePool(processes)
+    return _frame_pool
+
+def _close_frame_pool():
+    global _frame_pool
+    if _frame_pool is not None:
+        _frame_pool.close()
+        _frame_pool = None
+
+class FrameWindow:
+    """Keeps the frames submitted to a FrameJob within size frames of the next one to be written.
+    Decoders working on different parts of a video at once would otherwise fill every ring buffer slot
+    with frames the writer can't use yet, while the frame it's waiting for can't get a slot.
+    Frames a decoder can't deliver (the video ended early) are marked missing, so no one waits for them
+
+    Methods
+    --------
+    wait
+        - waits until a frame is allowed in
+    advance
+        - moves the window one frame forward, once the next frame was written (or is missing)
+    skip
+        - marks frames as missing
+    is_missing
+        - returns whether a frame is missing
+    end
+        - returns one past the highest frame submitted or marked missing so far
+    """
+    def __init__(self, size, start=0):
+        # start is the first frame of the window, for windows over only part of the frames
+        self.size = size
+        self.next = start
+        self._end = start
+        self._missing = set()
+        self._condition = threading.Condition()
+
+    def wait(self, frame_number, stop=None):
+        """Returns False if stop (threading.Event) gets set while waiting"""
+        with self._condition:
+            while frame_number >= self.next + self.size:
+                if stop is not None and stop.is_set():
+                    return False
+                self._condition.wait(0.1)
+            self._end = max(self._end, frame_number + 1)
+        return True
+
+    def advance(self):
+        with self._condition:
+            self._missing.discard(self.next)
+            self.next += 1
+            self._condition.notify_all()
+
+    def skip(self, frame_numbers):
+        with self._condition:
+            for frame_number in frame_numbers:
+                self._missing.add(frame_number)
+                self._end = max(self._end, frame_number + 1)
+
+    def is_missing(self, frame_number):
+        with self._condition:
+            return frame_number in self._missing
+
+    def end(self):
+        with self._condition:
+            return self._end
+
+class FrameEncoder:
+    """Writes converted frames to a video on its own thread, so encoding overlaps with collecting and converting frames.
+    Frames are given to it in order, as views into a FrameJob's ring buffer, and their slots are released once written.
+    Holds at most max_frames frames: put waits while it's full, which holds back the pipeline when encoding falls behind
+
+    Properties
+    ----------
+    frames : int
+        - number of frames written so far. Only ever goes up, so it can be read from other threads to follow progress
+    size : (int, int)
+        - (width, height) of the frames written
+
+    Methods
+    --------
+    put
+        - queues the next frame (slot, frame) to be written
+    close
+        - writes everything still queued and waits for it. Raises whatever went wrong while writing
+    """
+    def __init__(self, writer, job, max_frames, timings=None):
+        self._writer = writer
+        self._job = job
+        self._queue = queue.Queue(max(max_frames, 1))
+        self._timings = StageTimings() if timings is None else timings
+        self._error = None
+        self.frames = 0
+        self.size = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self):
+        self._queue.put(StopIteration)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is StopIteration:
+                break
+            slot, img = item
+            item = None
+            try:
+                # after an error, frames are only released, so nothing upstream waits on a slot forever
+                if self._error is None:
+                    if self.size is None:
+                        height, width = img.shape
+                        self.size = (width, height)
+                    with self._timings.stage("encode", frames=1, pixels=img.size):
+                        self._writer.append_data(img)
+                    self.frames += 1
+            except Exception as e:
+                self._error = e
+            finally:
+                # the frame is a view into the slot, so it has to be gone first
+                img = None
+                self._job.release(slot)
+
+# seeking costs about as much as decoding this many frames, so shorter skips are decoded through instead
+SEEK_MIN_FRAMES = 16
+# videos are only split between encoders if every part gets at least this many frames,
+# shorter parts aren't worth starting another ffmpeg process and joining them afterwards
+ENCODE_PART_FRAMES = 500
+
+def concat_videos(video_paths, output_path):
+    """Joins videos encoded with the same settings into one, one after the other, with ffmpeg's concat demuxer.
+    Streams are copied as they are (nothing gets re-encoded), and every part keeps its own timestamps,
+    so the result plays for exactly as long as the parts together"""
+    import imageio_ffmpeg
+    list_path = output_path + ".parts.txt"
+    with open(list_path, "w") as list_file:
+        for video_path in video_paths:
+            # quotes in paths have to be escaped for the concat demuxer
+            list_file.write("file '%s'\n" % os.path.abspath(video_path).replace("'", "'\\''"))
+    try:
+        result = subprocess.run(
+            [imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0",
+            "-i", list_path, "-c", "copy", "-y", output_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError("could not join video parts: " + result.stderr.decode("utf-8", "replace").strip())
 
+def _decode_frames(video_path, sampler, job, window, segments, stop, stats, mapper=None, timings=None,
+                    samples=None, index=None, sample_range=None):
+    """Decodes segments of a video, and submits the frames a FrameSampler picks (as grayscale) to a FrameJob
+    Runs as a thread in the main video process. Several of these can share the segments to decode in parallel
 
-def _convert_batch(batch_folder, frames_per_batch,
-                image_reducer, fontSize, spacing, maxsize, chars,
-                logs=False, progress_tracker=None, progress_step=None):
-    """Converts all images from batch folder to ASCII art
-    Images in folder should be numbered
+    Frames that aren't picked are only grabbed (decoded, but never converted to an image),
+    and with an index, stretches that aren't needed at all are seeked over, keyframe to keyframe
 
     Parameters
     ---------
-    batch_folder : string
-        - path get images from
-        - Images should be numbered 1 to frames_per_batch
-    frames_per_batch : int
-        - number of frames in folder needed to convert
-    logs : bool
-        - determines whether or not to print progress logs
-    progress_tracker : multiprocessing.Value("f")
-        - used to track overall conversion progress between all processes/threads
-        - Value("f", 0, lock=True)
-    progress_step : float
-        - amount to progress step
-    
-    all other parameters found in convert_image
+    video_path : string
+        - path to video to get frames from
+    sampler : FrameSampler
+        - picks the frames to keep, as they're decoded. Only used without samples
+    job : FrameJob
+        - gets every kept frame. Waits whenever its ring buffer is full, which keeps memory usage bounded
+    window : FrameWindow
+        - keeps this decoder from running too far ahead of the others
+    segments : queue.Queue
+        - (start, end) frame ranges to decode, taken in order until it's empty. end can be None for "until the video ends"
+        - with more than one decoder, every range has to start on a keyframe (see VideoIndex.segments)
+    stop : threading.Event
+        - set to stop decoding early
+    stats : dict
+        - "frames_decoded", "frames_included" and "seeks" are counted up as we go, "error" is set if something went wrong
+    mapper : TemporalMapper
+        - if given, frames are mapped to char indices here (in order) and the indices are submitted instead
+        - with hysteresis, it only works with a single decoder, since frames have to be mapped in order
+    timings : timings.StageTimings
+        - "seek", "decode" (and "map" with a mapper) stages are added to it
+    samples : [int, ...]
+        - frame number of every sample, picked up front (see FrameSampler.select). Needs index
+    index : video_index.VideoIndex
+        - keyframes of the video, to know where seeking is possible
+    sample_range : (int, int)
+        - (first, end) sample numbers this decoder may submit, if only part of the samples are its to decode.
+        Segments can reach past it, only the samples inside get submitted
     """
-    for i in range(1, frames_per_batch + 1):
-        filename =  batch_folder + str(i) + ".jpg"
-        convert_image_path_and_save(
-            filename, filename, True,
-            image_reducer, fontSize, spacing, maxsize, chars, logs=False
-        )
-        with progress_tracker.get_lock():
-            progress_tracker.value += progress_step
-            if logs : print ("Progress: %.4f%%" % progress_tracker.value, end="\r")
+    if timings is None:
+        timings = StageTimings()
+    if sample_range is None and samples is not None:
+        sample_range = (0, len(samples))
+    capture = cv2.VideoCapture(video_path)
+    # frame number (in the whole video) the capture reads next
+    position = 0
+
+    def seek(frame_number):
+        nonlocal position
+        with timings.stage("seek", skipped=frame_number - position):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        stats["seeks"] += 1
+        position = frame_number
+
+    def grab():
+        """Decodes the next frame, without turning it into an image. Returns False if the video ended"""
+        nonlocal position
+        with timings.stage("decode", frames=1):
+            if not capture.grab():
+                return False
+        position += 1
+        stats["frames_decoded"] += 1
+        return True
+
+    def retrieve():
+        """Returns the frame grabbed last as a grayscale image, or None if it couldn't be"""
+        with timings.stage("retrieve", frames=1) as counts:
+            ret, frame = capture.retrieve()
+            if ret is False:
+                return None
+            counts["pixels"] = frame.shape[0] * frame.shape[1]
+            # only intensities are needed, and grayscale frames are a third of the size to pass around
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def submit(frame, sample_numbers):
+        if mapper is not None:
+            with timings.stage("map", pixels=frame.shape[0] * frame.shape[1]) as counts:
+                frame = mapper.map(frame)
+                counts["cells"] = frame.size
+        for sample_number in sample_numbers:
+            if not window.wait(sample_number, stop) or not job.submit(sample_number, frame, stop):
+                return False
+            stats["frames_included"] += 1
+        return True
+
+    try:
+        while not stop.is_set():
+            try:
+                start, end = segments.get_nowait()
+            except queue.Empty:
+                break
+            if samples is None:
+                # no index, so samples are picked as we go (always a single decoder reading the whole video)
+                sample_number = 0
+                while not stop.is_set() and grab():
+                    count = sampler.take(capture.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+                    if count == 0:
+                        continue
+                    frame = retrieve()
+                    if frame is None or not submit(frame, range(sample_number, sample_number + count)):
+                        break
+                    sample_number += count
+                continue
+            first = max(bisect.bisect_left(samples, start), sample_range[0])
+            last = min(bisect.bisect_left(samples, end), sample_range[1])
+            sample_number = first
+            while sample_number < last and not stop.is_set():
+                target = samples[sample_number]
+                keyframe = index.keyframe_before(target)
+                if sample_number == first and position != start:
+                    # the frames before this segment belong to other decoders, so they're never grabbed through
+                    seek(keyframe)
+                elif target < position or keyframe - position >= SEEK_MIN_FRAMES:
+                    # within a segment, seeking lands on a keyframe, worth it if that skips a good stretch of frames
+                    seek(keyframe)
+                while position <= target and grab():
+                    pass
+                if position <= target:
+                    break
+                frame = retrieve()
+                if frame is None:
+                    break
+                # with target_fps, a frame can be more than one sample
+                repeats = bisect.bisect_right(samples, target, sample_number, last) - sample_number
+                if not submit(frame, range(sample_number, sample_number + repeats)):
+                    return
+                sample_number += repeats
+            if sample_number < last and not stop.is_set():
+                # the video ended (or broke off) early, so the rest of this segment's samples never come
+                window.skip(range(sample_number, last))
+    except Exception as e:
+        stats["error"] = e
+    finally:
+        capture.release()
 
 def convert_video_path_and_save(video_path, output_path="output.mp4", temp_folder = "./temp",
                                 frame_frequency=24, image_reducer=100, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@",
-                                logs=False, processes=4, progress_tracker=None):
+                                logs=False, processes=4, progress_tracker=None, renderer="pil",
+                                temporal=False, hysteresis=0, font_path=None, decoders=None, target_fps=None, encoders=None,
+                                output_format=None, sampling="point", timings=None, progress_callback=None, cancel_check=None):
     """Converts video from given path to ASCII art and saves it to disk as .txt.mp4 format
 
+    Frames are streamed through the pipeline decode -> convert -> encode without touching the disk.
+    Converting happens on the process wide FramePool (see get_frame_pool), which is reused between videos.
+    At most a few frames per process are held in memory at any time, no matter how long the video is
+
+    ASCII videos (output_format "ascii") skip drawing and encoding: decoders map frames to char indices
+    and those are written as they are (see ascii_video.py)
+
+    Decoding can be split between several threads. The video gets indexed first (see video_index.py),
+    and every thread decodes whole GOPs, so seeking never decodes frames that get thrown away.
+    Frames that aren't kept are never turned into images, and GOPs without any kept frames are seeked over
+
+    Long outputs can be encoded in parts at once as well, each part by its own encoder (with its own decoders),
+    and the parts are joined by copying their streams (see concat_videos). Parts are removed afterwards, even if something failed
+
     Parameters
     --------
     video_path : str
@@ -362,7 +2113,7 @@ def convert_video_path_and_save(video_path, output_path="output.mp4", temp_folde
     output_path : str
         - path to output converted video
     temp_folder : str
-        - folder to use to temporarily store converted images
+        - where the parts of the output are written when there's more than one encoder. Frames are kept in memory
     frame_frequency : int
         - determines how many frames to skip before capturing/converting.
         - Keep at 1 if you want to retain all frames
@@ -371,151 +2122,371 @@ def convert_video_path_and_save(video_path, output_path="output.mp4", temp_folde
     logs : bool
         - determines whether or not to print progress logs
     processes : int
-        - determines how many sub processes to run conversion on (multiprocessing)
-    progress_tracker : multiprocessing.Value("f")
+        - determines how many processes the frame pool runs conversion on (multiprocessing)
+    progress_tracker : progress.ProgressTracker
         - used to track overall conversion progress between all processes/threads
-        - Value("f", 0, lock=True)
+        - needs 2 slots, ProgressTracker(2). Converted frames go to slot 0, written frames to slot 1
+    temporal : bool
+        - only redraw the chars that changed since the previous frame, instead of whole frames
+        - much faster for mostly static videos. Always renders with the glyph atlas (see IncrementalRenderer)
+    hysteresis : int
+        - TEMPORAL ONLY. How many intensity levels (0 - 255) a cell may change before it gets a new char
+        - higher values mean less flicker and less redrawing. 0 turns it off
+    decoders : int
+        - number of threads decoding the video at once. Default is the same as processes
+        - temporal conversions (and videos that can't be indexed) are always decoded by one thread
+    target_fps : float
+        - if given, frames are picked by time instead of frame_frequency: one every 1 / target_fps secs,
+        and the output plays at target_fps. e.g. 0.5 keeps a frame every 2 secs (see FrameSampler)
+    encoders : int
+        - number of parts the output is split into, each encoded at the same time by its own encoder,
+        and joined without re-encoding once they're all done (see concat_videos)
+        - default is one part per ENCODE_PART_FRAMES output frames, up to processes
+        - temporal conversions (and videos that can't be indexed) always have one encoder
+    output_format : string
+        - "video" draws every frame and encodes them (.mp4 or whatever output_path says)
+        - "ascii" saves the char indices of every frame instead, as an ASCII video (see ascii_video.py),
+        without drawing or encoding anything. A fraction of the size, but needs a player that draws the chars
+        - default is picked from the output extension, ASCII_VIDEO_EXT is "ascii", anything else "video"
+    sampling : string
+        - same as convert_image. Frames are always decoded at full size
+    timings : timings.StageTimings
+        - if given, "seek", "decode", "map" (temporal only), "convert", "encode" and "concat" stages are added to it
+        - stages overlap, and "convert" CPU time is summed over all frame pool processes
+    progress_callback : function
+        - if given, called with the overall progress (0 - 100) every time it changes
+    cancel_check : function
+        - if given, called while converting. Once it returns True the conversion stops with progress.ConversionCanceled,
+        and the frame pool is closed (it may still be busy with frames of this video)
     
     all other parameters can be found in convert_image
+
+    Returns
+    ---------
+    dict
+        - summary of the conversion: "output_path", "frames_total" (in the video), "frames_decoded",
+        "frames_included" (converted and written), "fps" (of the output), "decoders", "encoders", "seeks",
+        and for temporal conversions "cells_reused" (fraction of cells that didn't need redrawing)
     """
 
+    try:
+        return _convert_video_path_and_save(
+            video_path, output_path, temp_folder, frame_frequency, image_reducer, fontSize, spacing, maxsize, chars,
+            logs, processes, progress_tracker, renderer, temporal, hysteresis, font_path, decoders, target_fps, encoders,
+            output_format, sampling, timings, progress_callback, cancel_check
+        )
+    except ConversionCanceled:
+        raise
+    except Exception as e:
+        print ("")
+        print ("Uh oh video converting went wrong!")
+        print (e)
+        exit(0)
+
+def _convert_video_path_and_save(video_path, output_path="output.mp4", temp_folder = "./temp",
+                                frame_frequency=24, image_reducer=100, fontSize=10, spacing=1.1, maxsize=None, chars=" .*:+%S0#@",
+                                logs=False, processes=4, progress_tracker=None, renderer="pil",
+                                temporal=False, hysteresis=0, font_path=None, decoders=None, target_fps=None, encoders=None,
+                                output_format=None, sampling="point", timings=None, progress_callback=None, cancel_check=None):
+    """Does the actual work of convert_video_path_and_save, but raises instead of exiting,
+    so it can run inside a long lived process (like a warm worker, see jobs.py) and keep using its frame pool"""
+    if timings is None:
+        timings = StageTimings()
     if logs:
         start_time = time.time()
         print ("Converting video...")
+    if output_format is None:
+        output_format = "ascii" if os.path.splitext(output_path)[1].lower() == ASCII_VIDEO_EXT else "video"
+    if output_format == "ascii":
+        if len(chars) > 256:
+            raise ValueError("ASCII videos support up to 256 chars. Please use fewer chars!")
+        # nothing gets drawn, so there's nothing to redraw
+        temporal = False
+    if temporal and len(chars) > 256:
+        # char indices are passed around as single bytes
+        if logs : print ("Temporal conversion supports up to 256 chars, converting whole frames instead")
+        temporal = False
     
     # set up a capture temporarily so we can grab some basic info about it
     capture = cv2.VideoCapture(video_path)
     if not capture.isOpened():
-        print ("Could not read video. Please enter a valid video file!")
-        exit(0)
+        raise ValueError("Could not read video. Please enter a valid video file!")
 
     fps = capture.get(cv2.CAP_PROP_FPS)
     bitrate = int(capture.get(cv2.CAP_PROP_BITRATE))
     total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
-    frames_included = int(total_frames / frame_frequency)
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
     # total_frames / fps gives us our video duration.
-    video_duration = total_frames / fps
-    # frames included / video duration gives new fps
-    new_fps = (total_frames / frame_frequency) / video_duration
+    video_duration = total_frames / fps if fps > 0 else 0
 
     capture.release()
 
-    # First, we grab all the frames we need and store them in a temp folder
-    # After that, we convert all the image frames in the temp folder, and save them back in the temp folder
-    # Then, we write them to video and save to disk
-    # To utilize mutli processing, we separate grabbing frames and converting the frames into batches
-
-    while os.path.isdir(temp_folder):
-        temp_folder += "_"
-    temp_folder += "/"
-    os.mkdir(temp_folder)
-
-    # initial setup
-    # we divide our work into batches
-    batches = processes
-    frames_per_batch = int(total_frames / batches / frame_frequency)
-    if progress_tracker is None:
-        progress_tracker = Value("f", 0, lock=True)
-    # progress: saved frames + converted frames + written frames
-    progress_step = 100 / (frames_included * 3)
-
-    # grab the frames, and write to separate batch folders
-    save_frames_processes = []
-    for batch in range(batches):
-        starting_frame = batch * frames_per_batch * frame_frequency
-        batch_folder = temp_folder + str(batch) + "/"
-        os.mkdir(batch_folder)
-        args = (
-            starting_frame,
-            starting_frame + frames_per_batch * frame_frequency,
-            video_path,
-            batch_folder,
-            frame_frequency,
-            logs,
-            progress_tracker,
-            progress_step
-        )
-        p = Process(target=_save_frames, args=args)
-        p.daemon = True
-        p.start()
-        save_frames_processes.append(p)
-    for p in save_frames_processes:
-        p.join()
-
-    # convert all the frames in each batch folder
-    convert_processes = []
-    for batch in range(batches):
-        batch_folder = temp_folder + str(batch) + "/"
-        args = (
-            batch_folder,
-            frames_per_batch,
-            image_reducer,
-            fontSize, spacing, maxsize, chars,
-            logs, progress_tracker, progress_step
-        )
-        p = Process(target=_convert_batch, args=args)
-        p.daemon = True
-        p.start()
-        convert_processes.append(p)
-    for p in convert_processes:
-        p.join()
+    sampler = FrameSampler(frame_frequency, target_fps)
+    # the frame count and frame rate of the container are just estimates (and variable frame rate videos don't have one frame rate),
+    # the timestamps of the frames themselves are exact
+    index = load_video_index(video_path)
+    samples = None
+    if index is not None:
+        total_frames = index.frame_count()
+        video_duration = index.duration()
+        if video_duration > 0:
+            fps = total_frames / video_duration
+        samples = sampler.select(index.times())
+        frames_included = len(samples)
+    elif target_fps is not None:
+        frames_included = int(video_duration * target_fps) + 1
+    else:
+        frames_included = int(total_frames / frame_frequency)
+    new_fps = sampler.output_fps(frames_included, video_duration, fps)
+    if decoders is None:
+        decoders = processes
+    if temporal or index is None or (output_format == "ascii" and hysteresis > 0):
+        decoders = 1
+    # long videos are split into parts, one after the other, and every part gets its own encoder (and ffmpeg process).
+    # Each part is written to its own file in temp_folder and the files get joined without re-encoding at the end
+    if encoders is None:
+        encoders = max(1, min(processes, frames_included // ENCODE_PART_FRAMES))
+    if temporal or index is None or output_format == "ascii":
+        encoders = 1
+    encoders = max(1, min(encoders, frames_included))
 
     # if no extension was assigned, automatically assign .mp4
     output_name, output_ext = os.path.splitext(output_path)
     if output_ext == "":
-        output_ext = ".mp4"
+        output_ext = ASCII_VIDEO_EXT if output_format == "ascii" else ".mp4"
     # if final output path was specified, then modify it (append _Copy to it)
     final_output_path = output_name + output_ext
     while os.path.isfile(final_output_path):
         if logs : print (final_output_path, "already exists!")
         final_output_path = os.path.splitext(final_output_path)[0] + "_Copy" + output_ext
 
-    # video settings
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video_out = imageio.get_writer(final_output_path, fps=new_fps, quality=None, bitrate=(bitrate * 1024 * 2.5))
-    size = None
-
-    # write images to new video
-    for batch in range(1, batches + 1):
-        batch_folder = temp_folder + str(batch - 1) + "/"
-        for i in range(1, frames_per_batch + 1):
-            img = cv2.imread(batch_folder + str(i) + ".jpg", 2)
-            if size is None:
-                height, width = img.shape
-                size = (width, height)
-            video_out.append_data(img)
-            with progress_tracker.get_lock():
-                progress_tracker.value += progress_step
-                if logs : print ("Progress: %.4f%%" % progress_tracker.value, end="\r")
-    video_out.close()
-    shutil.rmtree(temp_folder)
-
-    # when we are done, there might be some rounding errors when converting some stuff to integers, thus it doesn't appear to be done
-    # So we just simply set it to 100
-    with progress_tracker.get_lock():
-        progress_tracker.value = 100
+    if progress_tracker is None:
+        progress_tracker = ProgressTracker(2)
+    # progress: converted frames + written frames, each counted by their own writer
+    progress_step = 100 / (max(frames_included, 1) * 2)
+    converted_progress = progress_tracker.writer(0, 50, logs, progress_callback, cancel_check)
+    written_progress = progress_tracker.writer(1, 50, logs, progress_callback, cancel_check)
+
+    # A decoder thread reads frames and hands them to the frame pool through a shared memory ring buffer.
+    # Converted frames come back through the same buffer, possibly out of order, and get written here in order.
+    # The ring buffer has a fixed number of slots, which bounds how many frames we hold in memory
+    # every frame has the same geometry, so it's planned once (see plan_output).
+    # Converted frames are exactly as big as planned, maxsize included, so slots only need room for that
+    plan = plan_output(height, width, image_reducer, fontSize, spacing, maxsize)
+    output_capacity = plan.size[0] * plan.size[1]
+    slots = max(processes, decoders, encoders) * 4
+    pool = None
+    if output_format == "ascii":
+        # the char indices are the output, so frames are only mapped (by the decoders) and never go to the frame pool
+        mapper = TemporalMapper(image_reducer, chars, hysteresis, plan.reducer, sampling)
+        job = IndexJob(plan.shape, slots)
+    elif temporal:
+        pool = get_frame_pool(processes)
+        # chars are picked here in frame order (needed for hysteresis), workers only draw what changed
+        mapper = TemporalMapper(image_reducer, chars, hysteresis, plan.reducer, sampling)
+        job = pool.start_job(
+            plan.shape, output_capacity,
+            ((height, width), image_reducer, fontSize, spacing, maxsize, chars, font_path), slots, incremental=True
+        )
+    else:
+        pool = get_frame_pool(processes)
+        mapper = None
+        job = pool.start_job(
+            (height, width), output_capacity,
+            (image_reducer, fontSize, spacing, maxsize, chars, False, None, renderer, "image", font_path,
+            None, None, None, sampling), slots
+        )
+    part_bounds = [frames_included * i // encoders for i in range(encoders + 1)]
+    frames_per_sample = total_frames / max(frames_included, 1)
+    parts = []
+    decoder_args = []
+    for i in range(encoders):
+        first, end = part_bounds[i], part_bounds[i + 1]
+        # decoders are spread over the parts, every part gets at least one
+        part_decoders = max(1, decoders // encoders + (1 if i < decoders % encoders else 0))
+        # every part moves along on its own, so each gets its share of the ring buffer
+        part_slots = max(1, slots // encoders)
+        segments = queue.Queue()
+        if index is None:
+            segments.put((0, None))
+        elif part_decoders == 1:
+            segments.put((samples[first], samples[end - 1] + 1) if end > first else (0, 0))
+        else:
+            # decoders take segments in order, and each one should have room for a few frames in the window,
+            # so small GOPs get merged until a segment has about slots / decoders kept frames
+            for segment in index.segments(int(max(1, part_slots // part_decoders) * frames_per_sample)):
+                if end > first and segment[1] > samples[first] and segment[0] <= samples[end - 1]:
+                    segments.put(segment)
+        part = {
+            "first": first,
+            "end": end,
+            "window": FrameWindow(part_slots, first),
+            # converted frames that came back before the ones before them
+            "pending": {},
+            "next": first,
+            "path": final_output_path if encoders == 1 else os.path.join(
+                temp_folder, "%s.part%d%s" % (os.path.basename(output_name), i, output_ext)
+            )
+        }
+        parts.append(part)
+        for j in range(part_decoders):
+            decoder_args.append((part["window"], segments, (first, end) if samples is not None else None))
+
+    stop = threading.Event()
+    decode_stats = [{"frames_decoded": 0, "frames_included": 0, "seeks": 0} for args in decoder_args]
+    cells_drawn = 0
+    cells_total = 0
+    frames_missing = 0
+    decoder_threads = []
+    for stats, (window, segments, sample_range) in zip(decode_stats, decoder_args):
+        decoder = threading.Thread(target=_decode_frames, args=(
+            video_path, sampler, job, window, segments, stop, stats, mapper, timings, samples, index, sample_range
+        ))
+        decoder.daemon = True
+        decoder.start()
+        decoder_threads.append(decoder)
+
+    temp_folder_created = False
+    if encoders > 1 and not os.path.isdir(temp_folder):
+        os.makedirs(temp_folder)
+        temp_folder_created = True
+    for part in parts:
+        if output_format == "ascii":
+            # players show it at the size the video would have been drawn at
+            part["writer"] = AsciiVideoWriter(part["path"], chars, plan.fontSize, spacing, new_fps, plan.size)
+        else:
+            # video settings, the same for every part so they can be joined as they are
+            part["writer"] = imageio.get_writer(part["path"], fps=new_fps, quality=None, bitrate=(bitrate * 1024 * 2.5))
+        # frames are handed over as soon as the next one in order is ready. The encoder can fall behind by a few frames,
+        # after that, everything waits for it
+        part["encoder"] = FrameEncoder(part["writer"], job, max(slots // (2 * encoders), 1), timings)
+
+    try:
+        try:
+            frames_written = 0
+            while (any(decoder.is_alive() for decoder in decoder_threads)
+                    or any(part["next"] < part["window"].end() for part in parts)):
+                for stats in decode_stats:
+                    if "error" in stats:
+                        raise stats["error"]
+                result = job.get_result(timeout=0.1)
+                if result is None:
+                    # nothing adds progress while frames are slow to come back, but canceling shouldn't wait for them
+                    converted_progress.check_canceled()
+                    if pool is not None and not pool.is_alive():
+                        raise RuntimeError("a convert process exited unexpectedly")
+                else:
+                    frame_number, slot, img, cells = result
+                    parts[bisect.bisect_right(part_bounds, frame_number) - 1]["pending"][frame_number] = (slot, img)
+                    result = img = None
+                    if cells is not None:
+                        cells_drawn += cells
+                        cells_total += job.input_shape[0] * job.input_shape[1]
+                    converted_progress.add(progress_step)
+                for part in parts:
+                    pending, window = part["pending"], part["window"]
+                    while part["next"] in pending or window.is_missing(part["next"]):
+                        if part["next"] in pending:
+                            # only takes any time when the encoder is behind
+                            with timings.stage("encode_wait"):
+                                part["encoder"].put(pending.pop(part["next"]))
+                        else:
+                            frames_missing += 1
+                        part["next"] += 1
+                        window.advance()
+                # the encoders count what they've written, progress is only ever written from here
+                written = sum(part["encoder"].frames for part in parts) + frames_missing
+                if written > frames_written:
+                    written_progress.add((written - frames_written) * progress_step)
+                    frames_written = written
+            for stats in decode_stats:
+                if "error" in stats:
+                    raise stats["error"]
+            with timings.stage("encode", frames=0):
+                for part in parts:
+                    part["encoder"].close()
+                    part["writer"].close()
+            if encoders > 1:
+                with timings.stage("concat", frames=sum(part["encoder"].frames for part in parts)):
+                    concat_videos([part["path"] for part in parts], final_output_path)
+        except Exception:
+            stop.set()
+            for decoder in decoder_threads:
+                decoder.join()
+            # the pool may still be busy with our frames, so start from a clean one next time
+            if pool is not None : _close_frame_pool()
+            # views into the ring buffer have to be gone before it can be closed
+            for part in parts:
+                part["pending"].clear()
+            result = img = None
+            for part in parts:
+                try:
+                    part["encoder"].close()
+                except Exception:
+                    pass
+                part["writer"].close()
+            job.close()
+            raise
+    finally:
+        # parts are only needed until they're joined, whether that worked or not
+        if encoders > 1:
+            for part in parts:
+                if os.path.exists(part["path"]) : os.remove(part["path"])
+            if temp_folder_created:
+                try:
+                    os.rmdir(temp_folder)
+                except OSError:
+                    pass
+    for decoder in decoder_threads:
+        decoder.join()
+    job.close()
+    timings.merge(job.timings.as_dict())
+    frames_written = sum(part["encoder"].frames for part in parts)
+    size = parts[0]["encoder"].size
+
+    converted_progress.finish()
+    written_progress.finish()
+
+    summary = {
+        "output_path": final_output_path,
+        "frames_total": total_frames,
+        "frames_decoded": sum(stats["frames_decoded"] for stats in decode_stats),
+        "frames_included": frames_written,
+        "fps": new_fps,
+        "decoders": decoders,
+        "encoders": encoders,
+        "seeks": sum(stats["seeks"] for stats in decode_stats)
+    }
+    if temporal:
+        summary["cells_reused"] = 1 - cells_drawn / cells_total if cells_total > 0 else 0
 
     if logs:
         print ("=" * 30)
         print ("SUMMARY:")
         print ("-" * 20)
-        print ("Progress: %.4f%%" % progress_tracker.value)
+        print ("Progress: %.4f%%" % progress_tracker.get())
         print ("Total frames found:", str(total_frames))
-        print ("Frames included and converted:", str(frames_per_batch * batches))
+        print ("Frames decoded:", str(summary["frames_decoded"]))
+        print ("Frames included and converted:", str(frames_written))
         print ("Original FPS:", str(fps))
         print("New FPS:", str(new_fps))
         print ("Resolution:", str(size))
+        if temporal:
+            print ("Cells reused: %.2f%%" % (summary["cells_reused"] * 100))
         print ("Saved to", final_output_path)
         print ("Time took: %.4f secs" % (time.time() - start_time))
 
+    return summary
+
 class ConvertVideoProcess:
     """Represents an independent process for a video conversion process.
     Key feature includes the ability to track progress of a conversion process
 
     Properties
     ----------
-    progress : multiprocessing.Value
-        - stores the progress of the image conversion
+    progress : progress.ProgressTracker
+        - stores the progress of the video conversion
     video_path : string
         - video path to convert
     output_path : string
@@ -531,19 +2502,25 @@ class ConvertVideoProcess:
         - removes lingering files/folder in temp folder
     get_progress
         - returns the current progress of the conversion
+    get_timings
+        - waits for the conversion to end and returns its StageTimings as a dict
     """
     def __init__(self, video_path, output_path="output.mp4", temp_folder = "./temp",
                 frame_frequency=24, image_reducer=100, fontSize=10, spacing=1.1,
-                maxsize=None, chars=" .*:+%S0#@", logs=False, processes=4):
-        self.progress = Value("f", 0, lock=True)
+                maxsize=None, chars=" .*:+%S0#@", logs=False, processes=4, renderer="pil",
+                temporal=False, hysteresis=0, font_path=None, profile_path=None, decoders=None, target_fps=None,
+                encoders=None, output_format=None, sampling="point"):
+        self.progress = ProgressTracker(2)
         self.video_path = video_path
         self.output_path = output_path
         self.temp_folder = temp_folder
-        self._process = Process(target=convert_video_path_and_save, args =(
+        self._results_queue = Queue()
+        self._process = Process(target=_run_timed, args=(convert_video_path_and_save, (
             video_path, output_path, temp_folder,
             frame_frequency, image_reducer, fontSize,
-            spacing, maxsize, chars, logs, processes, self.progress
-        ))
+            spacing, maxsize, chars, logs, processes, self.progress, renderer,
+            temporal, hysteresis, font_path, decoders, target_fps, encoders, output_format, sampling
+        ), self._results_queue, profile_path))
     
     def get_process(self):
         return self._process
@@ -560,11 +2537,14 @@ class ConvertVideoProcess:
         self._process.close()
 
     def cleanup_temp(self):
-        shutil.rmtree(self.temp_folder)
+        if os.path.isdir(self.temp_folder):
+            shutil.rmtree(self.temp_folder)
 
     def get_progress(self):
-        with self.progress.get_lock():
-            return self.progress.value
+        return self.progress.get()
+
+    def get_timings(self):
+        return _get_process_results(self._process, self._results_queue)[0]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -573,12 +2553,12 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "path_to_file",
-        help="File path to file (image or video) to convert"        
+        help="File path to file (image or video) to convert. Can also be a folder or a quoted glob pattern (\"photos/*.png\") to convert many images at once"        
     )
 
     parser.add_argument(
         "path_to_output",
-        help="Optional. File path to put converted and final image/video. Default is ./output.jpg (.mp4 if video)",
+        help="Optional. File path to put converted and final image/video. Default is ./output.jpg (.mp4 if video). Folder to put the results in when converting a folder or glob",
         nargs="?",
         default="output"
     )
@@ -640,22 +2620,159 @@ if __name__ == "__main__":
         help="VIDEO ONLY. Determines how many frames to skip before capturing/converting. Keep 1 to preserve all frames and FPS. Default is 24"
     )
 
+    parser.add_argument(
+        "--fps",
+        type=float,
+        dest="target_fps",
+        metavar="FPS",
+        default=None,
+        help="VIDEO ONLY. Pick frames by time instead of --frame_frequency, so the output plays at FPS (0.5 is a frame every 2 seconds). Keeps the timing of variable frame rate videos"
+    )
+
+    parser.add_argument(
+        "-r", "--renderer",
+        dest="renderer",
+        metavar="RENDERER",
+        choices=RENDERERS,
+        default="pil",
+        help="How characters are drawn. \"pil\" draws each character with PIL, \"atlas\" rasterizes each character once and builds the image with NumPy (much faster). Default is pil"
+    )
+
+    parser.add_argument(
+        "--sampling",
+        dest="sampling",
+        metavar="SAMPLING",
+        choices=SAMPLINGS,
+        default="point",
+        help="How the pixels of every character's cell become one intensity. \"point\" takes one pixel per cell, \"area\" averages the whole cell (smoother, and JPEGs get decoded at a reduced scale when possible). Default is point"
+    )
+
+    parser.add_argument(
+        "--font",
+        dest="font_path",
+        metavar="PATH",
+        default=None,
+        help="Path to a monospace .ttf/.otf font to draw characters with. Default is the bundled Noto Mono"
+    )
+
+    parser.add_argument(
+        "-t", "--temporal",
+        dest="temporal",
+        action="store_true",
+        help="VIDEO ONLY. Only redraw the characters that changed since the previous frame. Much faster for mostly static videos"
+    )
+
+    parser.add_argument(
+        "--hysteresis",
+        type=int,
+        dest="hysteresis",
+        metavar="LEVELS",
+        choices=range(0, 256),
+        default=0,
+        help="VIDEO ONLY, with --temporal. How many intensity levels (0 - 255) a pixel may change before its character changes. Reduces flicker. Default is 0"
+    )
+
+    parser.add_argument(
+        "-o", "--output_format",
+        dest="output_format",
+        metavar="FORMAT",
+        choices=OUTPUT_FORMATS,
+        default=None,
+        help="IMAGE ONLY. One of image, text, ansi or html. text/ansi/html skip drawing and write characters only. Use - as path_to_output to print them. Default is picked from the output extension (.txt, .ans, .html), otherwise image"
+    )
+
+    parser.add_argument(
+        "--tiled",
+        dest="tiled",
+        action="store_true",
+        default=None,
+        help="IMAGE ONLY. Draw and save the output a strip at a time, so it never has to be in memory as a whole. Only .png and .tif/.tiff can be saved that way, other extensions are saved as .png instead. Default is only for outputs over %d megapixels" % (TILED_MIN_PIXELS // (1024 * 1024))
+    )
+
+    parser.add_argument(
+        "-p", "--processes",
+        type=int,
+        dest="processes",
+        metavar="PROCESSES",
+        default=4,
+        help="Number of worker processes for videos and for folders/globs of images. For --tiled images, the number of strips drawn at once. Default is 4"
+    )
+
+    parser.add_argument(
+        "-d", "--decoders",
+        type=int,
+        dest="decoders",
+        metavar="DECODERS",
+        default=None,
+        help="VIDEO ONLY. Number of threads decoding the video at once, each one a few keyframes apart. Default is the same as --processes"
+    )
+
+    parser.add_argument(
+        "-e", "--encoders",
+        type=int,
+        dest="encoders",
+        metavar="ENCODERS",
+        default=None,
+        help="VIDEO ONLY. Number of parts the output video is split into and encoded at once, joined without re-encoding at the end. Default is one per %d frames, up to --processes" % ENCODE_PART_FRAMES
+    )
+
+    parser.add_argument(
+        "--force",
+        dest="force",
+        action="store_true",
+        help="FOLDERS/GLOBS ONLY. Convert every image, even ones whose output is already newer than the image"
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Print how long every stage (read, map, render, save, decode, encode...) took, with the pixels/cells it worked on"
+    )
+
+    parser.add_argument(
+        "--profile_dump",
+        dest="profile_dump",
+        metavar="PATH",
+        default=None,
+        help="Profile the whole conversion and save it to PATH. .html/.txt use pyinstrument (if installed), anything else is a cProfile dump"
+    )
+
     args = parser.parse_args()
 
-    if os.path.isfile(args.path_to_file):
-        file_type = os.path.splitext(args.path_to_file)[1]
-        if file_type in IMG_EXT:
-            convert_image_path_and_save(
-                args.path_to_file, args.path_to_output, False,
+    timings = StageTimings()
+    with profile_to(args.profile_dump):
+        if os.path.isdir(args.path_to_file) or (not os.path.isfile(args.path_to_file) and glob.has_magic(args.path_to_file)):
+            # folder or glob pattern, path_to_output is the folder to put the results in
+            convert_images(
+                [args.path_to_file], args.path_to_output, args.force, args.processes,
                 args.image_reducer, args.fontSize, args.spacing,
-                args.maxsize, args.chars, logs=True
+                args.maxsize, args.chars, logs=True, renderer=args.renderer,
+                output_format=args.output_format, font_path=args.font_path, timings=timings, sampling=args.sampling
             )
-        elif file_type in VID_EXT:
-            convert_video_path_and_save(
-                args.path_to_file, args.path_to_output, "./temp",
-                args.frame_frequency, args.image_reducer, args.fontSize, args.spacing,
-                args.maxsize, args.chars, logs=True
-            )
-    else:
-        print ("File", args.path_to_file,"could not be found!")
+        elif os.path.isfile(args.path_to_file):
+            file_type = os.path.splitext(args.path_to_file)[1]
+            if file_type in IMG_EXT:
+                convert_image_path_and_save(
+                    args.path_to_file, args.path_to_output, False,
+                    args.image_reducer, args.fontSize, args.spacing,
+                    args.maxsize, args.chars, logs=args.path_to_output != "-", threads=args.processes, renderer=args.renderer,
+                    output_format=args.output_format, font_path=args.font_path, timings=timings, tiled=args.tiled,
+                    sampling=args.sampling
+                )
+            elif file_type in VID_EXT:
+                convert_video_path_and_save(
+                    args.path_to_file, args.path_to_output, "./temp",
+                    args.frame_frequency, args.image_reducer, args.fontSize, args.spacing,
+                    args.maxsize, args.chars, logs=True, processes=args.processes, renderer=args.renderer,
+                    temporal=args.temporal, hysteresis=args.hysteresis, font_path=args.font_path,
+                    decoders=args.decoders, target_fps=args.target_fps, timings=timings,
+                    encoders=args.encoders, sampling=args.sampling
+                )
+        else:
+            print ("File", args.path_to_file,"could not be found!")
+
+    if args.profile:
+        # keep stdout clean when the result itself is printed there
+        print (timings.report(), file=sys.stderr if args.path_to_output == "-" else sys.stdout)
 
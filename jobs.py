@@ -1,138 +1,291 @@
-from convert import ConvertImageProcess, ConvertVideoProcess
+from convert import ConvertImageProcess, ConvertVideoProcess, _convert_image_path_and_save, _convert_video_path_and_save
+from strip_writer import strip_output_path
+from ascii_video import ascii_video_path
+from timings import StageTimings, profile_to
+from progress import ProgressPublisher, ConversionCanceled
 import os
 import time
+import shutil
+import threading
 from rq import get_current_job
-from firebase_admin import credentials, initialize_app, storage
-import json
+from storage import get_storage
+from video_index import index_path
 from config import Config
 
-def firebase_init(config):
-    path_to_key = os.path.join(os.getcwd(), "key.json")
-    if not os.path.exists(path_to_key):
-        key_json_file = open(path_to_key, "w")
-        json.dump(config.FIREBASE_KEY, key_json_file)
-        key_json_file.close()
-    
-    cred = credentials.Certificate(path_to_key)
-    default_app = initialize_app(cred, {
-        "storageBucket": config.FIREBASE_BUCKET
-    })
+# config and storage are set up once per process and reused by every job it runs.
+# With a warm worker (see worker.py) that's once per worker instead of once per job
+_config = None
+_storage = None
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = Config()
+    return _config
+
+def job_storage(config):
+    global _storage
+    if _storage is None:
+        _storage = get_storage(config.STORAGE, config.STORAGE_DIR, config.FIREBASE_KEY, config.FIREBASE_BUCKET)
+    return _storage
+
+class JobCanceled(Exception):
+    pass
+
+# set to stop the job running in this process (see cancel_current_job)
+_cancel = threading.Event()
+
+def cancel_current_job():
+    """Asks the job running in this process to stop. Only needed when jobs run in the worker process itself,
+    since RQ can't kill a work horse that doesn't exist. The job stops the next time it checks on its conversion"""
+    _cancel.set()
+
+def wait_for_conversion(p, publisher, local_file_path, local_output_path):
+    """Publishes the progress of a conversion process until it's done.
+    If the job is canceled (or times out) first, the process is stopped and its files removed"""
+    try:
+        while True:
+            if _cancel.is_set():
+                raise JobCanceled("job was canceled")
+            progress = p.get_progress()
+            publisher.update(progress)
+            if progress >= 100:
+                break
+            time.sleep(0.1)
+    except BaseException:
+        # a work horse takes its conversion down with it, but a job running in the worker process has to do it itself
+        p.terminate_process()
+        if isinstance(p, ConvertVideoProcess) : p.cleanup_temp()
+        # images drawn in strips are saved as .png (see strip_writer.strip_output_path)
+        remove_files(local_file_path, index_path(local_file_path), local_output_path, strip_output_path(local_output_path))
+        raise
+
+def convert_inline(timings, publisher, local_file_path, local_output_path,
+                    image_reducer, fontSize, spacing, maxsize, chars, logs, renderer, font_path, sampling="point"):
+    """Converts an image in this process. Progress goes straight from the conversion to the publisher,
+    and the conversion checks for cancellation itself, so there's no process to start or poll.
+    Returns the path the output was saved to"""
+    try:
+        with timings.stage("convert_inline"):
+            return _convert_image_path_and_save(
+                local_file_path, local_output_path, False,
+                image_reducer, fontSize, spacing, maxsize, chars,
+                logs, None, renderer, None, font_path, timings,
+                publisher.update, _cancel.is_set, sampling=sampling
+            )
+    except BaseException as e:
+        remove_files(local_file_path, local_output_path, strip_output_path(local_output_path))
+        if isinstance(e, ConversionCanceled):
+            raise JobCanceled("job was canceled") from e
+        raise
+
+def convert_video_inline(timings, publisher, local_file_path, local_output_path, temp_batch_folder,
+                        frame_frequency, image_reducer, fontSize, spacing, maxsize, chars, logs, processes, renderer,
+                        font_path, output_format, sampling="point"):
+    """Converts a video in this process, on the frame pool it keeps between jobs (see convert.get_frame_pool).
+    In a warm worker that's the pool it started with, so no job has to start (and stop) processes of its own.
+    Progress and cancellation work like convert_inline"""
+    try:
+        with timings.stage("convert_inline"):
+            _convert_video_path_and_save(
+                local_file_path, local_output_path, temp_batch_folder,
+                frame_frequency, image_reducer, fontSize, spacing, maxsize, chars,
+                logs, processes, None, renderer, font_path=font_path, output_format=output_format, sampling=sampling,
+                timings=timings, progress_callback=publisher.update, cancel_check=_cancel.is_set
+            )
+    except BaseException as e:
+        if os.path.isdir(temp_batch_folder) : shutil.rmtree(temp_batch_folder)
+        remove_files(local_file_path, index_path(local_file_path), local_output_path)
+        if isinstance(e, ConversionCanceled):
+            raise JobCanceled("job was canceled") from e
+        raise
+
+def remove_files(*paths):
+    for path in paths:
+        if os.path.exists(path) : os.remove(path)
+
+def fetch_input(storage, config, filename, timings):
+    """Returns a local path to the uploaded file of a job, or None if it's gone.
+    On a shared volume that's the uploaded file itself, otherwise it's downloaded"""
+    key = os.path.join(config.TEMP, filename)
+    if not storage.exists(key):
+        return None
+    shared_path = storage.local_path(key)
+    if shared_path is not None:
+        return shared_path
+    local_temp = os.path.join(os.getcwd(), config.TEMP)
+    if not os.path.isdir(local_temp) : os.mkdir(local_temp)
+    local_file_path = os.path.join(os.getcwd(), key)
+    with timings.stage("download") as counts:
+        storage.download(key, local_file_path)
+        counts["bytes"] = os.path.getsize(local_file_path)
+    storage.delete(key)
+    return local_file_path
+
+def remove_input(storage, config, filename, local_file_path):
+    storage.delete(os.path.join(config.TEMP, filename))
+    # videos leave their index next to them (see video_index.py)
+    remove_files(local_file_path, index_path(local_file_path))
+
+def output_path(storage, config, filename):
+    """Returns where a job should save its output. On a shared volume that's straight into storage"""
+    key = os.path.join(config.OUTPUT, filename)
+    shared_path = storage.local_path(key)
+    if shared_path is not None:
+        return shared_path
+    local_output = os.path.join(os.getcwd(), config.OUTPUT)
+    if not os.path.isdir(local_output) : os.mkdir(local_output)
+    return os.path.join(os.getcwd(), key)
+
+def store_output(storage, config, filename, local_output_path, timings):
+    """Uploads the output of a job (see output_path), unless it was saved straight into storage"""
+    key = os.path.join(config.OUTPUT, filename)
+    if storage.local_path(key) is None:
+        with timings.stage("upload", bytes=os.path.getsize(local_output_path)):
+            storage.upload(local_output_path, key, move=True)
+
+def profile_paths(config, filename):
+    """Returns where to save the profiles of a job (the job process and the convert process), or Nones if profiling is off"""
+    if config.PROFILE_DIR is None:
+        return None, None
+    name = os.path.join(config.PROFILE_DIR, os.path.splitext(filename)[0])
+    return name + "." + config.PROFILE_FORMAT, name + ".convert." + config.PROFILE_FORMAT
 
 def start_image_job(filename, image_reducer=10, fontSize=10, spacing=1.1,
-                    maxsize=None, chars=" .*:+%S0#@", logs=False, threads=4):
+                    maxsize=None, chars=" .*:+%S0#@", logs=False, threads=4, renderer="pil", font_path=None, sampling="point"):
     print ("=" * 70)
     print ("- Image job", filename, "started!")
     
-    config = Config()
-    firebase_init(config)
-    bucket = storage.bucket()
+    config = get_config()
+    _cancel.clear()
+    job_profile, convert_profile = profile_paths(config, filename)
+    with profile_to(job_profile):
+        return _image_job(
+            config, filename, image_reducer, fontSize, spacing, maxsize, chars, logs, threads, renderer, font_path,
+            sampling, convert_profile
+        )
 
-    local_temp = os.path.join(os.getcwd(), config.TEMP)
-    local_output = os.path.join(os.getcwd(), config.OUTPUT)
-    if not os.path.isdir(local_temp) : os.mkdir(local_temp)
-    if not os.path.isdir(local_output) : os.mkdir(local_output)
+def _image_job(config, filename, image_reducer, fontSize, spacing, maxsize, chars, logs, threads, renderer, font_path,
+                sampling, convert_profile):
+    timings = StageTimings()
+    rq_job = get_current_job()
+    storage = job_storage(config)
 
-    print ("- Retrieving from Firebase...")
-    file_path = os.path.join(config.TEMP, filename)
-    local_file_path = os.path.join(os.getcwd(), file_path)
-    temp_blob = bucket.blob(file_path)
-    if temp_blob.exists():
-        temp_blob.download_to_filename(local_file_path)
-        temp_blob.delete()
-    else:
+    print ("- Retrieving input...")
+    local_file_path = fetch_input(storage, config, filename, timings)
+    if local_file_path is None:
         print ("- Could not be found!")
         return filename
-    
-    output_path = os.path.join(config.OUTPUT, filename)
-    local_output_path = os.path.join(os.getcwd(), output_path)
+    local_output_path = output_path(storage, config, filename)
+    publisher = ProgressPublisher(rq_job, config.PROGRESS_PUBLISH_RATE, config.PROGRESS_MIN_CHANGE)
 
-    p = ConvertImageProcess(
-        local_file_path, local_output_path, False,
-        image_reducer, fontSize, spacing, maxsize, chars,
-        logs, threads
-    )
-    p.start_process()
+    if config.IMAGE_JOB_MODE == "process":
+        # isolated from the worker, at the cost of starting a process
+        p = ConvertImageProcess(
+            local_file_path, local_output_path, False,
+            image_reducer, fontSize, spacing, maxsize, chars,
+            logs, threads, renderer, font_path, convert_profile, sampling
+        )
+        convert_start = time.perf_counter()
+        p.start_process()
 
-    rq_job = get_current_job()
-    while True:
-        rq_job.meta["progress"] = p.get_progress()
-        rq_job.save_meta()
-        if p.get_progress() >= 100:
-            break
-        time.sleep(0.1)
-
-    p.join_process()
-    rq_job.meta["uploading"] = "uploading"
-    rq_job.save_meta()
-    print ("- Uploading to Firebase...")
-    output_blob = bucket.blob(output_path)
-    output_blob.upload_from_filename(local_output_path)
-    os.remove(local_file_path)
-    os.remove(local_output_path)
-    rq_job.meta["uploading"] = "finished"
-    rq_job.save_meta()
+        # reading progress is just a look at shared memory, only saving (and publishing) it to Redis costs anything
+        wait_for_conversion(p, publisher, local_file_path, local_output_path)
+
+        # stages of the convert process, plus its whole run as seen from here (including process start up)
+        timings.merge(p.get_timings())
+        saved_path = p.get_output_path()
+        p.join_process()
+        timings.add("convert_process", time.perf_counter() - convert_start)
+    else:
+        saved_path = convert_inline(
+            timings, publisher, local_file_path, local_output_path,
+            image_reducer, fontSize, spacing, maxsize, chars, logs, renderer, font_path, sampling
+        )
+    # huge images are drawn in strips and saved as .png, so the output can have a name of its own.
+    # It's what the job returns, so the browser asks for the right file
+    saved_path = saved_path or local_output_path
+    output_filename = os.path.basename(saved_path)
+    publisher.set_status("uploading")
+    print ("- Uploading output...")
+    store_output(storage, config, output_filename, saved_path, timings)
+    remove_input(storage, config, filename, local_file_path)
+    rq_job.meta["timings"] = timings.as_dict()
+    publisher.set_status("finished", output_filename)
+    if logs : print (timings.report())
 
     print ("- Image job", filename, "ended!")
-    return filename
+    return output_filename
 
 
 def start_video_job(filename, frame_frequency=24,
                     image_reducer=100, fontSize=10, spacing=1.1, maxsize=None,
-                    chars=" .*:+%S0#@", logs=False, processes=4):
+                    chars=" .*:+%S0#@", logs=False, processes=4, renderer="pil", font_path=None, output_format="video",
+                    sampling="point"):
     print ("=" * 70)
     print ("- Video job", filename, "started!")
     
-    config = Config()
-    firebase_init(config)
-    bucket = storage.bucket()
+    config = get_config()
+    _cancel.clear()
+    job_profile, convert_profile = profile_paths(config, filename)
+    with profile_to(job_profile):
+        return _video_job(
+            config, filename, frame_frequency, image_reducer, fontSize, spacing, maxsize, chars, logs, processes,
+            renderer, font_path, output_format, sampling, convert_profile
+        )
 
-    local_temp = os.path.join(os.getcwd(), config.TEMP)
-    local_output = os.path.join(os.getcwd(), config.OUTPUT)
-    if not os.path.isdir(local_temp) : os.mkdir(local_temp)
-    if not os.path.isdir(local_output) : os.mkdir(local_output)
+def _video_job(config, filename, frame_frequency, image_reducer, fontSize, spacing, maxsize, chars, logs, processes,
+                renderer, font_path, output_format, sampling, convert_profile):
+    timings = StageTimings()
+    rq_job = get_current_job()
+    storage = job_storage(config)
 
-    print ("- Retrieving from Firebase...")
-    file_path = os.path.join(config.TEMP, filename)
-    local_file_path = os.path.join(os.getcwd(), file_path)
-    temp_blob = bucket.blob(file_path)
-    if temp_blob.exists():
-        temp_blob.download_to_filename(local_file_path)
-        temp_blob.delete()
-    else:
+    print ("- Retrieving input...")
+    local_file_path = fetch_input(storage, config, filename, timings)
+    if local_file_path is None:
         print ("- Could not be found!")
         return filename
 
-    output_path = os.path.join(config.OUTPUT, filename)
-    local_output_path = os.path.join(os.getcwd(), output_path)
+    # ascii videos are saved as what they are, not as the video they came from
+    output_filename = ascii_video_path(filename) if output_format == "ascii" else filename
+    local_output_path = output_path(storage, config, output_filename)
 
     file_id = os.path.splitext(filename)[0]
-    temp_batch_folder = os.path.join(local_temp, file_id + "/")
+    temp_batch_folder = os.path.join(os.getcwd(), config.TEMP, file_id + "/")
 
-    p = ConvertVideoProcess(
-        local_file_path, local_output_path, temp_batch_folder,
-        frame_frequency, image_reducer, fontSize, spacing,
-        maxsize, chars, logs, processes
-    )
-    p.start_process()
+    publisher = ProgressPublisher(rq_job, config.PROGRESS_PUBLISH_RATE, config.PROGRESS_MIN_CHANGE)
 
-    rq_job = get_current_job()
-    while True:
-        rq_job.meta["progress"] = p.get_progress()
-        rq_job.save_meta()
-        if p.get_progress() >= 100:
-            break
-        time.sleep(0.1)
-
-    p.join_process()
-    rq_job.meta["uploading"] = "uploading"
-    rq_job.save_meta()
-    print ("- Uploading to Firebase...")
-    output_blob = bucket.blob(output_path)
-    output_blob.upload_from_filename(local_output_path)
-    os.remove(local_file_path)
-    os.remove(local_output_path)
-    rq_job.meta["uploading"] = "finished"
-    rq_job.save_meta()
+    if config.VIDEO_JOB_MODE == "process":
+        # isolated from the worker, at the cost of starting a process (and a frame pool) for every job
+        p = ConvertVideoProcess(
+            local_file_path, local_output_path, temp_batch_folder,
+            frame_frequency, image_reducer, fontSize, spacing,
+            maxsize, chars, logs, processes, renderer,
+            font_path=font_path, profile_path=convert_profile, output_format=output_format, sampling=sampling
+        )
+        convert_start = time.perf_counter()
+        p.start_process()
+
+        # reading progress is just a look at shared memory, only saving (and publishing) it to Redis costs anything
+        wait_for_conversion(p, publisher, local_file_path, local_output_path)
+
+        # stages of the convert process, plus its whole run as seen from here (including process start up)
+        timings.merge(p.get_timings())
+        p.join_process()
+        timings.add("convert_process", time.perf_counter() - convert_start)
+    else:
+        convert_video_inline(
+            timings, publisher, local_file_path, local_output_path, temp_batch_folder,
+            frame_frequency, image_reducer, fontSize, spacing, maxsize, chars, logs, processes, renderer,
+            font_path, output_format, sampling
+        )
+    publisher.set_status("uploading")
+    print ("- Uploading output...")
+    store_output(storage, config, output_filename, local_output_path, timings)
+    remove_input(storage, config, filename, local_file_path)
+    rq_job.meta["timings"] = timings.as_dict()
+    publisher.set_status("finished", output_filename)
+    if logs : print (timings.report())
 
     print ("- Video job", filename, "ended!")
-    return filename
\ No newline at end of file
+    return output_filename
\ No newline at end of file
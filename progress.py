@@ -0,0 +1,259 @@
+import time
+import json
+import queue
+import threading
+from multiprocessing import RawArray
+
+class ProgressTracker:
+    """Tracks the progress (0 - 100) of a conversion split between several writers (threads or processes), without locks.
+    Every writer owns one slot of a shared array and is the only one that ever writes to it,
+    so writers never wait on each other or on readers. Readers add the slots up
+
+    Must be created before the processes that write to it are started (it's shared memory)
+
+    Methods
+    --------
+    writer
+        - returns the ProgressWriter of one slot
+    get
+        - returns the overall progress
+    """
+    def __init__(self, slots=1):
+        self._slots = RawArray("d", slots)
+
+    def writer(self, slot=0, share=100, logs=False, callback=None, cancel_check=None):
+        """share is the amount of progress this slot adds up to once its work is done (see ProgressWriter.finish)"""
+        return ProgressWriter(self, slot, share, logs, callback, cancel_check)
+
+    def get(self):
+        # a slot is a single aligned double, so reading it while it's written never gives a torn value
+        return min(sum(self._slots), 100)
+
+class ConversionCanceled(Exception):
+    """Raised inside a conversion when its cancel_check says it should stop (see ProgressWriter)"""
+    pass
+
+class ProgressWriter:
+    """Adds progress to one slot of a ProgressTracker. Only one thread should use a writer.
+    With tracker None, progress is only kept (and logged) locally
+
+    Properties
+    ----------
+    value : float
+        - progress added by this writer so far
+    callback : function
+        - if given, called with the overall progress every time it changes.
+        Lets a conversion running in the caller's own process be followed
+    cancel_check : function
+        - if given, called every time progress is added. If it returns True, ConversionCanceled is raised,
+        which stops the conversion
+
+    Methods
+    --------
+    add
+        - adds to the progress
+    finish
+        - sets the progress to the writer's full share
+    check_canceled
+        - raises ConversionCanceled if the conversion should stop
+    """
+    # how often progress logs get printed, in secs
+    LOG_INTERVAL = 0.1
+
+    def __init__(self, tracker=None, slot=0, share=100, logs=False, callback=None, cancel_check=None):
+        self._tracker = tracker
+        self._slot = slot
+        self.share = share
+        self.logs = logs
+        self.callback = callback
+        self.cancel_check = cancel_check
+        self.value = 0.0
+        self._last_log = 0
+
+    def add(self, amount):
+        self.check_canceled()
+        self._set(self.value + amount)
+
+    def finish(self):
+        # there might be some rounding errors when adding up steps, thus it doesn't appear to be done
+        self.value = self.share
+        if self._tracker is not None:
+            self._tracker._slots[self._slot] = self.share
+        if self.callback is not None:
+            self.callback(self.total())
+
+    def check_canceled(self):
+        if self.cancel_check is not None and self.cancel_check():
+            raise ConversionCanceled("conversion was canceled")
+
+    def total(self):
+        return self.value if self._tracker is None else self._tracker.get()
+
+    def _set(self, value):
+        self.value = value
+        if self._tracker is not None:
+            self._tracker._slots[self._slot] = value
+        if self.callback is not None:
+            self.callback(self.total())
+        if self.logs:
+            now = time.time()
+            if now - self._last_log >= self.LOG_INTERVAL:
+                self._last_log = now
+                print ("Progress: %.4f%%" % self.total(), end="\r")
+
+# every job publishes its progress events on PROGRESS_CHANNEL + job id
+PROGRESS_CHANNEL = "progress:"
+
+def progress_message(status, progress=0, result=None):
+    """Returns the JSON progress event sent to browsers (and published by jobs)"""
+    return json.dumps({"status": status, "progress": progress, "result": result})
+
+class ProgressPublisher:
+    """Saves the progress of an RQ job to its meta and publishes it on the job's progress channel,
+    but only when it changed by at least min_change and no sooner than interval secs after the last save.
+    Finishing (100) is always saved. Smaller changes still get saved after a few intervals,
+    so a stalled job doesn't show an old value forever
+
+    Methods
+    --------
+    update
+        - gives the publisher the current progress, which it saves if it's time to
+    set_status
+        - saves and publishes a new status ("uploading", "finished") right away
+    """
+    def __init__(self, rq_job, interval=0.5, min_change=0.5):
+        self._rq_job = rq_job
+        self.interval = interval
+        self.min_change = min_change
+        self._last_value = None
+        self._last_time = 0
+
+    def update(self, value):
+        """Returns whether the progress was saved"""
+        if value == self._last_value:
+            return False
+        now = time.time()
+        if value < 100 and self._last_value is not None:
+            elapsed = now - self._last_time
+            if elapsed < self.interval:
+                return False
+            if abs(value - self._last_value) < self.min_change and elapsed < self.interval * 4:
+                return False
+        self._last_value = value
+        self._last_time = now
+        self._rq_job.meta["progress"] = value
+        self._save("started")
+        return True
+
+    def set_status(self, status, result=None):
+        self._rq_job.meta["uploading"] = status
+        self._save(status, result)
+
+    def _save(self, status, result=None):
+        self._rq_job.save_meta()
+        message = progress_message(status, self._rq_job.meta.get("progress", 0), result)
+        self._rq_job.connection.publish(PROGRESS_CHANNEL + self._rq_job.id, message)
+
+class ProgressHub:
+    """Fans progress events out to every progress stream of a web process.
+    Holds a single Redis subscription to all job progress channels (see ProgressPublisher)
+    while at least one stream is listening, and hands each event to the streams listening to that job.
+    Works with threads or eventlet green threads
+
+    Methods
+    --------
+    listen
+        - returns a queue.Queue that gets every progress event (JSON string) of a job
+    unlisten
+        - stops giving events to a queue. The subscription is let go once the last one is gone
+    subscribed
+        - returns whether the hub holds a subscription right now
+    """
+    # how often the subscription thread checks whether it's still needed, in secs
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, redis, channel=PROGRESS_CHANNEL):
+        self._redis = redis
+        self._channel = channel
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._pubsub = None
+
+    def listen(self, job_id):
+        listener = queue.Queue()
+        with self._lock:
+            self._listeners.setdefault(job_id, set()).add(listener)
+            if self._pubsub is None:
+                # subscribed before returning, so nothing published after listen() is missed
+                self._pubsub = self._subscribe()
+                thread = threading.Thread(target=self._run, args=(self._pubsub,))
+                thread.daemon = True
+                thread.start()
+        return listener
+
+    def unlisten(self, job_id, listener):
+        with self._lock:
+            listeners = self._listeners.get(job_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if len(listeners) == 0:
+                    del self._listeners[job_id]
+            if len(self._listeners) == 0:
+                # the subscription thread notices and unsubscribes
+                self._pubsub = None
+
+    def subscribed(self):
+        with self._lock:
+            return self._pubsub is not None
+
+    def _subscribe(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self._channel + "*")
+        return pubsub
+
+    def _is_current(self, pubsub):
+        with self._lock:
+            return self._pubsub is pubsub
+
+    def _run(self, pubsub):
+        while self._is_current(pubsub):
+            try:
+                message = pubsub.get_message(timeout=self.POLL_INTERVAL)
+            except Exception as e:
+                # streams fall back to checking the job on every heartbeat until we're back
+                print ("- Progress subscription lost, reconnecting:", e)
+                time.sleep(1)
+                pubsub = self._resubscribe(pubsub)
+                continue
+            if message is None or message["type"] != "pmessage":
+                continue
+            channel = message["channel"]
+            data = message["data"]
+            job_id = (channel.decode("utf-8") if isinstance(channel, bytes) else channel)[len(self._channel):]
+            with self._lock:
+                listeners = list(self._listeners.get(job_id, ()))
+            for listener in listeners:
+                listener.put(data.decode("utf-8") if isinstance(data, bytes) else data)
+        try:
+            pubsub.punsubscribe()
+            pubsub.close()
+        except Exception:
+            pass
+
+    def _resubscribe(self, pubsub):
+        """Swaps a lost subscription for a new one, unless nobody is listening anymore"""
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+        try:
+            new_pubsub = self._subscribe()
+        except Exception:
+            # still down, the next get_message fails again and we retry
+            return pubsub
+        with self._lock:
+            if self._pubsub is pubsub:
+                self._pubsub = new_pubsub
+                return new_pubsub
+        new_pubsub.close()
+        return pubsub
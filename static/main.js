@@ -17,7 +17,7 @@ $(".scrollToLink").click(function(e) {
     }, 50);
 })
 
-let allInputs = $("#convert input, #convert button:not(#cancelButton)");
+let allInputs = $("#convert input, #convert select, #convert button:not(#cancelButton)");
 let fileUpload = $("#fileUpload");
 let imageReduction = $("#imageReduction");
 let maxWidth = $("#maxWidth");
@@ -26,6 +26,7 @@ let fontSize = $("#fontSize");
 let spacing = $("#spacing");
 let characters = $("#characters");
 let frameFrequency = $("#frameFrequency");
+let videoOutput = $("#videoOutput");
 
 let resetButton = $("#resetButton");
 let convertButton = $("#convertButton");
@@ -40,9 +41,11 @@ let errorMessage = $("#error");
 let cancelMessage = $("#cancel");
 let previewLink = $("#previewLink");
 let downloadLink = $("#downloadLink");
+let asciiPlayer = $("#asciiPlayer");
 
 let progressStream = null;
 let currentJobId = "";
+let playerFrame = null;
 
 $(document).ready(function(e) {
     progress.hide();
@@ -59,6 +62,7 @@ resetButton.click(function(e) {
     spacing.val("1.1");
     characters.val(" .*:+%S0#@");
     frameFrequency.val("24");
+    videoOutput.val("ascii");
 });
 
 convertButton.click(function(e) {
@@ -72,6 +76,7 @@ convertButton.click(function(e) {
     formData.append("spacing", spacing.val());
     formData.append("characters", characters.val());
     formData.append("frameFrequency", frameFrequency.val());
+    formData.append("videoOutput", videoOutput.val());
     
     showProgress();
     cancelButton.hide();
@@ -91,6 +96,13 @@ convertButton.click(function(e) {
         } else if (response.status == 404) {
             showError("Sorry, looks like service is temporarily unavailable! Maybe try again later?");
             return "error";
+        } else if (response.status == 422) {
+            showError("That would take us too long to convert! Try a lower image reduction (or a higher frame frequency for videos)");
+            return "error";
+        } else if (response.status == 429) {
+            let retryAfter = parseInt(response.headers.get("Retry-After"));
+            showError("We're pretty busy right now! Try again in " + (isNaN(retryAfter) ? "a bit" : retryAfter + " seconds"));
+            return "error";
         }
         return response.json();
     }).then(data => {
@@ -150,12 +162,23 @@ function checkProgress(data) {
             }).then(response => {
                 return response.blob();
             }).then(file => {
-                showFinished();
-                let url = window.URL.createObjectURL(file);
-                downloadLink.attr("download", fileUpload[0].files[0].name);
-                downloadLink.attr("href", url);
-                previewLink.attr("href", url);
-                console.log("Success");
+                return loadAsciiVideo(file).then(video => {
+                    showFinished();
+                    let url = window.URL.createObjectURL(file);
+                    let name = fileUpload[0].files[0].name;
+                    downloadLink.attr("href", url);
+                    previewLink.attr("href", url);
+                    // outputs can come back in another format than they were uploaded in (huge images as .png, ASCII videos as .ascv)
+                    downloadLink.attr("download", name.replace(/\.[^.]*$/, "") + result.slice(result.lastIndexOf(".")));
+                    if (video != null) {
+                        // the player is the preview
+                        previewLink.hide();
+                        playAsciiVideo(video);
+                    } else {
+                        previewLink.show();
+                    }
+                    console.log("Success");
+                });
             }).catch(error => {
                 showError("Uh oh, couldn't retrive file for some reason!");
                 console.log("Error getting file");
@@ -185,7 +208,114 @@ function cancelConversion(data) {
     })
 }
 
+// ASCII videos (.ascv, see ascii_video.py) hold the char indices of every frame instead of drawn frames.
+// Returns a promise of {header, deltas}, or null if the file isn't one
+function loadAsciiVideo(file) {
+    return file.slice(0, 8).arrayBuffer().then(buffer => {
+        let magic = String.fromCharCode(...new Uint8Array(buffer, 0, Math.min(buffer.byteLength, 4)));
+        if (magic != "ASCV" || buffer.byteLength < 8) {
+            return null;
+        }
+        let headerLength = new DataView(buffer).getUint32(4, true);
+        return file.slice(8, 8 + headerLength).text().then(text => {
+            // frames are one zlib stream, which the browser can decompress by itself
+            let body = file.slice(8 + headerLength).stream().pipeThrough(new DecompressionStream("deflate"));
+            return new Response(body).arrayBuffer().then(deltas => {
+                return {header: JSON.parse(text), deltas: new Uint8Array(deltas)};
+            });
+        });
+    });
+}
+
+// draws every char once on its own little canvas (white on black), so cells can just be copied over
+function drawGlyphs(chars, fontSize, cellSize) {
+    return Array.from(chars).map(char => {
+        let glyph = document.createElement("canvas");
+        glyph.width = cellSize;
+        glyph.height = cellSize;
+        let context = glyph.getContext("2d");
+        context.fillStyle = "black";
+        context.fillRect(0, 0, cellSize, cellSize);
+        context.fillStyle = "white";
+        context.font = fontSize + "px monospace";
+        context.textBaseline = "top";
+        context.fillText(char, 0, 0);
+        return glyph;
+    });
+}
+
+// plays an ASCII video on the player canvas, looping. Every frame stores how much each cell's char index changed,
+// so only cells that changed get drawn again
+function playAsciiVideo(video) {
+    stopAsciiVideo();
+    let header = video.header;
+    let cols = header.cols;
+    let cells = header.rows * cols;
+    let frames = cells > 0 ? Math.floor(video.deltas.length / cells) : 0;
+    if (frames == 0) {
+        return;
+    }
+    let cellSize = Math.max(Math.ceil(header.fontSize * 0.8 * header.spacing), 1);
+    let canvas = asciiPlayer[0];
+    canvas.width = cols * cellSize;
+    canvas.height = header.rows * cellSize;
+    // drawn at the size of a cell, shown at the size the video would have been
+    asciiPlayer.css("width", header.width + "px");
+    let context = canvas.getContext("2d");
+    let glyphs = drawGlyphs(header.chars, header.fontSize, cellSize);
+    let indices = new Uint8Array(cells);
+    let changed = new Uint8Array(cells).fill(1);
+    let current = -1;
+    let start = null;
+
+    function step(time) {
+        if (start == null) {
+            start = time;
+        }
+        let target = Math.floor((time - start) / 1000 * header.fps);
+        if (target >= frames) {
+            // start over, the frame before the first one is all 0s
+            start = time;
+            target = 0;
+            current = -1;
+            indices.fill(0);
+            changed.fill(1);
+        }
+        // frames we didn't get to draw in time are still applied, just never drawn
+        while (current < target) {
+            current++;
+            let offset = current * cells;
+            for (let i = 0; i < cells; i++) {
+                let delta = video.deltas[offset + i];
+                if (delta != 0) {
+                    // Uint8Array wraps around, just like the deltas do
+                    indices[i] += delta;
+                    changed[i] = 1;
+                }
+            }
+        }
+        for (let i = 0; i < cells; i++) {
+            if (changed[i]) {
+                context.drawImage(glyphs[indices[i]], (i % cols) * cellSize, Math.floor(i / cols) * cellSize);
+                changed[i] = 0;
+            }
+        }
+        playerFrame = window.requestAnimationFrame(step);
+    }
+    asciiPlayer.show();
+    playerFrame = window.requestAnimationFrame(step);
+}
+
+function stopAsciiVideo() {
+    if (playerFrame != null) {
+        window.cancelAnimationFrame(playerFrame);
+        playerFrame = null;
+    }
+    asciiPlayer.hide();
+}
+
 function showProgress() {
+    stopAsciiVideo();
     allInputs.prop("disabled", true);
     statusMessage.text("Queuing...");
     progressBar.css("width", "0%");
@@ -0,0 +1,243 @@
+import os
+import io
+import shutil
+import threading
+from uuid import uuid4
+
+# size of the pieces files are streamed in. Firebase (Google Cloud Storage) needs a multiple of 256 KB
+CHUNK_SIZE = 8 * 1024 * 1024
+
+def copy_stream(source, destination, chunk_size=CHUNK_SIZE):
+    """Copies one file object into another, chunk_size bytes at a time. Returns the number of bytes copied"""
+    copied = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        destination.write(chunk)
+        copied += len(chunk)
+    return copied
+
+class LocalStorage:
+    """Represents storage in a folder on disk, like a volume shared by the web processes and workers.
+    Keys are paths relative to the folder
+
+    Files can be handed off by path (see local_path), so when everyone shares the folder nothing gets copied at all
+
+    Properties
+    ----------
+    folder : string
+        - folder files are stored in
+
+    Methods
+    --------
+    upload
+        - stores a local file under a key (moves it if move is True)
+    download
+        - copies the file of a key to a local path
+    save_stream
+        - stores everything read from a file object under a key
+    load_stream
+        - writes the file of a key into a file object
+    iter_chunks
+        - yields the file of a key chunk by chunk
+    exists
+        - returns whether a key has a file
+    delete
+        - deletes the file of a key, if there is one
+    local_path
+        - returns the path a key is stored at, so it can be used in place
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        if not os.path.isdir(folder) : os.makedirs(folder)
+
+    def local_path(self, key):
+        path = os.path.join(self.folder, key)
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent) : os.makedirs(parent, exist_ok=True)
+        return path
+
+    def _partial_path(self, key):
+        # written under a temporary name first, so no one ever reads a half written file
+        return self.local_path(key) + "." + uuid4().hex + ".part"
+
+    def upload(self, file_path, key, move=False):
+        path = self.local_path(key)
+        if os.path.abspath(file_path) == os.path.abspath(path):
+            return
+        if move:
+            try:
+                os.replace(file_path, path)
+                return
+            except OSError:
+                # different file system, fall back to copying
+                pass
+        partial_path = self._partial_path(key)
+        shutil.copyfile(file_path, partial_path)
+        os.replace(partial_path, path)
+        if move : os.remove(file_path)
+
+    def download(self, key, file_path):
+        path = self.local_path(key)
+        if os.path.abspath(file_path) == os.path.abspath(path):
+            return
+        try:
+            # same file system, so link instead of copying
+            os.link(path, file_path)
+        except OSError:
+            shutil.copyfile(path, file_path)
+
+    def save_stream(self, source, key):
+        partial_path = self._partial_path(key)
+        with open(partial_path, "wb") as destination:
+            copied = copy_stream(source, destination)
+        os.replace(partial_path, self.local_path(key))
+        return copied
+
+    def load_stream(self, key, destination):
+        with open(self.local_path(key), "rb") as source:
+            return copy_stream(source, destination)
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        with open(self.local_path(key), "rb") as source:
+            for chunk in iter(lambda: source.read(chunk_size), b""):
+                yield chunk
+
+    def exists(self, key):
+        return os.path.isfile(os.path.join(self.folder, key))
+
+    def delete(self, key):
+        try:
+            os.remove(os.path.join(self.folder, key))
+        except FileNotFoundError:
+            pass
+
+class MemoryStorage:
+    """Represents storage kept in memory, for tests and for running the app and jobs in one process without any services.
+    Same methods as LocalStorage, but nothing is shared with other processes and local_path is always None
+    """
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def local_path(self, key):
+        return None
+
+    def upload(self, file_path, key, move=False):
+        with open(file_path, "rb") as source:
+            self.save_stream(source, key)
+        if move : os.remove(file_path)
+
+    def download(self, key, file_path):
+        with open(file_path, "wb") as destination:
+            self.load_stream(key, destination)
+
+    def save_stream(self, source, key):
+        destination = io.BytesIO()
+        copied = copy_stream(source, destination)
+        with self._lock:
+            self._files[key] = destination.getvalue()
+        return copied
+
+    def load_stream(self, key, destination):
+        with self._lock:
+            data = self._files[key]
+        destination.write(data)
+        return len(data)
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        with self._lock:
+            data = self._files[key]
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    def exists(self, key):
+        with self._lock:
+            return key in self._files
+
+    def delete(self, key):
+        with self._lock:
+            self._files.pop(key, None)
+
+class FirebaseStorage:
+    """Represents storage in a Firebase (Google Cloud Storage) bucket. Keys are blob names.
+    Same methods as LocalStorage. Every transfer is a resumable one in CHUNK_SIZE pieces,
+    so whole files are never held in memory. local_path is always None
+    """
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def _blob(self, key):
+        return self._bucket.blob(key, chunk_size=CHUNK_SIZE)
+
+    def local_path(self, key):
+        return None
+
+    def upload(self, file_path, key, move=False):
+        self._blob(key).upload_from_filename(file_path)
+        if move : os.remove(file_path)
+
+    def download(self, key, file_path):
+        self._blob(key).download_to_filename(file_path)
+
+    def save_stream(self, source, key):
+        start = source.tell() if source.seekable() else 0
+        self._blob(key).upload_from_file(source)
+        return source.tell() - start if source.seekable() else None
+
+    def load_stream(self, key, destination):
+        self._blob(key).download_to_file(destination)
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        blob = self._bucket.get_blob(key)
+        if blob is None:
+            raise FileNotFoundError(key)
+        for start in range(0, blob.size, chunk_size):
+            # end is inclusive
+            yield blob.download_as_bytes(start=start, end=min(start + chunk_size, blob.size) - 1)
+
+    def exists(self, key):
+        return self._blob(key).exists()
+
+    def delete(self, key):
+        blob = self._blob(key)
+        if blob.exists() : blob.delete()
+
+def firebase_bucket(firebase_key, bucket_name):
+    """Returns the Firebase storage bucket, initializing the Firebase app the first time it's called in a process"""
+    # only imported when Firebase is actually used, so the rest works without it installed or configured
+    import firebase_admin
+    from firebase_admin import credentials, storage
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.Certificate(firebase_key), {"storageBucket": bucket_name})
+    return storage.bucket()
+
+_memory_storage = None
+
+def get_storage(kind="firebase", folder=None, firebase_key=None, firebase_bucket_name=None):
+    """Returns the storage to use
+
+    Parameters
+    ---------
+    kind : string
+        - "firebase", "local" (a folder, possibly a shared volume) or "memory" (one per process)
+    folder : string
+        - LOCAL ONLY. Folder to store files in
+    firebase_key : dict
+        - FIREBASE ONLY. Service account credentials
+    firebase_bucket_name : string
+        - FIREBASE ONLY. Bucket to store files in
+    """
+    global _memory_storage
+    if kind == "local":
+        return LocalStorage(folder)
+    if kind == "memory":
+        if _memory_storage is None:
+            _memory_storage = MemoryStorage()
+        return _memory_storage
+    if kind == "firebase":
+        return FirebaseStorage(firebase_bucket(firebase_key, firebase_bucket_name))
+    raise ValueError("unknown storage " + str(kind))
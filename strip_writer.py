@@ -0,0 +1,211 @@
+import os
+import struct
+import zlib
+import numpy as np
+
+# PIL (and OpenCV) can only save an image they hold in memory all at once. Grayscale PNGs and TIFFs are simple enough
+# to write a few rows at a time instead: a PNG is a header chunk, the rows as one zlib stream split over any number
+# of IDAT chunks, and an end chunk. So a huge output never has to be in memory as a whole (see convert.render_strips)
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# compressed data is written out as a chunk once there's this much of it
+PNG_CHUNK_BYTES = 1024 * 1024
+# TIFFs are made of strips of rows that are compressed on their own, about this many bytes (uncompressed) each
+TIFF_STRIP_BYTES = 1024 * 1024
+
+class PngStripWriter:
+    """Writes an 8 bit grayscale PNG from top to bottom, a strip of rows at a time
+
+    Properties
+    ----------
+    size : (int, int)
+        - (width, height) of the image
+    rows : int
+        - number of rows written so far
+
+    Methods
+    --------
+    write
+        - writes the next rows (2D uint8 array, one row of pixels per row)
+    close
+        - writes what's left of the compressed rows and closes the file. The image must be complete by then
+    discard
+        - closes and removes the file, for conversions that didn't make it to the end
+    """
+    def __init__(self, path, size, level=6):
+        self.path = path
+        self.size = size
+        self.rows = 0
+        self._file = open(path, "wb")
+        self._compressor = zlib.compressobj(level)
+        self._pending = []
+        self._pending_bytes = 0
+        width, height = size
+        self._file.write(PNG_SIGNATURE)
+        # 8 bit depth, grayscale, deflate, adaptive filtering, no interlacing
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)) + chunk_type + data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def _add_compressed(self, data, flush=False):
+        if data:
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+        if self._pending_bytes >= PNG_CHUNK_BYTES or (flush and self._pending_bytes > 0):
+            self._write_chunk(b"IDAT", b"".join(self._pending))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def write(self, strip):
+        strip = np.ascontiguousarray(strip, dtype=np.uint8)
+        if strip.ndim != 2 or strip.shape[1] != self.size[0]:
+            raise ValueError("strip has shape %s, expected (rows, %d)" % (strip.shape, self.size[0]))
+        if self.rows + strip.shape[0] > self.size[1]:
+            raise ValueError("more rows than the image is high")
+        # every row starts with its filter type, 0 means the row is stored as is
+        filtered = np.zeros((strip.shape[0], strip.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 1:] = strip
+        self._add_compressed(self._compressor.compress(filtered.tobytes()))
+        self.rows += strip.shape[0]
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows != self.size[1]:
+                raise ValueError("only %d of %d rows were written" % (self.rows, self.size[1]))
+            self._add_compressed(self._compressor.flush(), flush=True)
+            self._write_chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class TiffStripWriter:
+    """Same as PngStripWriter, for an 8 bit grayscale TIFF. Rows are regrouped into TIFF strips of rows_per_strip rows,
+    each compressed on its own (deflate), and the directory of where every strip is goes at the end of the file.
+    Plain TIFF offsets are 32 bit, so the file can't grow past 4 GB
+    """
+    def __init__(self, path, size, level=6):
+        self.path = path
+        self.size = size
+        self.rows = 0
+        self.rows_per_strip = max(1, min(size[1], TIFF_STRIP_BYTES // max(size[0], 1)))
+        self._level = level
+        self._file = open(path, "wb")
+        self._pending = []
+        self._pending_rows = 0
+        self._offsets = []
+        self._byte_counts = []
+        # little endian, then the offset of the directory, filled in by close
+        self._file.write(b"II" + struct.pack("<HI", 42, 0))
+
+    def write(self, strip):
+        strip = np.ascontiguousarray(strip, dtype=np.uint8)
+        if strip.ndim != 2 or strip.shape[1] != self.size[0]:
+            raise ValueError("strip has shape %s, expected (rows, %d)" % (strip.shape, self.size[0]))
+        if self.rows + strip.shape[0] > self.size[1]:
+            raise ValueError("more rows than the image is high")
+        self._pending.append(strip)
+        self._pending_rows += strip.shape[0]
+        self.rows += strip.shape[0]
+        if self._pending_rows >= self.rows_per_strip:
+            rows = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+            while len(rows) >= self.rows_per_strip:
+                self._write_strip(rows[:self.rows_per_strip])
+                rows = rows[self.rows_per_strip:]
+            self._pending = [rows] if len(rows) > 0 else []
+            self._pending_rows = len(rows)
+
+    def _write_strip(self, rows):
+        data = zlib.compress(np.ascontiguousarray(rows).tobytes(), self._level)
+        offset = self._file.tell()
+        if offset + len(data) >= 2 ** 32:
+            raise ValueError("TIFF would be over 4 GB, save as .png instead")
+        self._file.write(data)
+        self._offsets.append(offset)
+        self._byte_counts.append(len(data))
+
+    def _write_directory(self):
+        # arrays that don't fit in an entry (4 bytes) are written before the directory, which points to them
+        def array_offset(values):
+            if len(values) == 1:
+                return values[0]
+            offset = self._file.tell()
+            self._file.write(struct.pack("<%dI" % len(values), *values))
+            return offset
+        strip_offsets = array_offset(self._offsets)
+        strip_byte_counts = array_offset(self._byte_counts)
+        if self._file.tell() % 2 == 1:
+            self._file.write(b"\0")
+        directory_offset = self._file.tell()
+        if directory_offset >= 2 ** 32:
+            raise ValueError("TIFF would be over 4 GB, save as .png instead")
+        width, height = self.size
+        # (tag, type, count, value), type 3 is a 16 bit short and 4 a 32 bit long. Tags have to be in order
+        entries = [
+            (256, 4, 1, width),
+            (257, 4, 1, height),
+            (258, 3, 1, 8),                                 # bits per sample
+            (259, 3, 1, 8),                                 # deflate compression
+            (262, 3, 1, 1),                                 # 0 is black
+            (273, 4, len(self._offsets), strip_offsets),
+            (277, 3, 1, 1),                                 # samples per pixel
+            (278, 4, 1, self.rows_per_strip),
+            (279, 4, len(self._byte_counts), strip_byte_counts)
+        ]
+        directory = struct.pack("<H", len(entries))
+        for tag, value_type, count, value in entries:
+            packed_value = struct.pack("<HH", value, 0) if value_type == 3 else struct.pack("<I", value)
+            directory += struct.pack("<HHI", tag, value_type, count) + packed_value
+        # no next directory
+        self._file.write(directory + struct.pack("<I", 0))
+        self._file.seek(4)
+        self._file.write(struct.pack("<I", directory_offset))
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows != self.size[1]:
+                raise ValueError("only %d of %d rows were written" % (self.rows, self.size[1]))
+            if self._pending_rows > 0:
+                self._write_strip(np.concatenate(self._pending))
+                self._pending = []
+                self._pending_rows = 0
+            self._write_directory()
+        finally:
+            self._file.close()
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+# extensions the strip writers can write, and the writer for each. Anything else is saved as STRIP_FALLBACK_EXT
+STRIP_WRITERS = {
+    ".png": PngStripWriter,
+    ".tif": TiffStripWriter,
+    ".tiff": TiffStripWriter
+}
+STRIP_FALLBACK_EXT = ".png"
+
+def strip_output_path(path):
+    """Returns the path an image written a strip at a time is saved to: path itself if its extension has a strip writer,
+    otherwise path with a .png extension. JPEG (and most other formats) can only be encoded from a whole image in memory,
+    which is what writing in strips avoids, and JPEGs can't be more than 65535 pixels wide or high anyway"""
+    name, ext = os.path.splitext(path)
+    if ext.lower() in STRIP_WRITERS:
+        return path
+    return name + STRIP_FALLBACK_EXT
+
+def open_strip_writer(path, size):
+    """Returns the strip writer for an output path (see STRIP_WRITERS and strip_output_path)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in STRIP_WRITERS:
+        raise ValueError("can't write %s files a strip at a time, see strip_output_path" % ext)
+    return STRIP_WRITERS[ext](path, size)
@@ -0,0 +1,65 @@
+import os
+import fakeredis
+import pytest
+from rq import Queue, SimpleWorker
+from admission import add_backlog, release_backlog, queue_wait, BACKLOG_KEY, JOB_COST_KEY
+
+os.environ.setdefault("REDIS_URL", "localhost")
+from worker import ReleasesBacklog
+
+class BacklogWorker(ReleasesBacklog, SimpleWorker):
+    def _install_signal_handlers(self):
+        # rq's handlers would stay behind in the test process, and in every process forked from it later
+        pass
+
+def succeed():
+    return "done"
+
+def fail():
+    raise ValueError("conversion went wrong")
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeStrictRedis(server=fakeredis.FakeServer())
+
+def backlog(redis, name):
+    return float(redis.get(BACKLOG_KEY + name) or 0)
+
+def test_backlog_adds_up_and_is_released_once(redis):
+    queue = Queue("image", connection=redis)
+    add_backlog(redis, "image", "a.jpg", 10)
+    add_backlog(redis, "image", "b.jpg", 2.5)
+    add_backlog(redis, "video", "c.mp4", 100)
+    assert queue_wait(queue) == pytest.approx(12.5)
+
+    release_backlog(redis, "a.jpg")
+    release_backlog(redis, "a.jpg")
+    release_backlog(redis, "never_added.jpg")
+    assert queue_wait(queue) == pytest.approx(2.5)
+    assert backlog(redis, "video") == pytest.approx(100)
+    assert not redis.exists(JOB_COST_KEY + "a.jpg")
+
+def test_backlog_is_split_between_workers(redis):
+    queue = Queue("image", connection=redis)
+    add_backlog(redis, "image", "a.jpg", 12)
+    for i in range(3):
+        BacklogWorker([queue], connection=redis, name="worker%d" % i).register_birth()
+    assert queue_wait(queue) == pytest.approx(4)
+
+def test_running_jobs_count_until_they_end(redis):
+    queue = Queue("image", connection=redis)
+    add_backlog(redis, "image", "a.jpg", 50)
+    queue.enqueue(succeed, job_id="a.jpg")
+    # taken off the queue by a worker, but not finished yet
+    queue.pop_job_id()
+    assert len(queue) == 0
+    assert queue_wait(queue) == pytest.approx(50)
+
+@pytest.mark.parametrize("function", [succeed, fail])
+def test_workers_release_jobs_however_they_end(redis, function):
+    queue = Queue("image", connection=redis)
+    add_backlog(redis, "image", "a.jpg", 30)
+    queue.enqueue(function, job_id="a.jpg")
+    BacklogWorker([queue], connection=redis).work(burst=True)
+    assert backlog(redis, "image") == pytest.approx(0)
+    assert not redis.exists(JOB_COST_KEY + "a.jpg")
@@ -0,0 +1,138 @@
+import io
+import os
+import sys
+import importlib
+import numpy as np
+import cv2
+import fakeredis
+import pytest
+import redis as redis_module
+from rq import SimpleWorker
+from rq.job import Job
+from cache import normalize_params, result_cache_key
+from ascii_video import MAGIC
+
+@pytest.fixture(scope="module")
+def webapp(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("app")
+    patch = pytest.MonkeyPatch()
+    for name, value in {
+        "CORS": "*", "MAX_CONTENT_LENGTH": "50000000", "PROGRESS_RATE": "0.1", "CONVERT_PROCESSES": "1",
+        "CONVERT_THREADS": "1", "REDIS_URL": "localhost", "FAILURE_TTL": "60", "RESULT_TTL": "60", "JOB_TIMEOUT": "300",
+        "TEMP": "temp", "OUTPUT": str(folder / "output"), "STORAGE": "local", "STORAGE_DIR": str(folder / "storage"),
+        "RESULT_CACHE": "disk", "RESULT_CACHE_DIR": str(folder / "cache"), "ADMISSION": "on"
+    }.items():
+        patch.setenv(name, value)
+    server = fakeredis.FakeServer()
+    class FakeRedis(fakeredis.FakeStrictRedis):
+        def __init__(self, *args, **kwargs):
+            super().__init__(server=server)
+    patch.setattr(redis_module, "Redis", FakeRedis)
+    sys.modules.pop("config", None)
+    sys.modules.pop("app", None)
+    app = importlib.import_module("app")
+    yield app
+    patch.undo()
+
+def jpeg(width=640, height=480):
+    img = np.random.default_rng(0).integers(0, 256, (height, width, 3)).astype(np.uint8)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+def post(app, data, name, image_reducer=100, video_output="video"):
+    return app.app.test_client().post("/api/convert", content_type="multipart/form-data", data={
+        "fileUpload": (io.BytesIO(data), name), "imageReduction": str(image_reducer), "fontSize": "10",
+        "spacing": "1.1", "maxWidth": "", "maxHeight": "", "characters": " .*:+%S0#@", "frameFrequency": "24",
+        "videoOutput": video_output
+    })
+
+def image_params(app, image_reducer):
+    return normalize_params(".jpg", image_reducer=image_reducer, fontSize=10, spacing=1.1, maxsize=None,
+                            chars=" .*:+%S0#@", font_path=app.FONT_PATH, sampling=app.SAMPLING, renderer=app.RENDERER)
+
+def test_downgraded_jobs_are_cached_under_their_own_settings(webapp, monkeypatch):
+    data = jpeg()
+    monkeypatch.setattr(webapp, "JOB_BUDGET", 0.3)
+    response = post(webapp, data, "a.jpg", image_reducer=100)
+    assert response.status_code == 200
+    job = Job.fetch(response.get_json(), connection=webapp.redis)
+    admitted = job.kwargs["image_reducer"]
+    assert admitted < 100
+
+    assert job.meta["cache_key"] == result_cache_key(io.BytesIO(data), image_params(webapp, admitted))
+    assert job.meta["cache_key"] != result_cache_key(io.BytesIO(data), image_params(webapp, 100))
+
+    # cached as the downgraded result, so an idle system doesn't hand it out for the full settings
+    output = os.path.join(webapp.OUTPUT, "cached.jpg")
+    with open(output, "wb") as output_file:
+        output_file.write(b"downgraded output")
+    webapp.result_cache.put(job.meta["cache_key"], output)
+    monkeypatch.setattr(webapp, "JOB_BUDGET", 1e9)
+    response = post(webapp, data, "a.jpg", image_reducer=100)
+    assert response.status_code == 200
+    job = Job.fetch(response.get_json(), connection=webapp.redis)
+    assert job.kwargs["image_reducer"] == 100
+
+def mp4(path, frames=12, width=160, height=120):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (width, height))
+    for i in range(frames):
+        writer.write(np.full((height, width, 3), i * 20 % 256, dtype=np.uint8))
+    writer.release()
+    with open(path, "rb") as video_file:
+        return video_file.read()
+
+def test_videos_are_probed_where_they_were_saved(webapp, monkeypatch, tmp_path):
+    import admission
+    def no_temporary_copies(*args, **kwargs):
+        raise AssertionError("video was copied to a temporary file")
+    monkeypatch.setattr(admission.tempfile, "mkstemp", no_temporary_copies)
+    data = mp4(str(tmp_path / "in.mp4"))
+
+    response = post(webapp, data, "a.mp4", image_reducer=10)
+    assert response.status_code == 200
+    job = Job.fetch(response.get_json(), connection=webapp.redis)
+    assert job.meta["cost"] > 0
+    with open(webapp.storage.local_path(os.path.join(webapp.TEMP, job.id)), "rb") as upload:
+        assert upload.read() == data
+
+    # turned away, so the saved upload is gone again
+    monkeypatch.setattr(webapp, "JOB_BUDGET", 0)
+    monkeypatch.setattr(webapp, "DOWNGRADE_JOBS", "off")
+    before = set(os.listdir(webapp.storage.local_path(webapp.TEMP)))
+    response = post(webapp, data, "b.mp4", image_reducer=10)
+    assert response.status_code == 422
+    assert set(os.listdir(webapp.storage.local_path(webapp.TEMP))) == before
+
+class QuietWorker(SimpleWorker):
+    def _install_signal_handlers(self):
+        # rq's handlers would stay behind in the test process
+        pass
+
+def test_ascii_videos_are_saved_and_served_as_ascv(webapp, monkeypatch, tmp_path):
+    import jobs
+    # the worker runs with the app's settings and storage
+    monkeypatch.setattr(jobs, "_config", sys.modules["config"].Config())
+    monkeypatch.setattr(jobs, "_storage", webapp.storage)
+    data = mp4(str(tmp_path / "in.mp4"), frames=48)
+
+    response = post(webapp, data, "a.mp4", image_reducer=10, video_output="ascii")
+    assert response.status_code == 200
+    name = response.get_json()
+    assert name.endswith(".ascv")
+    job = Job.fetch(name, connection=webapp.redis)
+    assert job.kwargs["filename"].endswith(".mp4")
+    QuietWorker([job.origin], connection=webapp.redis).work(burst=True)
+    job.refresh()
+    assert job.get_status() == "finished" and job.result == name
+
+    response = webapp.app.test_client().post("/api/getoutput", json=name)
+    assert response.status_code == 200
+    assert name in response.headers["Content-Disposition"]
+    assert response.get_data()[:len(MAGIC)] == MAGIC
+
+    # a cache hit is handed out under the same kind of name
+    webapp.result_cache.put(job.meta["cache_key"], os.path.join(webapp.OUTPUT, name))
+    response = post(webapp, data, "b.mp4", image_reducer=10, video_output="ascii")
+    cached = response.get_json()
+    assert cached.endswith(".ascv")
+    with open(os.path.join(webapp.OUTPUT, cached), "rb") as output:
+        assert output.read(len(MAGIC)) == MAGIC
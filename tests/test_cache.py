@@ -0,0 +1,19 @@
+import io
+import numpy as np
+import cv2
+import convert
+from cache import normalize_params, result_cache_key
+
+def test_renderers_get_their_own_cache_keys():
+    img = np.random.default_rng(0).integers(0, 256, (120, 160, 3)).astype(np.uint8)
+    # glyphs overlap at low spacing, which is where the renderers differ
+    pil = convert.convert_image(img, 50, 10, 0.5, renderer="pil")
+    atlas = convert.convert_image(img, 50, 10, 0.5, renderer="atlas")
+    assert not np.array_equal(np.asarray(pil), np.asarray(atlas))
+
+    data = cv2.imencode(".png", img)[1].tobytes()
+    keys = {
+        renderer: result_cache_key(io.BytesIO(data), normalize_params(".png", 50, 10, 0.5, renderer=renderer))
+        for renderer in convert.RENDERERS
+    }
+    assert len(set(keys.values())) == len(convert.RENDERERS)
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import cv2
+import convert
+
+def write_images(folder, names):
+    for i, name in enumerate(names):
+        path = os.path.join(folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        img = np.full((60, 80), i * 40, dtype=np.uint8)
+        cv2.rectangle(img, (10, 10), (40, 40), 255, -1)
+        cv2.imwrite(path, img)
+
+def list_files(folder):
+    return sorted(
+        os.path.relpath(os.path.join(parent, name), folder)
+        for parent, folders, names in os.walk(folder) for name in names
+    )
+
+def test_outputs_inside_input_folder_are_not_converted_again(tmp_path, monkeypatch):
+    write_images(str(tmp_path), ["a.jpg", "b.png", os.path.join("sub", "c.jpg")])
+    monkeypatch.chdir(tmp_path)
+
+    first = convert.convert_images(["."], "outdir", processes=1, image_reducer=50)
+    outputs = list_files("outdir")
+    assert first["converted"] == 3
+    assert outputs == ["a.jpg", "b.jpg", os.path.join("sub", "c.jpg")]
+
+    second = convert.convert_images(["."], "outdir", processes=1, image_reducer=50)
+    assert second["converted"] == 0 and second["failed"] == 0
+    assert second["skipped"] == 3
+    assert list_files("outdir") == outputs
+
+    # forcing redoes the inputs, still never the outputs
+    third = convert.convert_images(["."], "outdir", force=True, processes=1, image_reducer=50)
+    assert third["converted"] == 3
+    assert list_files("outdir") == outputs
+
+def test_find_images_excludes_folder(tmp_path):
+    write_images(str(tmp_path), ["a.jpg", os.path.join("out", "a.jpg")])
+    found = convert.find_images([str(tmp_path)], exclude=str(tmp_path / "out"))
+    assert found == [os.path.join(str(tmp_path), "a.jpg")]
@@ -0,0 +1,36 @@
+import numpy as np
+import cv2
+import pytest
+import convert
+
+def image(width=640, height=480):
+    x, y = np.meshgrid(np.linspace(0, 1, width), np.linspace(0, 1, height))
+    img = (127 + 100 * np.sin(x * 9 + y * 4)).astype(np.uint8)
+    cv2.circle(img, (width // 3, height // 2), height // 4, 255, -1)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+@pytest.mark.parametrize("renderer", ["pil", "atlas"])
+@pytest.mark.parametrize("maxsize", [(1, 1), (2, 2), (3, 5), (8, 8), (12, 12), (1, 300), (300, 1)])
+def test_outputs_smaller_than_a_char_match_a_shrunk_full_output(renderer, maxsize):
+    img = image()
+    full = convert.convert_image(img, 10, 10, 1.1, None, renderer=renderer)
+    full.thumbnail(maxsize)
+    output = convert.convert_image(img, 10, 10, 1.1, maxsize, renderer=renderer)
+    assert output.size == full.size
+    assert np.array_equal(np.asarray(output), np.asarray(full))
+    assert np.asarray(output).mean() > 0
+
+def test_incremental_renderer_shrinks_tiny_outputs():
+    img = image()
+    plan = convert.plan_output(480, 640, 10, 10, 1.1, (4, 4))
+    renderer = convert.IncrementalRenderer((480, 640), 10, 10, 1.1, maxsize=(4, 4))
+    output, cells = renderer.render(convert.image_to_indices(img, 10, reducer=plan.reducer))
+    assert output.size == plan.size == (4, 3)
+    assert cells == plan.shape[0] * plan.shape[1]
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 2), (1, 500)])
+@pytest.mark.parametrize("maxsize", [None, (1, 1)])
+def test_plans_have_at_least_one_cell(shape, maxsize):
+    plan = convert.plan_output(shape[0], shape[1], 10, 1, 0.1, maxsize)
+    assert plan.shape[0] >= 1 and plan.shape[1] >= 1
+    assert plan.size[0] >= 1 and plan.size[1] >= 1
@@ -0,0 +1,141 @@
+import json
+import time
+import queue
+import fakeredis
+import pytest
+from rq.job import Job
+import progress
+from progress import ProgressHub, ProgressPublisher, PROGRESS_CHANNEL, progress_message
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeStrictRedis(server=fakeredis.FakeServer())
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def receivers(redis, job_id):
+    # publish returns how many subscriptions got the message
+    return redis.publish(PROGRESS_CHANNEL + job_id, progress_message("queued"))
+
+def test_every_listener_of_a_job_gets_every_update(redis):
+    hub = ProgressHub(redis)
+    listeners = [hub.listen("a") for i in range(3)]
+    for value in (10, 20, 30):
+        redis.publish(PROGRESS_CHANNEL + "a", progress_message("started", value))
+    for listener in listeners:
+        values = [json.loads(listener.get(timeout=5))["progress"] for i in range(3)]
+        assert values == [10, 20, 30]
+    for listener in listeners:
+        hub.unlisten("a", listener)
+
+def test_listeners_only_get_their_own_job(redis):
+    hub = ProgressHub(redis)
+    listener_a = hub.listen("a")
+    listener_b = hub.listen("b")
+    redis.publish(PROGRESS_CHANNEL + "b", progress_message("started", 50))
+    redis.publish(PROGRESS_CHANNEL + "a", progress_message("started", 25))
+    assert json.loads(listener_a.get(timeout=5))["progress"] == 25
+    assert json.loads(listener_b.get(timeout=5))["progress"] == 50
+    # a's only message was a's, and it's been taken
+    with pytest.raises(queue.Empty):
+        listener_a.get(timeout=0.2)
+    hub.unlisten("a", listener_a)
+    hub.unlisten("b", listener_b)
+
+def test_last_unlisten_releases_subscription(redis):
+    hub = ProgressHub(redis)
+    first = hub.listen("a")
+    second = hub.listen("b")
+    assert receivers(redis, "a") == 1
+
+    hub.unlisten("a", first)
+    assert hub.subscribed()
+    assert receivers(redis, "b") == 1
+
+    hub.unlisten("b", second)
+    assert not hub.subscribed()
+    assert wait_for(lambda: receivers(redis, "b") == 0)
+
+    # listening again subscribes again
+    third = hub.listen("c")
+    assert receivers(redis, "c") == 1
+    hub.unlisten("c", third)
+    assert wait_for(lambda: receivers(redis, "c") == 0)
+
+class FakeClock:
+    """Stands in for the time module inside progress only, so Redis clients keep the real clock"""
+    sleep = staticmethod(time.sleep)
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(progress, "time", fake_clock)
+    return fake_clock
+
+def make_job(redis):
+    job = Job.create(func=print, connection=redis)
+    job.save()
+    return job
+
+def subscribe(redis, job):
+    pubsub = redis.pubsub()
+    pubsub.subscribe(PROGRESS_CHANNEL + job.id)
+    return pubsub
+
+def published(pubsub):
+    messages = []
+    while True:
+        message = pubsub.get_message(timeout=0.05)
+        if message is None:
+            return messages
+        if message["type"] == "message":
+            messages.append(json.loads(message["data"]))
+
+def test_publisher_rate_limit(redis, clock):
+    job = make_job(redis)
+    pubsub = subscribe(redis, job)
+    publisher = ProgressPublisher(job, interval=0.5, min_change=0.5)
+
+    assert publisher.update(1)
+    # too soon, even though it changed a lot
+    clock.now += 0.1
+    assert not publisher.update(20)
+    # late enough and changed enough
+    clock.now += 0.5
+    assert publisher.update(20)
+    # late enough, but too small a change
+    clock.now += 0.6
+    assert not publisher.update(20.1)
+    # small changes still get through after 4 intervals
+    clock.now += 1.5
+    assert publisher.update(20.2)
+    # finishing is never held back
+    assert publisher.update(100)
+
+    assert [message["progress"] for message in published(pubsub)] == [1, 20, 20.2, 100]
+    assert Job.fetch(job.id, connection=redis).meta["progress"] == 100
+
+def test_publisher_only_saves_changes(redis, clock):
+    job = make_job(redis)
+    pubsub = subscribe(redis, job)
+    publisher = ProgressPublisher(job, interval=0.5, min_change=0.5)
+
+    assert publisher.update(50)
+    for i in range(5):
+        clock.now += 10
+        assert not publisher.update(50)
+    assert publisher.update(100)
+    assert not publisher.update(100)
+    assert [message["progress"] for message in published(pubsub)] == [50, 100]
@@ -0,0 +1,73 @@
+import os
+import tracemalloc
+import numpy as np
+import cv2
+import pytest
+from PIL import Image
+import convert
+import strip_writer
+from strip_writer import open_strip_writer, strip_output_path
+
+def random_image(width, height, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width)).astype(np.uint8)
+
+@pytest.mark.parametrize("ext", [".png", ".tif", ".tiff"])
+def test_strips_add_up_to_the_image(tmp_path, ext):
+    img = random_image(1500, 1100)
+    path = str(tmp_path / ("out" + ext))
+    writer = open_strip_writer(path, (1500, 1100))
+    top = 0
+    # strips of any height, none lining up with how the writers group rows
+    for rows in (1, 333, 700, 66):
+        writer.write(img[top:top + rows])
+        top += rows
+    writer.close()
+    assert np.array_equal(np.asarray(Image.open(path)), img)
+
+def test_formats_without_strip_writer_are_saved_as_png():
+    assert strip_output_path(os.path.join("a", "b.jpg")) == os.path.join("a", "b.png")
+    assert strip_output_path("b.webp") == "b.png"
+    assert strip_output_path("b") == "b.png"
+    assert strip_output_path("b.TIF") == "b.TIF"
+    assert strip_output_path("b.png") == "b.png"
+    with pytest.raises(ValueError):
+        open_strip_writer("b.jpg", (10, 10))
+
+def test_unfinished_image_is_discarded(tmp_path):
+    path = str(tmp_path / "out.tif")
+    writer = open_strip_writer(path, (100, 100))
+    writer.write(random_image(100, 10))
+    with pytest.raises(ValueError):
+        writer.close()
+    writer.discard()
+    assert not os.path.exists(path)
+
+@pytest.mark.parametrize("requested, saved", [("out.jpg", "out.png"), ("out.tif", "out.tif")])
+def test_tiled_output_memory_is_bound_by_strips(tmp_path, monkeypatch, requested, saved):
+    # small input, big output: 120 x 80 cells of 30px chars
+    source = cv2.resize(random_image(60, 40, seed=1), (240, 160), interpolation=cv2.INTER_NEAREST)
+    image_path = str(tmp_path / "in.png")
+    cv2.imwrite(image_path, source)
+    monkeypatch.setattr(convert, "STRIP_PIXELS", 128 * 1024)
+    monkeypatch.setattr(strip_writer, "TIFF_STRIP_BYTES", 128 * 1024)
+    settings = dict(image_reducer=50, fontSize=30, spacing=1.1, chars=" .*:+%S0#@", renderer="atlas")
+
+    # warm up the font and atlas caches, they aren't part of the output
+    convert.get_glyph_atlas(30, settings["chars"], None)
+    tracemalloc.start()
+    try:
+        saved_path = convert._convert_image_path_and_save(
+            image_path, str(tmp_path / requested), tiled=True, threads=1, **settings
+        )
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert saved_path == str(tmp_path / saved)
+    output = np.asarray(Image.open(saved_path))
+    assert output.size > 4 * 1024 * 1024
+    # a few strips, never the whole output
+    assert peak < output.size / 4
+
+    whole = convert.convert_image(source, **settings)
+    assert np.array_equal(output, np.asarray(whole.convert("L")))
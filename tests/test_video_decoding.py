@@ -0,0 +1,30 @@
+import numpy as np
+import imageio
+import pytest
+import convert
+
+def short_gop_video(path, frames=130, gop=12):
+    writer = imageio.get_writer(path, fps=24, quality=None, bitrate=2000000, macro_block_size=1,
+                                output_params=["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"])
+    for i in range(frames):
+        frame = np.full((120, 160, 3), i * 2 % 256, dtype=np.uint8)
+        frame[30:70, i:i + 40] = 255
+        writer.append_data(frame)
+    writer.close()
+    return path
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    yield short_gop_video(str(tmp_path_factory.mktemp("video") / "gop12.mp4"))
+    convert._close_frame_pool()
+
+@pytest.mark.parametrize("decoders", [2, 4])
+@pytest.mark.parametrize("ext", [".mp4", convert.ASCII_VIDEO_EXT])
+def test_parallel_decoders_decode_every_frame_once(video, tmp_path, decoders, ext):
+    # GOPs shorter than SEEK_MIN_FRAMES, so only seeking keeps a decoder out of the others' segments
+    summary = convert.convert_video_path_and_save(
+        video, str(tmp_path / ("out" + ext)), str(tmp_path / "temp"),
+        frame_frequency=1, image_reducer=20, processes=1, decoders=decoders
+    )
+    assert summary["frames_included"] == summary["frames_total"]
+    assert summary["frames_decoded"] <= summary["frames_total"]
@@ -0,0 +1,65 @@
+import os
+import cv2
+import numpy as np
+import pytest
+import convert
+from timings import StageTimings
+
+# jobs reads its settings (config.py) from the environment
+for name, value in {
+    "MAX_CONTENT_LENGTH": "50000000", "PROGRESS_RATE": "0.1", "CONVERT_PROCESSES": "2", "CONVERT_THREADS": "1",
+    "REDIS_URL": "localhost", "FAILURE_TTL": "60", "RESULT_TTL": "60", "JOB_TIMEOUT": "300"
+}.items():
+    os.environ.setdefault(name, value)
+import jobs
+
+def mp4(path, frames=12, width=160, height=120):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 24, (width, height))
+    for i in range(frames):
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        cv2.rectangle(frame, (i * 10, 30), (i * 10 + 40, 70), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+class RecordingPublisher:
+    def __init__(self):
+        self.values = []
+
+    def update(self, value):
+        self.values.append(value)
+
+@pytest.fixture
+def frame_pool():
+    yield
+    jobs._cancel.clear()
+    convert._close_frame_pool()
+
+def convert_inline(folder, name, publisher):
+    video_path = mp4(os.path.join(folder, name + ".mp4"))
+    output_path = os.path.join(folder, name + ".out.mp4")
+    jobs.convert_video_inline(
+        StageTimings(), publisher, video_path, output_path, os.path.join(folder, name + "/"),
+        1, 20, 10, 1.1, None, " .*:+%S0#@", False, 2, "atlas", None, "video"
+    )
+    return video_path, output_path
+
+def test_inline_video_jobs_reuse_the_frame_pool(tmp_path, frame_pool):
+    # a warm worker starts it before taking any jobs (see worker.start_worker)
+    pool = convert.get_frame_pool(2)
+    pids = [p.pid for p in pool._workers]
+
+    for name in ["a", "b"]:
+        publisher = RecordingPublisher()
+        video_path, output_path = convert_inline(str(tmp_path), name, publisher)
+        assert os.path.getsize(output_path) > 0
+        assert publisher.values[-1] == 100
+        assert convert.get_frame_pool(2) is pool
+        assert [p.pid for p in pool._workers] == pids
+    assert pool.is_alive()
+
+def test_canceled_inline_video_job_removes_its_files(tmp_path, frame_pool):
+    jobs.cancel_current_job()
+    with pytest.raises(jobs.JobCanceled):
+        convert_inline(str(tmp_path), "a", RecordingPublisher())
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+import cProfile
+from contextlib import contextmanager
+
+class StageTimings:
+    """Collects how long each named stage of a conversion took, plus counts of what it worked on
+    (pixels, cells, frames, bytes...). A stage that runs many times (like once per frame) is added up
+
+    CPU time is the CPU time of the thread that ran the stage, so stages running at the same time
+    on different threads don't count each other's work. Threads can share one StageTimings
+
+    Properties
+    ----------
+    stages : dict
+        - stage name -> {"wall": secs, "cpu": secs, "calls": int, and any counts}
+
+    Methods
+    --------
+    stage
+        - context manager that times everything inside it as one call of a stage
+    add
+        - adds an already measured call of a stage
+    merge
+        - adds every stage of another StageTimings.as_dict()
+    as_dict
+        - returns a plain dict of every stage, safe to pickle or save as JSON
+    report
+        - returns the stages as a printable table
+    """
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """Counts can be given up front, or set on the yielded dict once they're known
+        e.g. with timings.stage("map") as counts: counts["cells"] = indices.size"""
+        counts = dict(counts)
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield counts
+        finally:
+            self.add(name, time.perf_counter() - start_wall, time.thread_time() - start_cpu, **counts)
+
+    def add(self, name, wall, cpu=0.0, calls=1, **counts):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"wall": 0.0, "cpu": 0.0, "calls": 0}
+            stage["wall"] += wall
+            stage["cpu"] += cpu
+            stage["calls"] += calls
+            for key, value in counts.items():
+                stage[key] = stage.get(key, 0) + value
+
+    def merge(self, stages, prefix=""):
+        for name, stage in stages.items():
+            self.add(prefix + name, **stage)
+
+    def as_dict(self):
+        with self._lock:
+            return {name: dict(stage) for name, stage in self.stages.items()}
+
+    def report(self):
+        lines = ["%-20s %10s %10s %8s  %s" % ("stage", "wall secs", "cpu secs", "calls", "counts")]
+        for name, stage in self.stages.items():
+            counts = ", ".join(
+                "%s=%d" % (key, value) for key, value in stage.items() if key not in ("wall", "cpu", "calls")
+            )
+            lines.append("%-20s %10.4f %10.4f %8d  %s" % (name, stage["wall"], stage["cpu"], stage["calls"], counts))
+        return "\n".join(lines)
+
+@contextmanager
+def profile_to(output_path=None):
+    """Profiles everything inside it and saves the result to output_path. Does nothing if output_path is None
+
+    .html and .txt paths are profiled with pyinstrument (if it's installed) and saved as its HTML or text report.
+    Anything else is profiled with cProfile and saved as pstats (open with python -m pstats or snakeviz)
+    """
+    if output_path is None:
+        yield
+        return
+    output_folder = os.path.dirname(output_path)
+    if output_folder != "" : os.makedirs(output_folder, exist_ok=True)
+    ext = os.path.splitext(output_path)[1].lower()
+    profiler = None
+    if ext in (".html", ".txt"):
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+        except ImportError:
+            output_path = os.path.splitext(output_path)[0] + ".prof"
+            print ("pyinstrument is not installed, profiling with cProfile to", output_path)
+    if profiler is not None:
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(output_path, "w", encoding="utf-8") as output_file:
+                output_file.write(profiler.output_html() if ext == ".html" else profiler.output_text())
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_path)
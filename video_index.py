@@ -0,0 +1,161 @@
+import os
+import json
+import bisect
+import subprocess
+
+# the index of a video is cached next to it, as the video path + INDEX_EXT
+INDEX_EXT = ".index.json"
+
+class VideoIndex:
+    """Holds the timestamp of every frame of a video (in presentation order) and which frames are keyframes.
+    Built from the packets of the video stream alone (see build_video_index), so nothing gets decoded
+
+    Properties
+    ----------
+    pts : [int, ...]
+        - presentation timestamp of every frame, in time_base units, in presentation order
+    keyframes : [int, ...]
+        - frame numbers (presentation order) of every keyframe, sorted
+    time_base : (int, int)
+        - (numerator, denominator) of the time unit of pts
+
+    Methods
+    --------
+    frame_count
+        - returns the number of frames
+    times
+        - returns the time of every frame in secs, from the first one
+    duration
+        - returns how long the video plays in secs
+    segments
+        - splits the frames into ranges that start on keyframes
+    keyframe_before
+        - returns the last keyframe at or before a frame
+    """
+    def __init__(self, pts, keyframes, time_base):
+        self.pts = list(pts)
+        self.keyframes = list(keyframes)
+        self.time_base = tuple(time_base)
+
+    def frame_count(self):
+        return len(self.pts)
+
+    def times(self):
+        numerator, denominator = self.time_base
+        return [(pts - self.pts[0]) * numerator / denominator for pts in self.pts]
+
+    def duration(self):
+        """Time from the first frame to the end of the last one. Frames don't all last as long in variable frame rate videos,
+        so the last one is given the average duration"""
+        numerator, denominator = self.time_base
+        span = (self.pts[-1] - self.pts[0]) * numerator / denominator
+        if len(self.pts) < 2:
+            return span
+        return span * len(self.pts) / (len(self.pts) - 1)
+
+    def segments(self, min_frames=1):
+        """Splits every frame into consecutive (start, end) ranges (end exclusive) that each start on a keyframe,
+        so a decoder can seek to the start of any of them without decoding anything before it.
+        Neighbouring GOPs are merged until a range has at least min_frames frames. Together the ranges cover
+        every frame exactly once"""
+        starts = [frame for frame in self.keyframes if 0 < frame < len(self.pts)]
+        segments = []
+        start = 0
+        for keyframe in starts + [len(self.pts)]:
+            if keyframe - start >= min_frames or keyframe == len(self.pts):
+                if keyframe > start:
+                    segments.append((start, keyframe))
+                start = keyframe
+        return segments
+
+    def keyframe_before(self, frame_number):
+        position = bisect.bisect_right(self.keyframes, frame_number)
+        return self.keyframes[position - 1] if position > 0 else 0
+
+    def as_dict(self):
+        return {"pts": self.pts, "keyframes": self.keyframes, "time_base": list(self.time_base)}
+
+def _ffmpeg_exe():
+    # imageio-ffmpeg ships its own ffmpeg, which is also what encodes our videos
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def build_video_index(video_path):
+    """Returns the VideoIndex of the first video stream of a file, or None if it couldn't be read.
+    Only packets are read (ffmpeg stream copy into framecrc), which takes a fraction of the time decoding would"""
+    try:
+        result = subprocess.run(
+            [_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-i", video_path,
+            "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+        )
+    except (ImportError, OSError, subprocess.CalledProcessError):
+        return None
+    time_base = None
+    packets = []
+    for line in result.stdout.decode("utf-8", "replace").splitlines():
+        if line.startswith("#tb 0:"):
+            numerator, denominator = line.split(":", 1)[1].strip().split("/")
+            time_base = (int(numerator), int(denominator))
+            continue
+        if line.startswith("#") or line.strip() == "":
+            continue
+        # stream, dts, pts, duration, size, crc and then flags, only if they aren't just "keyframe"
+        parts = [part.strip() for part in line.split(",")]
+        dts, pts = int(parts[1]), int(parts[2])
+        flags = 1
+        for part in parts[6:]:
+            if part.startswith("F="):
+                flags = int(part[2:], 16)
+        # discarded packets never become frames
+        if flags & 4:
+            continue
+        # packets without a pts get a huge negative one, their dts is the best we've got
+        if pts < -(1 << 62):
+            pts = dts
+        packets.append((pts, bool(flags & 1)))
+    if time_base is None or len(packets) == 0:
+        return None
+    # packets come in decoding order, frames come out in presentation order
+    packets.sort(key=lambda packet: packet[0])
+    keyframes = [frame for frame, (pts, keyframe) in enumerate(packets) if keyframe]
+    if len(keyframes) == 0 or keyframes[0] != 0:
+        keyframes.insert(0, 0)
+    return VideoIndex([pts for pts, keyframe in packets], keyframes, time_base)
+
+def index_path(video_path):
+    return video_path + INDEX_EXT
+
+def load_video_index(video_path):
+    """Returns the VideoIndex of a video, building it (and caching it next to the video) if there isn't an up to date one.
+    None if the video couldn't be indexed"""
+    path = index_path(video_path)
+    stat = os.stat(video_path)
+    try:
+        with open(path, "r") as index_file:
+            cached = json.load(index_file)
+        if cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+            return VideoIndex(cached["pts"], cached["keyframes"], cached["time_base"])
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build_video_index(video_path)
+    if index is None:
+        return None
+    try:
+        cached = index.as_dict()
+        cached["size"] = stat.st_size
+        cached["mtime"] = stat.st_mtime
+        partial_path = path + ".part"
+        with open(partial_path, "w") as index_file:
+            json.dump(cached, index_file)
+        os.replace(partial_path, path)
+    except OSError:
+        # the video might be somewhere we can't write to, the index still works without a cache
+        pass
+    return index
+
+def remove_video_index(video_path):
+    try:
+        os.remove(index_path(video_path))
+    except FileNotFoundError:
+        pass
@@ -1,16 +1,125 @@
 import redis
-from rq import Worker, Queue, Connection
+from rq import Worker, SimpleWorker, Queue, Connection
 import os
+import signal
 import time
 
-listen = ["default"]
+# queues to take jobs from, most important first. Small jobs come before big ones (see admission.py),
+# and default has whatever was queued without admission control. Workers given only "image" keep small jobs fast
+listen = [name.strip() for name in os.environ.get("WORKER_QUEUES", "image,video,bulk,default").split(",") if name.strip() != ""]
 redis_url = "redis://" + os.environ.get("REDIS_URL") +":6379"
 connection = redis.from_url(redis_url)
 
-def start_worker():
-    worker = Worker(queue_class=Queue, queues=listen)
+def preload(config):
+    """Does everything a job would otherwise do for itself at start up, once:
+    imports cv2, NumPy, PIL and imageio (through jobs and convert), finds ffmpeg,
+    sets up the storage client and builds the glyph atlases of WARM_FONT_SIZES.
+    Jobs run afterwards in this process, or in processes forked from it, get all of it for free
+    """
+    start_time = time.perf_counter()
+    import numpy as np
+    import jobs
+    from convert import convert_image, preload_font, get_font
+    try:
+        import imageio_ffmpeg
+        imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        pass
+    jobs.job_storage(config)
+    if config.RENDERER == "atlas":
+        preload_font(config.FONT_PATH, config.WARM_FONT_SIZES)
+    else:
+        for fontSize in config.WARM_FONT_SIZES:
+            get_font(fontSize, config.FONT_PATH)
+    # run every step of a conversion once, so lazily set up things (like OpenCV's and NumPy's) are ready too
+    convert_image(np.zeros((32, 32, 3), dtype=np.uint8), fontSize=config.WARM_FONT_SIZES[0] if config.WARM_FONT_SIZES else 10,
+                  threads=1, renderer=config.RENDERER, font_path=config.FONT_PATH)
+    print ("- Worker preloaded in %.4f secs" % (time.perf_counter() - start_time))
+
+class ReleasesBacklog:
+    """Takes every job off its queue's backlog once it's done (see admission.release_backlog).
+    RQ ends every job through these two, including work horses that were killed or stopped"""
+    def handle_job_success(self, job, queue, started_job_registry):
+        from admission import release_backlog
+        release_backlog(self.connection, job.id)
+        return super().handle_job_success(job, queue, started_job_registry)
+
+    def handle_job_failure(self, job, queue, started_job_registry=None, exc_string=""):
+        from admission import release_backlog
+        release_backlog(self.connection, job.id)
+        return super().handle_job_failure(job, queue, started_job_registry, exc_string)
+
+class ForkWorker(ReleasesBacklog, Worker):
+    """RQ's own worker, forking a work horse for every job"""
+    pass
+
+class WarmWorker(ReleasesBacklog, SimpleWorker):
+    """RQ worker that runs jobs in its own process instead of forking a work horse for each one,
+    so jobs start with everything preload already did
+
+    Stopping a job (rq's send_stop_job_command) asks the job to stop itself (see jobs.cancel_current_job),
+    since there's no work horse to kill
+    """
+    def kill_horse(self, sig=signal.SIGKILL):
+        import jobs
+        jobs.cancel_current_job()
+
+def start_worker(mode="fork", frame_pool_processes=None):
+    worker_class = WarmWorker if mode == "warm" else ForkWorker
+    if mode == "warm" and frame_pool_processes:
+        # video jobs run in this process too, so they all convert on the same frame pool (see jobs.convert_video_inline).
+        # Its processes can only be used by the process that started them, so every worker starts its own, after it's forked
+        from convert import get_frame_pool
+        get_frame_pool(frame_pool_processes)
+    worker = worker_class(queue_class=Queue, queues=listen)
     worker.work()
 
+def start_workers(count, mode="fork", frame_pool_processes=None):
+    """Forks count workers from this (already preloaded) process and restarts any that die,
+    until this process is told to stop. Forked workers share the preloaded memory (copy on write)"""
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                with Connection(connection):
+                    start_worker(mode, frame_pool_processes)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        # Ctrl+C already reaches every worker on its own, anything else gets passed on
+        if signum != signal.SIGINT:
+            for pid in children:
+                os.kill(pid, signum)
+
+    for i in range(count):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while len(children) > 0:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print ("- Worker", pid, "exited, starting another")
+            spawn()
+
 if __name__ == "__main__":
-    with Connection(connection):
-        start_worker()
\ No newline at end of file
+    from config import Config
+    config = Config()
+    preload(config)
+    if config.WORKER_PROCESSES > 1:
+        start_workers(config.WORKER_PROCESSES, config.WORKER_MODE, config.CONVERT_PROCESSES)
+    else:
+        with Connection(connection):
+            start_worker(config.WORKER_MODE, config.CONVERT_PROCESSES)